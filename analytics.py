@@ -0,0 +1,213 @@
+from collections import Counter
+from datetime import date, datetime
+
+from changes import settled_cursor
+from models import City, Artist, Venue, Show, ShowRollup, RollupState, ChangeLog, db
+from tenancy import unscoped
+
+# ----------------------------------------------------------------------------#
+# Show rollups.
+# ----------------------------------------------------------------------------#
+
+# shows are counted per month for each of these dimensions
+DIMENSIONS = ('venue', 'artist', 'city', 'genre')
+
+ROLLUP_STATE = 'shows'
+
+# venue and artist updates that move their shows between rollup keys or out of them
+COUNTED_ATTRIBUTES = {'deleted_at', 'city_id', 'genres'}
+
+
+def _month(start_time):
+    return date(start_time.year, start_time.month, 1)
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _months(first, last):
+    """ the first day of every month from first to last, inclusive """
+    month, last = _month(first), _month(last)
+    while month <= last:
+        yield month
+        month = _next_month(month)
+
+
+def refresh_rollups(settle_seconds=2, batch_size=5000):
+    """
+    counts again the months touched by the change log rows since the last
+    refresh. a month is recounted from the Show table instead of adjusted,
+    so deleted, purged and moved shows and soft deleted venues and artists
+    drop out of it. the change log is read like the /changes feed, with
+    the same settle_seconds bound (see changes.feed); `--rebuild` recounts
+    everything for whatever outlived it. rollups are kept per tenant, the
+    refresh itself covers all of them. returns the number of months recounted.
+    """
+    with unscoped():
+        state = RollupState.query.get(ROLLUP_STATE)
+        if state is None:
+            return _rebuild(settle_seconds)
+        cursor = settled_cursor(settle_seconds)
+        buckets = _touched_months(state.last_change_id, cursor, batch_size)
+        _recount(buckets)
+        state.last_change_id = cursor
+        state.refreshed_at = datetime.now()
+        db.session.commit()
+        return len(buckets)
+
+
+def _touched_months(after, cursor, batch_size):
+    """ {(tenant id, month)} whose counts the change rows after..cursor may have changed """
+    buckets, show_ids, entity_ids = set(), set(), {'Venue': set(), 'Artist': set()}
+    while after < cursor:
+        rows = db.session.query(
+            ChangeLog.id, ChangeLog.table, ChangeLog.row_id, ChangeLog.operation, ChangeLog.changes,
+            ChangeLog.tenant_id
+        ).filter(
+            ChangeLog.id > after, ChangeLog.id <= cursor, ChangeLog.table.in_(('Show', 'Venue', 'Artist'))
+        ).order_by(ChangeLog.id).limit(batch_size).all()
+        if not rows:
+            break
+        for _, table, row_id, operation, changes, tenant_id in rows:
+            changes = changes or {}
+            if table == 'Show':
+                start_times = changes.get('start_time')
+                for start_time in start_times if isinstance(start_times, list) else [start_times]:
+                    if start_time is not None:
+                        buckets.add((tenant_id, _month(datetime.fromisoformat(start_time))))
+                if operation == 'update' and 'start_time' not in changes:
+                    # e.g. moved to another venue, the show itself tells its month
+                    show_ids.add(row_id)
+            elif operation == 'delete' or (operation == 'update' and COUNTED_ATTRIBUTES & set(changes)):
+                entity_ids[table].add(row_id)
+        after = rows[-1][0]
+
+    if show_ids:
+        buckets |= {
+            (tenant_id, _month(start_time))
+            for tenant_id, start_time in db.session.query(Show.tenant_id, Show.start_time).filter(
+                Show.id.in_(show_ids))
+        }
+    for column, ids in ((Show.venue_id, entity_ids['Venue']), (Show.artist_id, entity_ids['Artist'])):
+        if ids:
+            # every month the venue or artist has shows in
+            for tenant_id, first, last in db.session.query(
+                Show.tenant_id, db.func.min(Show.start_time), db.func.max(Show.start_time)
+            ).filter(column.in_(ids)).group_by(Show.tenant_id):
+                buckets |= {(tenant_id, month) for month in _months(first, last)}
+    return buckets
+
+
+def _recount(buckets):
+    """ replaces the rollup rows of each (tenant id, month), one transaction per month """
+    for tenant_id, month in sorted(buckets):
+        following = _next_month(month)
+        rows = db.session.query(Show.venue_id, Show.artist_id, Venue.city_id, Artist.genres).join(
+            Venue, Show.venue_id == Venue.id
+        ).join(Artist, Show.artist_id == Artist.id).filter(
+            Show.tenant_id == tenant_id,
+            Show.start_time >= datetime(month.year, month.month, 1),
+            Show.start_time < datetime(following.year, following.month, 1),
+            Venue.deleted_at.is_(None),
+            Artist.deleted_at.is_(None)
+        )
+        counts = Counter()
+        for venue_id, artist_id, city_id, genres in rows:
+            counts['venue', str(venue_id)] += 1
+            counts['artist', str(artist_id)] += 1
+            counts['city', str(city_id)] += 1
+            for genre in genres or []:
+                counts['genre', genre] += 1
+
+        rollups = ShowRollup.__table__
+        db.session.execute(rollups.delete().where(
+            (rollups.c.tenant_id == tenant_id) & (rollups.c.month == month)))
+        if counts:
+            db.session.execute(rollups.insert(), [
+                {"tenant_id": tenant_id, "dimension": dimension, "key": key, "month": month,
+                 "show_count": show_count}
+                for (dimension, key), show_count in counts.items()
+            ])
+        db.session.commit()
+
+
+def _rebuild(settle_seconds):
+    # the cursor is read first, so whatever changes during the recount is recounted again later
+    cursor = settled_cursor(settle_seconds)
+    buckets = set()
+    for tenant_id, first, last in db.session.query(
+        Show.tenant_id, db.func.min(Show.start_time), db.func.max(Show.start_time)
+    ).group_by(Show.tenant_id):
+        buckets |= {(tenant_id, month) for month in _months(first, last)}
+    ShowRollup.query.delete()
+    _recount(buckets)
+    state = RollupState.query.get(ROLLUP_STATE) or RollupState(name=ROLLUP_STATE)
+    state.last_change_id = cursor
+    state.refreshed_at = datetime.now()
+    db.session.add(state)
+    db.session.commit()
+    return len(buckets)
+
+
+def rebuild_rollups(settle_seconds=2):
+    """ drops the rollups and recounts every month of every tenant from the Show table """
+    with unscoped():
+        return _rebuild(settle_seconds)
+
+
+def forget_months(before):
+    """ drops the rollups of the months before this one, once their shows are archived """
+    with unscoped():
+        ShowRollup.query.filter(ShowRollup.month < before).delete(synchronize_session=False)
+        db.session.commit()
+
+
+# ----------------------------------------------------------------------------#
+# Reading.
+# ----------------------------------------------------------------------------#
+
+def _labels(dimension, keys):
+    """ display names for rollup keys, genres are their own label """
+    model = {'venue': Venue, 'artist': Artist, 'city': City}.get(dimension)
+    if model is None or not keys:
+        return {key: key for key in keys}
+    ids = [int(key) for key in keys]
+    return {
+        str(entity_id): name
+        for entity_id, name in db.session.query(model.id, model.name).filter(model.id.in_(ids))
+    }
+
+
+def series(dimension, first_month=None, last_month=None, key=None):
+    """ [{"key", "label", "total", "months": {"2020-07": 3, ...}}] sorted by total """
+    query = ShowRollup.query.filter(ShowRollup.dimension == dimension)
+    if first_month:
+        query = query.filter(ShowRollup.month >= first_month)
+    if last_month:
+        query = query.filter(ShowRollup.month <= last_month)
+    if key is not None:
+        query = query.filter(ShowRollup.key == str(key))
+
+    by_key = {}
+    for rollup in query.order_by(ShowRollup.month):
+        entry = by_key.setdefault(rollup.key, {"key": rollup.key, "total": 0, "months": {}})
+        entry["months"][f'{rollup.month:%Y-%m}'] = rollup.show_count
+        entry["total"] += rollup.show_count
+
+    labels = _labels(dimension, list(by_key))
+    for rollup_key, entry in by_key.items():
+        entry["label"] = labels.get(rollup_key, rollup_key)
+    return sorted(by_key.values(), key=lambda entry: entry["total"], reverse=True)
+
+
+def summary(first_month=None, last_month=None, limit=10):
+    """ the top entries of every dimension, as shown on /stats """
+    state = RollupState.query.get(ROLLUP_STATE)
+    return {
+        "refreshed_at": state.refreshed_at if state else None,
+        "dimensions": {
+            dimension: series(dimension, first_month, last_month)[:limit]
+            for dimension in DIMENSIONS
+        }
+    }
@@ -1,18 +1,35 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
-import logging
+import csv
 import os
 import sys
-from logging import Formatter, FileHandler
-
-import babel
-import dateutil.parser
-from flask import render_template, request, flash, redirect, url_for, jsonify, abort
-from sqlalchemy import or_
-
-from forms import *
-from models import State, City, Artist, Venue, Show, app, db
+import time
+from datetime import date, datetime
+
+import click
+from flask import (Blueprint, Flask, Response, render_template, request, flash, redirect, url_for, jsonify,
+                   abort, current_app, send_file, stream_with_context)
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import assets
+import calendars
+import changes
+import embedded
+import homefeed
+import listings
+import ratelimit
+import search_index
+import tenancy
+from models import State, City, Artist, Venue, Show, ShowSeries, db, migrate, moment
+from partitions import month_start, rollover
+from purge import purge_deleted
+from scheduling import parse_start_time, schedule_shows
+from structured_logging import setup_logging
+from tenancy import current_tenant_id
+from unitofwork import error_status, unit_of_work
+from warmup import warm_up
 
 
 # ----------------------------------------------------------------------------#
@@ -20,20 +37,64 @@ from models import State, City, Artist, Venue, Show, app, db
 # ----------------------------------------------------------------------------#
 
 def format_datetime(value, format='medium'):
-    print(value)
+    # babel and dateutil are only needed while rendering, not on every boot
+    import dateutil.parser
+    from babel.dates import format_datetime as babel_format_datetime
+
     date = dateutil.parser.parse(value)
-    print(date)
     if format == 'full':
         format = "EEEE MMMM, d, y 'at' h:mma"
     elif format == 'medium':
         format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+    return babel_format_datetime(date, format)
+
 
+# ----------------------------------------------------------------------------#
+# App Config.
+# ----------------------------------------------------------------------------#
 
-app.jinja_env.filters['datetime'] = format_datetime
+def create_app(config='config'):
+    """
+    builds the application: binds the extensions and registers the routes
+    and commands of the main blueprint. config is a module name or object,
+    so tests and tools can build apps of their own.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+    if app.config.get('PROXY_FIX_X_FOR'):
+        # remote_addr becomes the client address the trusted proxies saw
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    db.init_app(app)
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        embedded.init_app(app)
+    migrate.init_app(app, db)
+    moment.init_app(app)
+    app.jinja_env.filters['datetime'] = format_datetime
+    app.jinja_env.globals['asset_urls'] = assets.asset_urls
+    if not app.debug:
+        setup_logging(app)
+    tenancy.init_app(app)
+    ratelimit.init_app(app)
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        # on postgres every worker's commits notify the streams of all workers,
+        # on sqlite only this process streams, hooked in by the first stream
+        import livefeed
+        livefeed.init_app(app)
+    if app.config.get('PROFILING_ENABLED'):
+        # after the filters are registered, so they can be timed too
+        import profiling
+        profiling.init_app(app)
+    app.register_blueprint(main)
+    return app
 
 
-# check if the city exists, if not it creates it
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+
+
+# check if the city exists, if not it creates it. only flushes, the
+# caller's transaction commits the city together with what refers to it
 def validate_city(city_name, state_name):
     city = City.query.filter_by(name=city_name).first()
     if not city:
@@ -42,53 +103,113 @@ def validate_city(city_name, state_name):
             state = State(name=state_name)
         city = City(name=city_name, state=state)
         db.session.add(city)
-        db.session.commit()
+        db.session.flush()
     return city
 
 
+# the id of the city with that name, without creating it
+def existing_city_id(city_name):
+    return db.session.query(City.id).filter_by(name=city_name).limit(1).scalar()
+
+
+# flashes why a create/update failed and returns the 4xx status for it,
+# anything unexpected is raised again for the 500 handler
+def write_failed(error, what):
+    mapped = error_status(error)
+    if mapped is None:
+        raise error
+    status, reason = mapped
+    flash(f'{what} could not be saved, {reason}.')
+    return status
+
+
+# assigns only the values that differ so the update writes the changed columns only
+def update_changed(entity, values):
+    changed = {}
+    for field, value in values.items():
+        if getattr(entity, field) != value:
+            changed[field] = value
+            setattr(entity, field, value)
+    return changed
+
+
+# the entity was saved by someone else since the form was loaded: answer 409
+# with the fields where the stored value differs from the submitted one
+def edit_conflict(entity, values, edit_view):
+    conflicts = {
+        field: {'current': getattr(entity, field), 'submitted': value}
+        for field, value in values.items() if getattr(entity, field) != value
+    }
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            'success': False,
+            'version': entity.version,
+            'conflicts': conflicts
+        }), 409
+    flash('This was changed by someone else while you were editing, nothing was saved. '
+          'Fields that differ from your version: ' + (', '.join(conflicts) or 'none'))
+    # the form is shown again with the current values and version
+    return edit_view(entity.id), 409
+
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
-@app.route('/')
+# routes and commands, registered on the app by create_app()
+main = Blueprint('main', __name__, cli_group=None)
+
+@main.route('/')
 def index():
-    last_added_artists = Artist.query.order_by(Artist.id.desc()).limit(10)
-    last_added_venues = Venue.query.order_by(Venue.id.desc()).limit(10)
+    # served from the in-memory snapshot, see homefeed.py
+    feed = homefeed.snapshot().sections
     return render_template('pages/home.html',
-                           artists=last_added_artists,
-                           venues=last_added_venues)
+                           artists=feed['artists'][:10],
+                           venues=feed['venues'][:10],
+                           shows=feed['shows'][:10])
+
+
+@main.route('/api/home/<section>')
+def home_feed(section):
+    # infinite scroll of the home page lists: ?page=2&per_page=10
+    if section not in homefeed.SECTIONS:
+        abort(404)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 10, type=int), 1), 50)
+    data, has_more = homefeed.page(section, page, per_page)
+    if section == 'artists':
+        data = [dict(artist, image_link=url_for('.entity_image', kind='artist', entity_id=artist['id'],
+                                                 size='thumb')) for artist in data]
+    if section == 'shows':
+        data = [dict(show, start_time=show['start_time'].isoformat(),
+                     artist_image_link=url_for('.entity_image', kind='artist', entity_id=show['artist_id'],
+                                               size='thumb')) for show in data]
+    return jsonify({'data': data, 'page': page, 'has_more': has_more})
 
 
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@main.route('/venues')
 def venues():
     # TODO: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
-    cities = City.query.all()
-    data = [city.get_venues() for city in cities]
+    # served from the per worker read model, see listings.py
+    data = listings.current().areas()
 
-    return render_template('pages/venues.html', areas=data);
+    return render_template('pages/venues.html', areas=data)
 
 
-@app.route('/venues/search', methods=['POST'])
+@main.route('/venues/search', methods=['POST'])
 def search_venues():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
 
-    # query to search for a venue either by name, city, or state
+    # search for a venue either by name, city, or state
     search_input = request.form['search_term']
-    venues_found = db.session.query(Venue).join(City, State).filter(
-        or_(
-            Venue.name.ilike(f'%{search_input}%'),
-            City.name.ilike(f'%{search_input}%'),
-            State.name.ilike(f'%{search_input}%')
-        )).all()
-    venues_list = []
-    for venue in venues_found:
-        venues_list.append(venue.serialize())
+    listing = listings.current()
+    venues_list = listing.search(listing.venues, search_input)
     response = {
         "count": len(venues_list),
         "data": venues_list
@@ -98,11 +219,11 @@ def search_venues():
                            search_term=request.form.get('search_term', ''))
 
 
-@app.route('/venues/<int:venue_id>')
+@main.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
     # TODO: replace with real venue data from the venues table, using venue_id
-    venue = Venue.query.get(venue_id)
+    venue = Venue.get_active_or_404(venue_id)
     data = venue.serialize_details()
     return render_template('pages/show_venue.html', venue=data)
 
@@ -110,62 +231,58 @@ def show_venue(venue_id):
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
+    from forms import VenueForm
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
     # TODO: insert form data as a new Venue record in the db, instead
     # TODO: modify data to be the data object returned from db insertion
     try:
-        # get city id if exists, or create it if it doesn't exist
-        city = validate_city(request.form['city'], request.form['state'])
-        # create new venue
-
-        new_venue = Venue(
-            name=request.form['name'],
-            genres=request.form.getlist('genres'),
-            city_id=city.id,
-            address=request.form['address'],
-            phone=request.form['phone'],
-            image_link=request.form['image_link'],
-            facebook_link=request.form['facebook_link'],
-            # convert 'yes/no' form input to boolean True/False
-            seeking_talent=request.form['seeking_talent'] == 'Yes',
-            seeking_description=request.form['seeking_description']
-        )
-
-        db.session.add(new_venue)
-        db.session.commit()
+        # the city and the venue are committed together, or not at all
+        with unit_of_work():
+            # get city id if exists, or create it if it doesn't exist
+            city = validate_city(request.form['city'], request.form['state'])
+            # create new venue
+            new_venue = Venue(
+                name=request.form['name'],
+                genres=request.form.getlist('genres'),
+                city_id=city.id,
+                address=request.form['address'],
+                phone=request.form['phone'],
+                image_link=request.form['image_link'],
+                facebook_link=request.form['facebook_link'],
+                # convert 'yes/no' form input to boolean True/False
+                seeking_talent=request.form['seeking_talent'] == 'Yes',
+                seeking_description=request.form['seeking_description']
+            )
+            db.session.add(new_venue)
 
         # on successful db insert, flash success
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
-
-    except:
-        # TODO: on unsuccessful db insert, flash an error instead.
-        db.session.rollback()
-        flash(sys.exc_info())
-        abort(400)
-        # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
-        # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-    finally:
-        db.session.close()
-    return redirect(url_for('index'))
+    except Exception as error:
+        abort(write_failed(error, 'Venue ' + request.form.get('name', '')))
+    return redirect(url_for('.index'))
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE', 'GET'])
+@main.route('/venues/<venue_id>', methods=['DELETE', 'GET'])
 def delete_venue(venue_id):
     # TODO: Complete this endpoint for taking a venue_id, and using
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
 
+    # the venue is only hidden here, its shows are removed later by `flask purge-deleted`
     succeeded = True
     try:
-        venue = Venue.query.filter_by(id=venue_id)
-        venue.delete()
-        db.session.commit()
+        venue = Venue.active().filter_by(id=venue_id).first()
+        if venue is None:
+            succeeded = False
+        else:
+            venue.deleted_at = datetime.now()
+            db.session.commit()
     except:
         succeeded = False
         db.session.rollback()
@@ -182,60 +299,71 @@ def delete_venue(venue_id):
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@main.route('/artists')
 def artists():
     # TODO: replace with real data returned from querying the database
-    all_artists = Artist.query.all()
-    data = [
-        artist.serialize() for artist in all_artists
-    ]
+    data = list(listings.current().artists.values())
 
     return render_template('pages/artists.html', artists=data)
 
 
-@app.route('/artists/search', methods=['POST'])
+@main.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+    # same as venues: hidden now, shows purged in the background
+    succeeded = True
+    try:
+        artist = Artist.active().filter_by(id=artist_id).first()
+        if artist is None:
+            succeeded = False
+        else:
+            artist.deleted_at = datetime.now()
+            db.session.commit()
+    except:
+        succeeded = False
+        db.session.rollback()
+    finally:
+        db.session.close()
+
+    return jsonify({'success': succeeded})
+
+
+@main.route('/artists/search', methods=['POST'])
 def search_artists():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
 
-    # query to search for a venue either by name, city, or state
+    # search for an artist either by name, city, or state
     search_input = request.form['search_term']
-    artists_found = db.session.query(Artist).join(City, State).filter(
-        or_(
-            Artist.name.ilike(f'%{search_input}%'),
-            City.name.ilike(f'%{search_input}%'),
-            State.name.ilike(f'%{search_input}%')
-        )).all()
-    artists_list = []
-    for artist in artists_found:
-        artists_list.append(artist.serialize())
+    listing = listings.current()
+    artists_list = listing.search(listing.artists, search_input)
     response = {
         "count": len(artists_list),
-        "data": artists_found
+        "data": artists_list
     }
 
     return render_template('pages/search_artists.html', results=response,
                            search_term=request.form.get('search_term', ''))
 
 
-@app.route('/artists/<int:artist_id>')
+@main.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
     # shows the venue page with the given venue_id
     # TODO: replace with real venue data from the venues table, using venue_id
-    artist = Artist.query.get(artist_id)
+    artist = Artist.get_active_or_404(artist_id)
     data = artist.serialize_details()
     return render_template('pages/show_artist.html', artist=data)
 
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
+    from forms import ArtistForm
     form = ArtistForm()
 
     # TODO: populate form with fields from artist with ID <artist_id>
-    artist = Artist.query.get(artist_id)
+    artist = Artist.get_active_or_404(artist_id)
     city = City.query.get(artist.city_id)
     form.name.data = artist.name
     form.genres.data = artist.genres
@@ -248,40 +376,51 @@ def edit_artist(artist_id):
     form.available_till.data = artist.available_till
     form.seeking_venue.data = artist.seeking_venue
     form.seeking_description.data = artist.seeking_description
+    form.version.data = artist.version
 
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     # TODO: take values from the form submitted, and update existing
     # artist record with ID <artist_id> using the new attributes
-    artist = Artist.query.get(artist_id)
-    artist.name = request.form['name']
-    city = validate_city(request.form['city'], request.form['state'])
-    artist.city_id = city.id
-    artist.phone = request.form['phone']
-    artist.genres = request.form.getlist('genres')
-    artist.facebook_link = request.form['facebook_link']
-    artist.available_from = request.form['available_from']
-    artist.website = request.form['website']
-    artist.image_link = request.form['image_link']
-    artist.available_till = request.form['available_till']
-
-    # convert 'yes/no' form input to boolean True/False
-    artist.seeking_venue = request.form['seeking_venue'] == 'Yes'
-    artist.seeking_description = request.form['seeking_description']
+    artist = Artist.get_active_or_404(artist_id)
+    values = {
+        'name': request.form['name'],
+        'phone': request.form['phone'],
+        'genres': request.form.getlist('genres'),
+        'facebook_link': request.form['facebook_link'],
+        'available_from': request.form.get('available_from', type=int),
+        'website': request.form['website'],
+        'image_link': request.form['image_link'],
+        'available_till': request.form.get('available_till', type=int),
+        # convert 'yes/no' form input to boolean True/False
+        'seeking_venue': request.form['seeking_venue'] == 'Yes',
+        'seeking_description': request.form['seeking_description'],
+    }
 
-    db.session.commit()
+    if request.form.get('version', type=int) != artist.version:
+        values['city_id'] = existing_city_id(request.form['city'])
+        return edit_conflict(artist, values, edit_artist)
+    values['city_id'] = validate_city(request.form['city'], request.form['state']).id
+    if update_changed(artist, values):
+        try:
+            db.session.commit()
+        except StaleDataError:
+            # someone saved in between the version check and the commit
+            db.session.rollback()
+            return edit_conflict(Artist.query.get(artist_id), values, edit_artist)
 
-    return redirect(url_for('show_artist', artist_id=artist_id))
+    return redirect(url_for('.show_artist', artist_id=artist_id))
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
+    from forms import VenueForm
     form = VenueForm()
     # TODO: populate form with values from venue with ID <venue_id>
-    venue = Venue.query.get(venue_id)
+    venue = Venue.get_active_or_404(venue_id)
     city = City.query.get(venue.city_id)
     form.name.data = venue.name
     form.genres.data = venue.genres
@@ -293,159 +432,495 @@ def edit_venue(venue_id):
     form.address.data = venue.address
     form.seeking_talent.data = venue.seeking_talent
     form.seeking_description.data = venue.seeking_description
+    form.version.data = venue.version
 
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
     # TODO: take values from the form submitted, and update existing
     # venue record with ID <venue_id> using the new attributes
-    venue = Venue.query.get(venue_id)
-    venue.name = request.form['name']
-    city = validate_city(request.form['city'], request.form['state'])
-    venue.city_id = city.id
-    venue.phone = request.form['phone']
-    venue.genres = request.form.getlist('genres')
-    venue.facebook_link = request.form['facebook_link']
-    venue.image_link = request.form['image_link']
-
-    # convert 'yes/no' form input to boolean True/False
-    venue.seeking_talent = request.form['seeking_talent'] == 'Yes'
-    venue.seeking_description = request.form['seeking_description']
+    venue = Venue.get_active_or_404(venue_id)
+    values = {
+        'name': request.form['name'],
+        'phone': request.form['phone'],
+        'genres': request.form.getlist('genres'),
+        'facebook_link': request.form['facebook_link'],
+        'image_link': request.form['image_link'],
+        # convert 'yes/no' form input to boolean True/False
+        'seeking_talent': request.form['seeking_talent'] == 'Yes',
+        'seeking_description': request.form['seeking_description'],
+    }
 
-    db.session.commit()
+    if request.form.get('version', type=int) != venue.version:
+        values['city_id'] = existing_city_id(request.form['city'])
+        return edit_conflict(venue, values, edit_venue)
+    values['city_id'] = validate_city(request.form['city'], request.form['state']).id
+    if update_changed(venue, values):
+        try:
+            db.session.commit()
+        except StaleDataError:
+            # someone saved in between the version check and the commit
+            db.session.rollback()
+            return edit_conflict(Venue.query.get(venue_id), values, edit_venue)
 
-    return redirect(url_for('show_venue', venue_id=venue_id))
+    return redirect(url_for('.show_venue', venue_id=venue_id))
 
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
+    from forms import ArtistForm
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     # called upon submitting the new artist listing form
     # TODO: insert form data as a new Venue record in the db, instead
     # TODO: modify data to be the data object returned from db insertion
     try:
-        city = validate_city(request.form['city'], request.form['state'])
-
-        # create new artist
-        new_artist = Artist(
-            name=request.form['name'],
-            city_id=city.id,
-            phone=request.form['phone'],
-            genres=request.form.getlist('genres'),
-            website=request.form['website'],
-            image_link=request.form['image_link'],
-            facebook_link=request.form['facebook_link'],
-            available_from=request.form['available_from'],
-            available_till=request.form['available_till'],
-            # convert 'yes/no' form input to boolean True/False
-            seeking_venue=request.form['seeking_venue'] == 'Yes',
-            seeking_description=request.form['seeking_description']
-        )
-        db.session.add(new_artist)
-        db.session.commit()
+        # the city and the artist are committed together, or not at all
+        with unit_of_work():
+            city = validate_city(request.form['city'], request.form['state'])
+
+            # create new artist
+            new_artist = Artist(
+                name=request.form['name'],
+                city_id=city.id,
+                phone=request.form['phone'],
+                genres=request.form.getlist('genres'),
+                website=request.form['website'],
+                image_link=request.form['image_link'],
+                facebook_link=request.form['facebook_link'],
+                available_from=request.form['available_from'],
+                available_till=request.form['available_till'],
+                # convert 'yes/no' form input to boolean True/False
+                seeking_venue=request.form['seeking_venue'] == 'Yes',
+                seeking_description=request.form['seeking_description']
+            )
+            db.session.add(new_artist)
         # on successful db insert, flash success
         flash('Artist ' + request.form['name'] + ' was successfully listed!')
-    except:
-        # TODO: on unsuccessful db insert, flash an error instead.
-        # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
-        db.session.rollback()
-        flash(sys.exc_info())
-        abort(400)
-    finally:
-        db.session.close()
+    except Exception as error:
+        abort(write_failed(error, 'Artist ' + request.form.get('name', '')))
 
-    return render_template('pages/home.html')
+    return redirect(url_for('.index'))
 
 
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@main.route('/shows')
 def shows():
     # displays list of shows at /shows
     # TODO: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
-    all_shows = Show.query.all()
+    all_shows = Show.query.join(Venue).join(Artist).filter(
+        Venue.deleted_at.is_(None),
+        Artist.deleted_at.is_(None)
+    ).all()
     data = [
         show.serialize_details() for show in all_shows
     ]
+    # recurring series are expanded only for the upcoming window, never stored
+    now = datetime.now()
+    data += ShowSeries.occurrences_between(now, now + ShowSeries.window())
 
     return render_template('pages/shows.html', shows=data)
 
 
-@app.route('/shows/create')
+@main.route('/shows/stream')
+def shows_stream():
+    # server-sent events for booked and removed shows: ?venue_id=1 or ?artist_id=2
+    import livefeed
+    livefeed.init_app(current_app)
+    livefeed.start_listener(db.engine)
+    subscription = livefeed.Subscription(
+        current_tenant_id(),
+        venue_id=request.args.get('venue_id', type=int),
+        artist_id=request.args.get('artist_id', type=int),
+        queue_size=current_app.config.get('LIVE_QUEUE_SIZE', 100)
+    )
+    # every open stream holds a worker thread, past the limit clients retry later
+    if not livefeed.hub.subscribe(subscription, current_app.config.get('LIVE_MAX_STREAMS')):
+        response = Response('too many live streams\n', status=503, mimetype='text/plain')
+        response.headers['Retry-After'] = '30'
+        return response
+    # the stream reads no database, the session is released when the view returns
+    response = Response(livefeed.stream(subscription, current_app.config.get('LIVE_HEARTBEAT_SECONDS', 15)),
+                        mimetype='text/event-stream')
+    response.call_on_close(lambda: livefeed.hub.unsubscribe(subscription))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@main.route('/shows/create')
 def create_shows():
     # renders form. do not touch.
+    from forms import ShowForm
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
     # TODO: insert form data as a new Show record in the db, instead
+    from forms import ShowForm
+    form = ShowForm()
+    if not form.validate():
+        return render_template('forms/new_show.html', form=form), 400
+
     new_show = Show(
-        start_time=request.form['start_time'],
-        artist_id=request.form['artist_id'],
-        venue_id=request.form['venue_id']
+        start_time=form.start_time.data,
+        artist_id=form.artist_id.data,
+        venue_id=form.venue_id.data
     )
 
     if not new_show.valid_time():
         flash('Sorry, the artist is not available on this time!')
-        return redirect(url_for('create_shows'))
+        return redirect(url_for('.create_shows'))
     else:
         try:
-            db.session.add(new_show)
-            db.session.commit()
+            with unit_of_work():
+                # a repeating show is stored once as a series and expanded when listed
+                frequency = request.form.get('repeat', '')
+                if frequency in ShowSeries.FREQUENCIES:
+                    repeat_until = request.form.get('repeat_until', '').strip()
+                    new_show = ShowSeries(
+                        start_time=new_show.start_time,
+                        artist_id=new_show.artist_id,
+                        venue_id=new_show.venue_id,
+                        frequency=frequency,
+                        until=parse_start_time(repeat_until) if repeat_until else None
+                    )
+                db.session.add(new_show)
             # on successful db insert, flash success
             flash('Show was successfully listed!')
-        except:
-            # TODO: on unsuccessful db insert, flash an error instead.
-            # e.g., flash('An error occurred. Show could not be listed.')
-            # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-            db.session.rollback()
-            flash(sys.exc_info())
-            return redirect(url_for('create_shows'))
-        finally:
-            db.session.close()
+        except Exception as error:
+            write_failed(error, 'Show')
+            return redirect(url_for('.create_shows'))
+
+        return redirect(url_for('.index'))
+
+
+@main.route('/shows/bulk', methods=['POST'])
+def create_shows_bulk():
+    # books many shows at once, e.g. {"shows": [{"artist_id": 1, "venue_id": 2,
+    # "start_time": "2021-05-21 21:30:00"}, ...]}; valid rows are inserted together
+    payload = request.get_json(silent=True) or {}
+    entries = payload.get('shows')
+    if not isinstance(entries, list):
+        abort(400)
+    created, errors = schedule_shows(entries)
+    return jsonify({
+        'success': created > 0,
+        'created': created,
+        'errors': errors
+    }), 201 if created else 400
+
+
+@main.route('/shows/series/<int:series_id>/exceptions', methods=['POST'])
+def create_show_series_exception(series_id):
+    # cancels one occurrence of a series, or moves it when "start_time" is given:
+    # {"occurrence_time": "2021-05-21 21:00:00", "start_time": "2021-05-22 21:00:00"}
+    series = ShowSeries.query.get_or_404(series_id)
+    payload = request.get_json(silent=True) or {}
+    try:
+        occurrence_time = parse_start_time(payload['occurrence_time'])
+        start_time = parse_start_time(payload['start_time']) if payload.get('start_time') else None
+    except (KeyError, ValueError):
+        abort(400)
+    if occurrence_time not in series.occurrences(occurrence_time, occurrence_time):
+        abort(404)
+
+    succeeded = True
+    try:
+        series.materialize(occurrence_time, start_time)
+        db.session.commit()
+    except:
+        succeeded = False
+        db.session.rollback()
+    finally:
+        db.session.close()
+
+    return jsonify({'success': succeeded})
+
+
+#  Autocomplete
+#  ----------------------------------------------------------------
+
+@main.route('/autocomplete')
+def autocomplete():
+    # typeahead for the search boxes: ?q=mus&type=venue,city
+    kinds = set(request.args['type'].split(',')) if request.args.get('type') else None
+    matches = search_index.autocomplete(request.args.get('q', ''),
+                     limit=min(request.args.get('limit', 10, type=int), 50),
+                     kinds=kinds,
+                     max_age=current_app.config.get('AUTOCOMPLETE_MAX_AGE'))
+    return jsonify({'data': matches})
+
+
+#  Change feed
+#  ----------------------------------------------------------------
+
+@main.route('/changes')
+def changes_feed():
+    # tail of the change log for caches and indexes: ?after=<cursor>&table=Venue,Show
+    tables = request.args['table'].split(',') if request.args.get('table') else None
+    data, cursor = changes.feed(after=request.args.get('after', 0, type=int),
+                                limit=min(request.args.get('limit', 100, type=int), 1000),
+                                tables=tables)
+    return jsonify({'data': data, 'cursor': cursor})
+
+
+#  Stats
+#  ----------------------------------------------------------------
+
+def stats_month_range():
+    # ?from=2020-01&to=2020-12, both optional
+    try:
+        first_month = datetime.strptime(request.args['from'], '%Y-%m').date() if 'from' in request.args else None
+        last_month = datetime.strptime(request.args['to'], '%Y-%m').date() if 'to' in request.args else None
+    except ValueError:
+        abort(400)
+    return first_month, last_month
+
+
+@main.route('/stats')
+def stats():
+    # reads only the rollups, refreshed by `flask analytics-refresh`
+    import analytics
+    first_month, last_month = stats_month_range()
+    data = analytics.summary(first_month, last_month)
+    return render_template('pages/stats.html', stats=data)
+
+
+@main.route('/api/stats/<dimension>')
+def stats_api(dimension):
+    import analytics
+    if dimension not in analytics.DIMENSIONS:
+        abort(404)
+    first_month, last_month = stats_month_range()
+    data = analytics.series(dimension, first_month, last_month, key=request.args.get('key'))
+    return jsonify({'dimension': dimension, 'data': data})
+
+
+@main.route('/static/dist/<path:filename>')
+def dist_asset(filename):
+    # fingerprinted bundles built by `flask assets-build`
+    return assets.send_dist_asset(filename)
+
 
-        return render_template('pages/home.html')
+#  Calendars
+#  ----------------------------------------------------------------
+
+@main.route('/venues/<int:entity_id>/calendar.ics', defaults={'kind': 'venue'})
+@main.route('/artists/<int:entity_id>/calendar.ics', defaults={'kind': 'artist'})
+@main.route('/cities/<int:entity_id>/calendar.ics', defaults={'kind': 'city'})
+def calendar_feed(kind, entity_id):
+    # subscribable schedule; clients polling with If-None-Match only cost the etag queries
+    model = calendars.FEEDS[kind][0]
+    entity = model.query.get_or_404(entity_id) if kind == 'city' else model.get_active_or_404(entity_id)
+    window_start, window_end = calendars.window()
+    etag = calendars.feed_etag(kind, entity, window_start, window_end)
+    max_age = current_app.config.get('CALENDAR_MAX_AGE', 300)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(stream_with_context(calendars.generate(kind, entity, window_start, window_end)),
+                            mimetype='text/calendar')
+        response.headers['Content-Disposition'] = f'inline; filename="{kind}-{entity_id}.ics"'
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response
+
+
+#  Images
+#  ----------------------------------------------------------------
+
+@main.route('/images/<kind>/<int:entity_id>/<size>')
+def entity_image(kind, entity_id, size):
+    # resized copy of a venue/artist image_link, cached on disk
+    import images
+    model = {'venue': Venue, 'artist': Artist}.get(kind)
+    if model is None or size not in images.SIZES:
+        abort(404)
+    image_link = db.session.query(model.image_link).filter(
+        model.id == entity_id, model.deleted_at.is_(None)).scalar()
+    if not image_link:
+        abort(404)
+    try:
+        path, key = images.thumbnail(image_link, size)
+    except Exception as error:
+        if not isinstance(error, images.RecentlyFailed):
+            current_app.logger.exception(f'could not resize {image_link}')
+        # not a redirect to image_link, that would send visitors to any url an editor typed in
+        return send_file(os.path.join(current_app.static_folder, images.PLACEHOLDER),
+                         mimetype='image/svg+xml', cache_timeout=60)
 
+    response = send_file(path, mimetype='image/jpeg', add_etags=False,
+                         cache_timeout=current_app.config.get('IMAGE_CACHE_MAX_AGE', 7 * 24 * 3600))
+    response.set_etag(key)
+    return response.make_conditional(request)
 
-@app.errorhandler(404)
+
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+@main.cli.command('warmup')
+@click.option('--limit', type=int, default=None, help='Number of urls to warm.')
+@click.option('--log', 'log_path', default=None, help='Access log to read the hottest urls from.')
+@click.option('--base-url', default=None,
+              help='Request a running deployment instead of this process; each url reaches one worker.')
+def warmup_command(limit, log_path, base_url):
+    """ times the hottest urls; without --base-url only this process is warmed, workers warm on boot """
+    results, elapsed = warm_up(current_app._get_current_object(), limit=limit, log_path=log_path, base_url=base_url)
+    for url, status, seconds in results:
+        click.echo(f'{status} {seconds * 1000:8.1f}ms {url}')
+    click.echo(f'warmed {len(results)} urls in {elapsed:.2f}s')
+
+
+@main.cli.command('schedule-shows')
+@click.argument('csv_file', type=click.File())
+def schedule_shows_command(csv_file):
+    """ books the shows listed in a csv file with artist_id,venue_id,start_time columns """
+    created, errors = schedule_shows(list(csv.DictReader(csv_file)))
+    for error in errors:
+        # + 2 for the header line and 1-based line numbers
+        click.echo(f'line {error["row"] + 2}: {"; ".join(error["errors"])}', err=True)
+    click.echo(f'created {created} shows, rejected {len(errors)}')
+
+
+@main.cli.command('shows-partitions')
+@click.option('--ahead', type=int, default=3, help='Months of future partitions to keep ready.')
+@click.option('--retain', type=int, default=None, help='Months of past partitions to keep attached.')
+@click.option('--archive-dir', default=None, help='Where detached partitions are written as csv.gz.')
+def shows_partitions_command(ahead, retain, archive_dir):
+    """ creates upcoming Show partitions and archives the old ones, run it monthly """
+    retain_months = retain or current_app.config.get('SHOW_PARTITIONS_RETAIN_MONTHS', 24)
+    created, archived = rollover(
+        months_ahead=ahead,
+        retain_months=retain_months,
+        archive_dir=archive_dir or current_app.config.get('SHOW_PARTITIONS_ARCHIVE_DIR', 'archive')
     )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+    for name in created:
+        click.echo(f'created {name}')
+    for path in archived:
+        click.echo(f'archived {path}')
+    if archived:
+        # their shows are gone from the table, so are their counts
+        import analytics
+        analytics.forget_months(month_start(date.today(), -retain_months))
+
+
+@main.cli.command('analytics-refresh')
+@click.option('--rebuild', is_flag=True, help='Recompute the rollups from scratch.')
+def analytics_refresh_command(rebuild):
+    """ recounts the /stats rollups the latest changes touched, schedule it outside peak hours """
+    import analytics
+    recounted = analytics.rebuild_rollups() if rebuild else analytics.refresh_rollups()
+    click.echo(f'recounted {recounted} months')
+
+
+@main.cli.command('assets-build')
+def assets_build_command():
+    """ bundles, minifies, fingerprints and precompresses the css and js """
+    for bundle, built in assets.build(current_app.static_folder).items():
+        click.echo(f'{bundle} -> static/dist/{built}')
+
+
+@main.cli.command('purge-deleted')
+@click.option('--batch-size', type=int, default=500, help='Shows deleted per transaction.')
+@click.option('--grace-days', type=int, default=None, help='Only purge rows deleted this long ago.')
+@click.option('--archive-dir', default=None, help='Write the purged shows here as ndjson.gz first.')
+def purge_deleted_command(batch_size, grace_days, archive_dir):
+    """ removes soft deleted venues and artists and their shows in small batches """
+    counts = purge_deleted(
+        batch_size=batch_size,
+        grace_days=current_app.config.get('PURGE_GRACE_DAYS', 7) if grace_days is None else grace_days,
+        archive_dir=archive_dir or current_app.config.get('PURGE_ARCHIVE_DIR')
+    )
+    click.echo(f'purged {counts["venues"]} venues, {counts["artists"]} artists, {counts["shows"]} shows')
+
+
+@main.cli.command('seed')
+@click.option('--cities', type=int, default=200)
+@click.option('--venues', type=int, default=2000)
+@click.option('--artists', type=int, default=10000)
+@click.option('--shows', type=int, default=1000000)
+@click.option('--seed', 'seed_value', type=int, default=1, help='Same seed, same data.')
+@click.option('--tenant', default='default', help='Slug of the tenant the rows belong to.')
+@click.option('--today', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Day the show dates are spread around, for reproducible runs.')
+def seed_command(cities, venues, artists, shows, seed_value, tenant, today):
+    """ loads a large synthetic dataset with skewed venues, touring artists and genres """
+    from seed import seed
+    started = time.perf_counter()
+    seed(cities=cities, venues=venues, artists=artists, shows=shows, seed=seed_value, tenant=tenant,
+         today=today, progress=lambda table, count: click.echo(
+             f'{table}: {count} rows ({time.perf_counter() - started:.1f}s)'))
+
+
+@main.cli.command('sqlite-snapshot')
+@click.argument('path')
+@click.option('--batch-size', type=int, default=10000, help='Rows copied per insert.')
+def sqlite_snapshot_command(path, batch_size):
+    """ exports the database into a read optimized sqlite file for edge read nodes """
+    for table, count in embedded.export_snapshot(path, batch_size=batch_size).items():
+        click.echo(f'{table}: {count} rows')
+    click.echo(f'wrote {path}')
+
+
+@main.cli.command('query-plans')
+@click.option('--update', is_flag=True, help='Store the current plans as the new baselines.')
+@click.option('--case', 'only', multiple=True, help='Only check this case, can be repeated.')
+@click.option('--baselines', default=None, help='Baseline file, QUERY_PLAN_BASELINES by default.')
+def query_plans_command(update, only, baselines):
+    """ checks the statements and plans of the watched methods and routes against the baselines """
+    import queryplans
+    path = baselines or queryplans.default_path()
+    dialect = db.engine.dialect.name
+    results = queryplans.run(current_app._get_current_object(), only=set(only) or None)
+    if update:
+        stored = queryplans.load_baselines(path, dialect)
+        stored.update(results)
+        queryplans.save_baselines(path, dialect, stored)
+        click.echo(f'stored {len(results)} {dialect} baselines in {path}')
+        return
+    changed = queryplans.compare(queryplans.load_baselines(path, dialect), results)
+    for name, diff in changed.items():
+        click.echo(f'{name} changed\n{diff}\n', err=True)
+    click.echo(f'{len(results) - len(changed)} of {len(results)} cases match {path}')
+    if changed:
+        sys.exit(1)
+
 
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
 
+# the app gunicorn and `flask` load (FLASK_APP=app)
+app = create_app()
+
 # Default port:
 if __name__ == '__main__':
     app.run()
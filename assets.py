@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from flask import current_app, request, send_from_directory, url_for
+
+# ----------------------------------------------------------------------------#
+# Asset bundles.
+# ----------------------------------------------------------------------------#
+
+# files are relative to static/, bundles are written to static/dist/ so the
+# relative "../fonts/" urls inside the stylesheets keep working
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+        'js/script.js',
+    ],
+    'body.js': [
+        'js/libs/jquery-1.11.1.min.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+        'js/autocomplete.js',
+        'js/live_shows.js',
+    ],
+}
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+
+# precompressed variants, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.S)
+CSS_WHITESPACE = re.compile(r'\s+')
+CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(source):
+    """ drops comments (except /*! licenses */) and whitespace around punctuation """
+    source = CSS_COMMENT.sub('', source)
+    source = CSS_WHITESPACE.sub(' ', source)
+    source = CSS_PUNCTUATION.sub(r'\1', source)
+    return source.replace(';}', '}').strip()
+
+
+def build(static_folder):
+    """
+    concatenates and minifies every bundle, names it after its content hash,
+    writes gzip (and brotli when installed) variants next to it and records
+    the names in dist/manifest.json. returns the manifest.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    os.makedirs(dist, exist_ok=True)
+    manifest = {}
+    for bundle, files in BUNDLES.items():
+        sources = []
+        for name in files:
+            with open(os.path.join(static_folder, name), encoding='utf-8') as source_file:
+                sources.append(source_file.read())
+        stem, extension = os.path.splitext(bundle)
+        if extension == '.css':
+            content = '\n'.join(minify_css(source) for source in sources)
+        else:
+            # the libraries are minified already; the separator keeps
+            # files without a trailing semicolon from running together
+            content = '\n;'.join(sources)
+        data = content.encode('utf-8')
+
+        fingerprinted = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+        path = os.path.join(dist, fingerprinted)
+        with open(path, 'wb') as bundle_file:
+            bundle_file.write(data)
+        with open(path + '.gz', 'wb') as compressed_file:
+            compressed_file.write(gzip.compress(data, compresslevel=9))
+        try:
+            import brotli
+        except ImportError:
+            pass
+        else:
+            with open(path + '.br', 'wb') as compressed_file:
+                compressed_file.write(brotli.compress(data))
+        manifest[bundle] = fingerprinted
+
+    with open(os.path.join(dist, MANIFEST), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return manifest
+
+
+# ----------------------------------------------------------------------------#
+# Serving.
+# ----------------------------------------------------------------------------#
+
+_manifests = {}
+
+
+def load_manifest(static_folder):
+    """ the build manifest, or None when the bundles were not built """
+    if static_folder not in _manifests:
+        try:
+            with open(os.path.join(static_folder, DIST_DIR, MANIFEST)) as manifest_file:
+                _manifests[static_folder] = json.load(manifest_file)
+        except (OSError, ValueError):
+            _manifests[static_folder] = None
+    return _manifests[static_folder]
+
+
+def asset_urls(bundle):
+    """
+    urls to include for a bundle: the fingerprinted build when ASSETS_BUNDLED
+    is on and a build exists, otherwise the individual source files.
+    """
+    manifest = None
+    if current_app.config.get('ASSETS_BUNDLED'):
+        manifest = load_manifest(current_app.static_folder)
+    if manifest and bundle in manifest:
+        return [url_for('main.dist_asset', filename=manifest[bundle])]
+    return [url_for('static', filename=name) for name in BUNDLES[bundle]]
+
+
+def send_dist_asset(filename):
+    """ serves a built file, precompressed when the client accepts it, cached forever """
+    dist = os.path.join(current_app.static_folder, DIST_DIR)
+    accepted = request.headers.get('Accept-Encoding', '')
+    sent_name, encoding = filename, None
+    for candidate, suffix in ENCODINGS:
+        if candidate in accepted and os.path.isfile(os.path.join(dist, filename + suffix)):
+            sent_name, encoding = filename + suffix, candidate
+            break
+
+    response = send_from_directory(dist, sent_name)
+    if encoding:
+        # keep the type of the original file, not application/gzip
+        response.mimetype = 'text/css' if filename.endswith('.css') else 'application/javascript'
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # the name changes whenever the content does
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
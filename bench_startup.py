@@ -0,0 +1,66 @@
+"""
+measures application startup with `python -X importtime`.
+
+    $ python bench_startup.py            # worker boot and cli, 5 runs each
+    $ python bench_startup.py --runs 10 --top 15
+
+worker boot is the import of app.py (what gunicorn/`python app.py` pays),
+cli is `flask db --help` (what every `flask db upgrade` pays before it
+touches the database). run it on two checkouts to compare.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# -X importtime lines look like: "import time:  self [us] | cumulative | imported package"
+IMPORT_TIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+SCENARIOS = {
+    'worker boot': [sys.executable, '-X', 'importtime', '-c', 'import app'],
+    'cli': [sys.executable, '-X', 'importtime', '-m', 'flask', 'db', '--help'],
+}
+
+
+def measure(command):
+    """ runs the command once, returns total import time (us) and per-module cumulative times """
+    env = dict(os.environ, FLASK_APP='app')
+    completed = subprocess.run(command, env=env, capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    modules = {}
+    total = 0
+    for line in completed.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative = int(match.group(2))
+        modules[match.group(4)] = cumulative
+        # top level imports are the ones without indentation
+        if len(match.group(3)) == 1:
+            total += cumulative
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    for name, command in SCENARIOS.items():
+        totals = []
+        modules = {}
+        for _ in range(args.runs):
+            total, modules = measure(command)
+            totals.append(total)
+        print(f'{name}: median {statistics.median(totals) / 1000:.1f}ms '
+              f'(min {min(totals) / 1000:.1f}ms, {args.runs} runs)')
+        slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)
+        for module, cumulative in slowest[:args.top]:
+            print(f'    {cumulative / 1000:8.1f}ms  {module}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from flask import current_app, url_for
+
+from models import City, Artist, Venue, Show, ShowSeries, ShowSeriesException, db
+
+# ----------------------------------------------------------------------------#
+# iCalendar feeds.
+# ----------------------------------------------------------------------------#
+
+# kind -> (model, criteria on the Show/ShowSeries rows of one entity)
+FEEDS = {
+    'venue': (Venue, lambda model, entity_id: model.venue_id == entity_id),
+    'artist': (Artist, lambda model, entity_id: model.artist_id == entity_id),
+    'city': (City, lambda model, entity_id: Venue.city_id == entity_id),
+}
+
+
+def window(today=None):
+    """
+    the feed covers CALENDAR_PAST_DAYS back and CALENDAR_FUTURE_DAYS ahead.
+    it starts at midnight so the feed, and its etag, only move once a day.
+    """
+    today = today or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return (today - timedelta(days=current_app.config.get('CALENDAR_PAST_DAYS', 30)),
+            today + timedelta(days=current_app.config.get('CALENDAR_FUTURE_DAYS', 365)))
+
+
+def _shows(kind, entity_id, window_start, window_end):
+    criterion = FEEDS[kind][1]
+    return db.session.query(Show).join(Venue, Show.venue_id == Venue.id).join(
+        Artist, Show.artist_id == Artist.id
+    ).filter(
+        criterion(Show, entity_id),
+        Show.start_time >= window_start,
+        Show.start_time < window_end,
+        Venue.deleted_at.is_(None),
+        Artist.deleted_at.is_(None)
+    )
+
+
+def _series(kind, entity_id):
+    criterion = FEEDS[kind][1]
+    return db.session.query(ShowSeries).join(Venue, ShowSeries.venue_id == Venue.id).join(
+        Artist, ShowSeries.artist_id == Artist.id
+    ).filter(
+        criterion(ShowSeries, entity_id),
+        Venue.deleted_at.is_(None),
+        Artist.deleted_at.is_(None)
+    )
+
+
+def feed_etag(kind, entity, window_start, window_end):
+    """
+    a fingerprint of everything in the feed, read with two aggregate queries
+    on the same indexed joins as the feed itself: added or removed shows
+    change the count or max id, moved ones the checksum of their start
+    times, renamed venues/artists and edited series bump their version. the
+    entity's own name titles the feed.
+    """
+    # weighted by id, so two shows swapping their times still change it
+    start_times = db.func.sum((Show.id % 1000 + 1) * db.extract('epoch', Show.start_time))
+    shows = _shows(kind, entity.id, window_start, window_end).with_entities(
+        db.func.count(Show.id), db.func.max(Show.id), start_times, db.func.sum(Venue.version + Artist.version)
+    ).one()
+    series = _series(kind, entity.id).outerjoin(ShowSeries.exceptions).with_entities(
+        db.func.count(ShowSeries.id.distinct()), db.func.max(ShowSeries.id),
+        db.func.count(ShowSeriesException.id), db.func.max(ShowSeriesException.id),
+        db.func.sum(Venue.version + Artist.version + ShowSeries.version)
+    ).one()
+    owner = (entity.name, getattr(entity, 'version', None))
+    fingerprint = repr((kind, entity.id, owner, window_start.date(), tuple(shows), tuple(series)))
+    return hashlib.sha1(fingerprint.encode()).hexdigest()
+
+
+def _escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _line(name, value):
+    """ one content line, folded at 75 octets as RFC 5545 asks """
+    line = f'{name}:{value}'.encode('utf-8')
+    parts = []
+    while len(line) > 75:
+        cut = 75 if not parts else 74
+        # never split a multi-byte character
+        while cut and (line[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(line[:cut])
+        line = line[cut:]
+    parts.append(line)
+    return b'\r\n '.join(parts).decode('utf-8') + '\r\n'
+
+
+def _stamp(value):
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def _event(uid, start_time, artist_name, venue_name, location, url, stamp, duration):
+    return ''.join((
+        'BEGIN:VEVENT\r\n',
+        _line('UID', uid),
+        _line('DTSTAMP', stamp),
+        _line('DTSTART', _stamp(start_time)),
+        _line('DURATION', duration),
+        _line('SUMMARY', _escape(f'{artist_name} at {venue_name}')),
+        _line('LOCATION', _escape(location)),
+        _line('URL', url),
+        'END:VEVENT\r\n',
+    ))
+
+
+def generate(kind, entity, window_start, window_end, batch_size=500):
+    """
+    yields the feed piece by piece: shows are read in batches with
+    yield_per so a long schedule is never held in memory at once.
+    times are floating, like start_time in the database.
+    """
+    host = current_app.config.get('CALENDAR_UID_DOMAIN', 'fyyur')
+    duration = f"PT{current_app.config.get('CALENDAR_EVENT_HOURS', 3)}H"
+    stamp = _stamp(datetime.utcnow()) + 'Z'
+    yield ''.join((
+        'BEGIN:VCALENDAR\r\n',
+        'VERSION:2.0\r\n',
+        'PRODID:-//Fyyur//Shows//EN\r\n',
+        'CALSCALE:GREGORIAN\r\n',
+        _line('X-WR-CALNAME', _escape(f'{entity.name} shows on Fyyur')),
+    ))
+
+    rows = _shows(kind, entity.id, window_start, window_end).with_entities(
+        Show.id, Show.start_time, Venue.id, Venue.name, Venue.address, Artist.name
+    ).order_by(Show.start_time).yield_per(batch_size)
+    chunk = []
+    for show_id, start_time, venue_id, venue_name, address, artist_name in rows:
+        chunk.append(_event(f'show-{show_id}@{host}', start_time, artist_name, venue_name,
+                            f'{venue_name}, {address}', url_for('main.show_venue', venue_id=venue_id, _external=True),
+                            stamp, duration))
+        if len(chunk) >= batch_size:
+            yield ''.join(chunk)
+            chunk = []
+
+    criterion = FEEDS[kind][1](ShowSeries, entity.id)
+    for occurrence in ShowSeries.occurrences_between(window_start, window_end, criterion):
+        chunk.append(_event(
+            f"series-{occurrence['series_id']}-{_stamp(occurrence['start_time'])}@{host}",
+            occurrence['start_time'], occurrence['artist_name'], occurrence['venue_name'],
+            occurrence['venue_name'], url_for('main.show_venue', venue_id=occurrence['venue_id'], _external=True),
+            stamp, duration))
+    chunk.append('END:VCALENDAR\r\n')
+    yield ''.join(chunk)
@@ -0,0 +1,133 @@
+from datetime import date, datetime, timedelta
+
+from flask import has_request_context, request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import State, City, Artist, Venue, Show, ChangeLog, db
+
+# ----------------------------------------------------------------------------#
+# Change capture.
+# ----------------------------------------------------------------------------#
+
+TRACKED = (Venue, Artist, Show, City, State)
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    return value
+
+
+def _actor():
+    if has_request_context():
+        # the proxies' X-Forwarded-For is applied by ProxyFix, see PROXY_FIX_X_FOR
+        return request.remote_addr
+    return 'cli'
+
+
+def _values(instance):
+    mapper = inspect(instance).mapper
+    return {column.key: _json_value(getattr(instance, column.key)) for column in mapper.column_attrs}
+
+
+def _updated_values(instance):
+    """ {attribute: [old, new]} for the attributes changed in this flush """
+    state = inspect(instance)
+    changed = {}
+    for attribute in state.mapper.column_attrs:
+        history = state.attrs[attribute.key].history
+        if history.has_changes():
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+            changed[attribute.key] = [_json_value(old), _json_value(new)]
+    return changed
+
+
+def entry(instance, operation, changes, actor):
+    return {
+        "table": instance.__tablename__,
+        "row_id": instance.id,
+        "operation": operation,
+        "changes": changes,
+        "actor": actor,
+        "created_at": datetime.now(),
+        "tenant_id": getattr(instance, 'tenant_id', None),
+    }
+
+
+def record(session, rows):
+    """ writes change rows with one executemany, inside the same transaction as the change """
+    if rows:
+        session.connection().execute(ChangeLog.__table__.insert(), rows)
+
+
+@event.listens_for(Session, 'after_flush')
+def capture_flush(session, flush_context):
+    actor = _actor()
+    rows = []
+    for instance in session.new:
+        if isinstance(instance, TRACKED):
+            rows.append(entry(instance, 'insert', _values(instance), actor))
+    for instance in session.dirty:
+        if isinstance(instance, TRACKED) and session.is_modified(instance, include_collections=False):
+            changed = _updated_values(instance)
+            if changed:
+                rows.append(entry(instance, 'update', changed, actor))
+    for instance in session.deleted:
+        if isinstance(instance, TRACKED):
+            rows.append(entry(instance, 'delete', _values(instance), actor))
+    record(session, rows)
+
+
+def record_bulk(session, model, operation, rows_values):
+    """
+    change rows for writes that bypass the unit of work (bulk inserts and
+    deletes); rows_values are dicts that include the row's "id" and "tenant_id"
+    """
+    actor = _actor()
+    record(session, [
+        {
+            "table": model.__tablename__,
+            "row_id": values.get("id"),
+            "operation": operation,
+            "changes": {key: _json_value(value) for key, value in values.items()},
+            "actor": actor,
+            "created_at": datetime.now(),
+            "tenant_id": values.get("tenant_id"),
+        }
+        for values in rows_values
+    ])
+
+
+# ----------------------------------------------------------------------------#
+# Feed.
+# ----------------------------------------------------------------------------#
+
+def settled_cursor(settle_seconds):
+    """ the newest change id older than settle_seconds, see feed() for why the newest are held back """
+    settled = datetime.now() - timedelta(seconds=settle_seconds)
+    return db.session.query(db.func.max(ChangeLog.id)).filter(ChangeLog.created_at <= settled).scalar() or 0
+
+
+def feed(after=0, limit=100, tables=None, settle_seconds=2):
+    """
+    changes with an id greater than the cursor, oldest first, and the next cursor.
+    the newest settle_seconds are held back: ids are taken before commit, so a
+    slow transaction can still add a lower id than one already visible.
+    created_at is the time of the flush, not of the commit, so this only
+    covers transactions that commit within settle_seconds of flushing their
+    changes; one held open longer (e.g. a stalled bulk job) can commit below
+    a cursor that already passed and its rows are missed. unit_of_work()
+    and the cli jobs commit right after their flush, keep it that way.
+    """
+    query = ChangeLog.query.filter(
+        ChangeLog.id > after,
+        ChangeLog.created_at <= datetime.now() - timedelta(seconds=settle_seconds)
+    )
+    if tables:
+        query = query.filter(ChangeLog.table.in_(tables))
+    changes = query.order_by(ChangeLog.id).limit(limit).all()
+    return [change.serialize() for change in changes], changes[-1].id if changes else after
@@ -0,0 +1,188 @@
+import os
+import sqlite3
+
+from sqlalchemy import DDL, Column, Integer, MetaData, Table, create_engine, event, func, literal, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from models import Show, db
+
+# ----------------------------------------------------------------------------#
+# SQLite mode.
+# ----------------------------------------------------------------------------#
+
+# tables left out of snapshots, edge nodes only read
+SNAPSHOT_SKIP = ('ChangeLog',)
+
+
+def pragmas(read_only=False, cache_mb=64, mmap_mb=256):
+    """ the statements run on every new sqlite connection """
+    statements = [
+        'PRAGMA foreign_keys=ON',
+        'PRAGMA busy_timeout=5000',
+        'PRAGMA temp_store=MEMORY',
+        f'PRAGMA cache_size=-{cache_mb * 1024}',
+        f'PRAGMA mmap_size={mmap_mb * 1024 * 1024}',
+    ]
+    if read_only:
+        # snapshots are shipped in rollback journal mode, a read-only mount cannot hold the wal
+        statements.append('PRAGMA query_only=ON')
+    else:
+        # readers do not block the writer, and a commit only syncs at checkpoints
+        statements += ['PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL']
+    return statements
+
+
+# sqlite cannot autoincrement Show's composite key, ids are allocated from
+# this counter instead. it is kept out of db.metadata, postgres has Show_id_seq
+counters = MetaData()
+show_id_counter = Table(
+    'ShowIdCounter', counters,
+    Column('id', Integer, primary_key=True),
+    Column('next_id', Integer, nullable=False),
+)
+# the primary key includes start_time, this keeps the ids themselves unique
+SHOW_ID_INDEX = DDL('CREATE UNIQUE INDEX IF NOT EXISTS "ux_Show_id" ON "Show" (id)')
+
+# databases whose counter and index exist, checked once per process
+_prepared = set()
+
+
+def prepare_show_ids(connection):
+    """ creates the counter and the unique index, also on files made before they existed """
+    show_id_counter.create(connection, checkfirst=True)
+    connection.execute(SHOW_ID_INDEX)
+
+
+def _create_show_ids(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        prepare_show_ids(connection)
+        _prepared.add(str(connection.engine.url))
+
+
+event.listen(Show.__table__, 'after_create', _create_show_ids)
+
+
+def _next_show_id(session, count):
+    """
+    the first of count new ids for shows, None on the other databases. the
+    counter is updated before anything is read: the update takes sqlite's
+    write lock, so another worker's allocation waits for this transaction
+    to end. ids inserted as they are, e.g. by `flask seed`, are skipped
+    since the counter never falls behind max(id) + 1.
+    """
+    bind = session.get_bind(mapper=Show.__mapper__)
+    if bind.dialect.name != 'sqlite':
+        return None
+    connection = session.connection(mapper=Show.__mapper__)
+    if str(bind.url) not in _prepared:
+        prepare_show_ids(connection)
+        _prepared.add(str(bind.url))
+    after_highest = select([func.coalesce(func.max(Show.__table__.c.id), 0) + 1]).as_scalar()
+    allocated = connection.execute(show_id_counter.update().where(show_id_counter.c.id == 1).values(
+        next_id=func.max(show_id_counter.c.next_id, after_highest) + count))
+    if not allocated.rowcount:
+        connection.execute(show_id_counter.insert().from_select(
+            ['id', 'next_id'], select([literal(1), after_highest + count])))
+    next_id = connection.execute(select([show_id_counter.c.next_id])).scalar()
+    return next_id - count
+
+
+def assign_show_ids(session, flush_context, instances):
+    new_shows = [instance for instance in session.new if isinstance(instance, Show) and instance.id is None]
+    next_id = _next_show_id(session, len(new_shows)) if new_shows else None
+    if next_id is not None:
+        for offset, show in enumerate(new_shows):
+            show.id = next_id + offset
+
+
+def assign_bulk_show_ids(session, rows):
+    """ the same for show dicts about to go through bulk_insert_mappings, which skips before_flush """
+    next_id = _next_show_id(session, len(rows)) if rows else None
+    if next_id is not None:
+        for offset, row in enumerate(rows):
+            row.setdefault('id', next_id + offset)
+
+
+# the statements of the last app set up, one listener however many apps are built
+_pragmas = []
+
+
+def set_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        for statement in _pragmas:
+            cursor.execute(statement)
+        cursor.close()
+
+
+def init_app(app):
+    """
+    tunes the sqlite connections, for local runs, tests and edge read nodes.
+    the migrations are postgres only, create the schema with db.create_all()
+    or ship a file made by `flask sqlite-snapshot`.
+    """
+    _pragmas[:] = pragmas(read_only=app.config.get('SQLITE_READ_ONLY', False),
+                          cache_mb=app.config.get('SQLITE_CACHE_MB', 64),
+                          mmap_mb=app.config.get('SQLITE_MMAP_MB', 256))
+    if not event.contains(Engine, 'connect', set_pragmas):
+        event.listen(Engine, 'connect', set_pragmas)
+    if not event.contains(Session, 'before_flush', assign_show_ids):
+        event.listen(Session, 'before_flush', assign_show_ids)
+
+
+# ----------------------------------------------------------------------------#
+# Snapshots.
+# ----------------------------------------------------------------------------#
+
+def export_snapshot(path, batch_size=10000, skip=SNAPSHOT_SKIP):
+    """
+    copies every table into a new sqlite file laid out for reading: rows
+    are read from one repeatable read transaction so the copy is
+    consistent, indexes are built after the data, then the file is
+    analyzed, vacuumed and moved over path in one rename.
+    returns {table: rows copied}.
+    """
+    tmp_path = f'{path}.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    target = create_engine(f'sqlite:///{tmp_path}')
+    tables = [table for table in db.metadata.sorted_tables if table.name not in skip]
+    copied = {}
+    try:
+        with target.begin() as sqlite_connection:
+            # a half written temporary file is simply thrown away, skip the safety
+            sqlite_connection.execute('PRAGMA journal_mode=OFF')
+            sqlite_connection.execute('PRAGMA synchronous=OFF')
+            sqlite_connection.execute('PRAGMA foreign_keys=OFF')
+            for table in tables:
+                sqlite_connection.execute(CreateTable(table))
+
+            with db.engine.connect() as source:
+                source = source.execution_options(isolation_level='REPEATABLE READ', stream_results=True)
+                with source.begin():
+                    for table in tables:
+                        copied[table.name] = 0
+                        result = source.execute(table.select())
+                        while True:
+                            rows = result.fetchmany(batch_size)
+                            if not rows:
+                                break
+                            sqlite_connection.execute(table.insert(), [dict(row) for row in rows])
+                            copied[table.name] += len(rows)
+
+            for table in tables:
+                for index in table.indexes:
+                    index.create(sqlite_connection)
+            if Show.__table__ in tables:
+                sqlite_connection.execute(SHOW_ID_INDEX)
+            sqlite_connection.execute('ANALYZE')
+
+        with target.connect() as sqlite_connection:
+            sqlite_connection.execute('PRAGMA journal_mode=DELETE')
+            sqlite_connection.execute('VACUUM')
+    finally:
+        target.dispose()
+    os.replace(tmp_path, path)
+    return copied
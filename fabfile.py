@@ -13,6 +13,10 @@ def test():
         abort("Aborted at user request.")
 
 
+def build_assets():
+    local("flask assets-build")
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -44,12 +48,19 @@ def heroku_test():
     )
 
 
+def heroku_warmup():
+    url = local("heroku info -s | grep web_url | cut -d= -f2", capture=True)
+    local("flask warmup --base-url {}".format(url))
+
+
 def deploy():
     pull()
     test()
+    build_assets()
     commit()
     heroku()
     heroku_test()
+    heroku_warmup()
 
 # rollback
 
@@ -1,8 +1,11 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, IntegerField, BooleanField
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, IntegerField, BooleanField, HiddenField
 from wtforms.validators import DataRequired, AnyOf, URL, ValidationError
 
+from scheduling import parse_start_time
+from search_index import labels as lookup_labels
+
 STATES = [
     ('AL', 'AL'),
     ('AK', 'AK'),
@@ -80,6 +83,13 @@ GENRES = [
 ]
 
 
+REPEAT_CHOICES = [
+    ('', 'Does not repeat'),
+    ('DAILY', 'Daily'),
+    ('WEEKLY', 'Weekly'),
+    ('MONTHLY', 'Monthly'),
+]
+
 YES_No_ANSWERS = [
     ('Yes', 'Yes'),
     ('No', 'No')
@@ -89,18 +99,79 @@ def is_valid_phone(form, field):
     if not field.data[:2] == '+1':
         raise ValidationError('Phone number must start with "+1"')
 
-class ShowForm(Form):
-    artist_id = StringField(
-        'artist_id'
+class LookupField(SelectField):
+    """
+    id of an existing artist or venue. renders a select holding only the
+    current choice, the page fills it from /autocomplete as the user types
+    """
+
+    def __init__(self, label=None, validators=None, kind=None, **kwargs):
+        render_kw = dict(kwargs.pop('render_kw', None) or {}, **{'data-lookup': kind})
+        super().__init__(label, validators, coerce=int, choices=[], validate_choice=False,
+                         render_kw=render_kw, **kwargs)
+        self.kind = kind
+
+
+class StartTimeField(DateTimeField):
+    """ accepts the formats parse_start_time does, with or without seconds """
+
+    def process_formdata(self, valuelist):
+        if valuelist:
+            try:
+                self.data = parse_start_time(' '.join(valuelist))
+            except ValueError:
+                self.data = None
+                raise ValueError(self.gettext('Not a valid datetime value'))
+
+
+class LookupForm(Form):
+
+    def validate(self):
+        """ the csrf token and field validators, then the lookups """
+        valid = super().validate()
+        return self.validate_lookups() and valid
+
+    def validate_lookups(self):
+        """
+        checks every LookupField at once, one batched lookup per kind, so bad
+        ids are rejected before anything is written
+        """
+        lookups = [field for field in self if isinstance(field, LookupField)]
+        ids = {}
+        for field in lookups:
+            if field.data is not None:
+                ids.setdefault(field.kind, set()).add(field.data)
+        found = {kind: lookup_labels(kind, kind_ids) for kind, kind_ids in ids.items()}
+        for field in lookups:
+            label = found.get(field.kind, {}).get(field.data)
+            if field.data is None:
+                field.errors = [f'Pick an existing {field.kind}']
+            elif label is None:
+                field.errors = [f'There is no {field.kind} with id {field.data}']
+            else:
+                field.errors = []
+                field.choices = [(field.data, label)]
+        return not any(field.errors for field in lookups)
+
+
+class ShowForm(LookupForm):
+    artist_id = LookupField(
+        'artist_id', kind='artist'
     )
-    venue_id = StringField(
-        'venue_id'
+    venue_id = LookupField(
+        'venue_id', kind='venue'
     )
-    start_time = DateTimeField(
+    start_time = StartTimeField(
         'start_time',
         validators=[DataRequired()],
         default=datetime.today()
     )
+    repeat = SelectField(
+        'repeat', choices=REPEAT_CHOICES, default=''
+    )
+    repeat_until = StringField(
+        'repeat_until'
+    )
 
 
 class VenueForm(Form):
@@ -142,6 +213,11 @@ class VenueForm(Form):
         'seeking_description'
     )
 
+    # edits are rejected when the record changed since the form was loaded
+    version = HiddenField(
+        'version'
+    )
+
 
 class ArtistForm(Form):
     name = StringField(
@@ -189,4 +265,9 @@ class ArtistForm(Form):
 
     seeking_description = StringField(
         'seeking_description'
+    )
+
+    # edits are rejected when the record changed since the form was loaded
+    version = HiddenField(
+        'version'
     )
\ No newline at end of file
@@ -0,0 +1,13 @@
+# gunicorn reads this file from the working directory
+from config import WEB_THREADS
+from warmup import warm_worker
+
+# threaded workers: a live stream (/shows/stream) holds one of the threads,
+# config.LIVE_MAX_STREAMS keeps the others free for pages
+worker_class = 'gthread'
+threads = WEB_THREADS
+
+
+def post_worker_init(worker):
+    # every worker has its own caches and pool, it warms them before its first request
+    warm_worker(worker.wsgi)
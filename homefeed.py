@@ -0,0 +1,159 @@
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import City, Artist, Venue, Show, ShowSeries, ChangeLog, db
+from tenancy import current_tenant_id
+
+# ----------------------------------------------------------------------------#
+# Home page feed.
+# ----------------------------------------------------------------------------#
+
+SECTIONS = ('artists', 'venues', 'shows')
+
+
+class Snapshot:
+    """ the newest artists and venues and the next shows of one tenant, as plain dicts """
+
+    def __init__(self, sections, last_change_id):
+        self.sections = sections
+        self.last_change_id = last_change_id
+        self.built_at = time.monotonic()
+        self.checked_at = self.built_at
+        self.stale = False
+
+
+# tenant id -> Snapshot, replaced whole so readers never see a half built one
+snapshots = {}
+lock = threading.Lock()
+
+
+def _artist(artist):
+    return {"id": artist.id, "name": artist.name, "image_link": artist.image_link}
+
+
+def _venue(venue, city_name):
+    return {"id": venue.id, "name": venue.name, "city": city_name}
+
+
+def _recent(model, offset, limit):
+    query = model.active()
+    if model is Venue:
+        # joined before the limit, sqlalchemy refuses to join a limited query
+        query = query.join(City, Venue.city_id == City.id).with_entities(Venue, City.name)
+    rows = query.order_by(model.id.desc()).offset(offset).limit(limit)
+    if model is Venue:
+        return [_venue(venue, city_name) for venue, city_name in rows]
+    return [_artist(artist) for artist in rows]
+
+
+def _upcoming_shows(now, limit):
+    shows = db.session.query(
+        Show.start_time, Venue.id, Venue.name, Artist.id, Artist.name, Artist.image_link
+    ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id).filter(
+        Show.start_time >= now,
+        Venue.deleted_at.is_(None),
+        Artist.deleted_at.is_(None)
+    ).order_by(Show.start_time).limit(limit)
+    upcoming = [
+        {
+            "venue_id": venue_id,
+            "venue_name": venue_name,
+            "artist_id": artist_id,
+            "artist_name": artist_name,
+            "artist_image_link": artist_image_link,
+            "start_time": start_time
+        }
+        for start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link in shows
+    ]
+    upcoming.extend(ShowSeries.occurrences_between(now, now + ShowSeries.window()))
+    return sorted(upcoming, key=lambda show: show['start_time'])[:limit]
+
+
+def _last_change_id():
+    # scoped to the tenant like any other query, ix_ChangeLog_tenant_id answers it
+    return db.session.query(db.func.max(ChangeLog.id)).scalar() or 0
+
+
+def build(size):
+    now = datetime.now()
+    return Snapshot({
+        "artists": _recent(Artist, 0, size),
+        "venues": _recent(Venue, 0, size),
+        "shows": _upcoming_shows(now, size),
+    }, _last_change_id())
+
+
+def snapshot():
+    """
+    the current tenant's snapshot, rebuilt when a write of this worker made
+    it stale, when another worker's write shows up in the change log
+    (checked every HOME_FEED_CHECK_SECONDS) or after HOME_FEED_MAX_AGE
+    seconds, so upcoming shows move on with time
+    """
+    config = current_app.config
+    tenant_id = current_tenant_id()
+    current = snapshots.get(tenant_id)
+    now = time.monotonic()
+    if current is not None and not current.stale:
+        if now - current.built_at < config.get('HOME_FEED_MAX_AGE', 300):
+            if now - current.checked_at < config.get('HOME_FEED_CHECK_SECONDS', 5):
+                return current
+            if _last_change_id() == current.last_change_id:
+                current.checked_at = now
+                return current
+    with lock:
+        # another thread may have rebuilt it while this one waited
+        latest = snapshots.get(tenant_id)
+        if latest is not None and latest is not current and not latest.stale:
+            return latest
+        snapshots[tenant_id] = build(config.get('HOME_FEED_SIZE', 50))
+        return snapshots[tenant_id]
+
+
+def page(section, page_number=1, per_page=10):
+    """
+    one page of a section and whether there is more. pages past the
+    snapshot read the database, except shows which end with the snapshot.
+    """
+    items = snapshot().sections[section]
+    start = (page_number - 1) * per_page
+    if start + per_page <= len(items) or section == 'shows':
+        data = items[start:start + per_page]
+        return data, start + per_page < len(items)
+    model = Artist if section == 'artists' else Venue
+    data = _recent(model, start, per_page + 1)
+    return data[:per_page], len(data) > per_page
+
+
+# ----------------------------------------------------------------------------#
+# Invalidation.
+# ----------------------------------------------------------------------------#
+
+PENDING = 'home_feed_tenants'
+FEED_MODELS = (Venue, Artist, Show, ShowSeries)
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_tenants(session, flush_context):
+    tenants = session.info.setdefault(PENDING, set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, FEED_MODELS):
+            tenants.add(instance.tenant_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def mark_stale(session):
+    for tenant_id in session.info.pop(PENDING, ()):
+        current = snapshots.get(tenant_id)
+        if current is not None:
+            current.stale = True
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_tenants(session):
+    session.info.pop(PENDING, None)
@@ -0,0 +1,240 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+from urllib.request import HTTPHandler, HTTPSHandler, ProxyHandler, Request, build_opener
+
+from flask import current_app
+
+# ----------------------------------------------------------------------------#
+# Image thumbnails.
+# ----------------------------------------------------------------------------#
+
+# name: (max width, max height); images are shrunk to fit, never enlarged
+SIZES = {
+    'thumb': (240, 240),
+    'medium': (640, 640),
+}
+
+# served under static/ when an image cannot be fetched or resized
+PLACEHOLDER = 'img/placeholder.svg'
+
+
+def cache_key(url, size):
+    return hashlib.sha256(f'{size}\n{url}'.encode('utf-8')).hexdigest()
+
+
+def cache_path(key):
+    # two levels keep the directories small
+    return os.path.join(current_app.config['IMAGE_CACHE_DIR'], key[:2], key + '.jpg')
+
+
+# ----------------------------------------------------------------------------#
+# Fetching.
+# ----------------------------------------------------------------------------#
+
+def is_public(address):
+    """ False for private, loopback, link-local and other addresses that are not on the internet """
+    ip = ipaddress.ip_address(address.split('%')[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    """
+    socket.create_connection that refuses hosts resolving to an address that
+    is not public. it connects to the address it checked, so the name
+    cannot resolve somewhere else in between.
+    """
+    host, port = address
+    resolved = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for _, _, _, _, sockaddr in resolved:
+        if not is_public(sockaddr[0]):
+            raise ValueError(f'image host {host} resolves to {sockaddr[0]}, which is not public')
+    error = None
+    for family, socktype, proto, _, sockaddr in resolved:
+        sock = socket.socket(family, socktype, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as e:
+            sock.close()
+            error = e
+    raise error or OSError(f'could not resolve {host}')
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPHandler(HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+# no proxies, they would be the host that is checked; redirects go through the same handlers
+opener = build_opener(ProxyHandler({}), PublicHTTPHandler, PublicHTTPSHandler)
+
+
+def fetch_original(url):
+    """
+    downloads the original image, from public addresses only: image_link is
+    user input and must not reach the internal network. with
+    IMAGE_STUB_ORIGIN set (tests, local development) the file with the same
+    name is read from that folder instead.
+    """
+    stub_origin = current_app.config.get('IMAGE_STUB_ORIGIN')
+    if stub_origin:
+        with open(os.path.join(stub_origin, os.path.basename(urlparse(url).path)), 'rb') as stub_file:
+            return stub_file.read()
+    if urlparse(url).scheme not in ('http', 'https'):
+        raise ValueError(f'unsupported image url {url!r}')
+    request = Request(url, headers={'User-Agent': 'fyyur-image-proxy'})
+    with opener.open(request, timeout=current_app.config.get('IMAGE_FETCH_TIMEOUT', 5)) as response:
+        return response.read(current_app.config.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+
+
+def resize(data, size):
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail(SIZES[size])
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=85, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+# ----------------------------------------------------------------------------#
+# Cache.
+# ----------------------------------------------------------------------------#
+
+# this worker's idea of the cache size: counted once, then kept up to date
+# with its own writes and counted again every IMAGE_CACHE_RECOUNT_SECONDS
+# for the files the other workers wrote
+cache_size = {'bytes': None, 'counted_at': 0}
+cache_lock = threading.Lock()
+
+
+def _cache_entries():
+    """ (mtime, size, path) of every cached file """
+    entries = []
+    for directory, _, files in os.walk(current_app.config['IMAGE_CACHE_DIR']):
+        for name in files:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def evict(max_bytes):
+    """
+    deletes the least recently used thumbnails until the cache is down to
+    90% of max_bytes, so the next misses do not evict again right away.
+    returns the size left.
+    """
+    entries = _cache_entries()
+    total = sum(file_size for _, file_size, _ in entries)
+    # mtime is bumped on every hit, so the oldest is the least recently used
+    for _, file_size, path in sorted(entries):
+        if total <= max_bytes * 0.9:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= file_size
+    return total
+
+
+def _added(file_size):
+    """ counts a new file, walking the cache only to recount or when it is full """
+    config = current_app.config
+    max_bytes = config.get('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+    with cache_lock:
+        now = time.monotonic()
+        if cache_size['bytes'] is None or now - cache_size['counted_at'] > config.get(
+                'IMAGE_CACHE_RECOUNT_SECONDS', 300):
+            cache_size['bytes'] = sum(file_size for _, file_size, _ in _cache_entries())
+            cache_size['counted_at'] = now
+        else:
+            cache_size['bytes'] += file_size
+        if cache_size['bytes'] > max_bytes:
+            cache_size['bytes'] = evict(max_bytes)
+            cache_size['counted_at'] = now
+
+
+class RecentlyFailed(Exception):
+    """ the original could not be fetched or resized a moment ago, it is not tried again yet """
+
+
+def _write(path, data):
+    """ writes then renames, so concurrent readers never see half a file """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # a name of its own for every writer, threads of one worker included
+    descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as image_file:
+            image_file.write(data)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def thumbnail(url, size):
+    """
+    path of the resized image for url, creating it on a cache miss.
+    returns (path, key), the key doubles as the etag. a failed fetch or
+    resize leaves an empty marker file, and the url raises RecentlyFailed
+    instead of being fetched again for IMAGE_FAILURE_SECONDS.
+    """
+    key = cache_key(url, size)
+    path = cache_path(key)
+    if os.path.isfile(path):
+        os.utime(path)
+        return path, key
+    failed_path = f'{path}.failed'
+    try:
+        failed_at = os.path.getmtime(failed_path)
+    except FileNotFoundError:
+        failed_at = None
+    if failed_at is not None and time.time() - failed_at < current_app.config.get('IMAGE_FAILURE_SECONDS', 300):
+        raise RecentlyFailed(url)
+
+    try:
+        data = resize(fetch_original(url), size)
+    except Exception:
+        _write(failed_path, b'')
+        raise
+    _write(path, data)
+    _added(len(data))
+    return path, key
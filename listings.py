@@ -0,0 +1,344 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from changes import settled_cursor
+from models import State, City, Artist, Venue, Show, ChangeLog, db
+from tenancy import current_tenant_id
+
+# ----------------------------------------------------------------------------#
+# Read model.
+# ----------------------------------------------------------------------------#
+
+# one tuple per row instead of an orm object and a dict per request;
+# search_name is the lowercased text the search pages match against
+VenueRow = namedtuple('VenueRow', 'id name city_id num_upcoming_shows search_name')
+ArtistRow = namedtuple('ArtistRow', 'id name city_id num_upcoming_shows search_name')
+CityRow = namedtuple('CityRow', 'id name state search_name')
+
+KINDS = ('venue', 'artist', 'city')
+TABLES = ('Venue', 'Artist', 'City', 'State', 'Show')
+
+
+class Listing:
+    """
+    the active venues and artists of one tenant and the cities they are in,
+    as {id: row}. the rows are never changed in place, a refresh makes a
+    new Listing.
+    """
+
+    def __init__(self, venues, artists, cities, cursor, built_at=None):
+        self.venues = venues
+        self.artists = artists
+        self.cities = cities
+        # the change log id up to which the rows are known to be current
+        self.cursor = cursor
+        self.built_at = built_at or time.monotonic()
+        self.checked_at = time.monotonic()
+        self.stale = False
+        self._areas = None
+
+    def areas(self):
+        """ the venues grouped by city, in the shape of pages/venues.html """
+        if self._areas is None:
+            by_city = {}
+            for venue in self.venues.values():
+                by_city.setdefault(venue.city_id, []).append(venue)
+            self._areas = [
+                {"city": city.name, "state": city.state, "venues": by_city.get(city.id, [])}
+                for city in self.cities.values()
+            ]
+        return self._areas
+
+    def search(self, rows, term):
+        """ rows whose name, city or state contains term, case-insensitive like the ilike it replaces """
+        term = term.lower()
+        city_ids = {city.id for city in self.cities.values() if term in city.search_name}
+        return [row for row in rows.values() if term in row.search_name or row.city_id in city_ids]
+
+    def updated(self, fresh, cursor):
+        """ a copy with the rows of fresh {kind: {id: row or None}} replaced or removed """
+        tables = {"venue": dict(self.venues), "artist": dict(self.artists), "city": dict(self.cities)}
+        for kind, rows in fresh.items():
+            for entity_id, row in rows.items():
+                if row is None:
+                    tables[kind].pop(entity_id, None)
+                else:
+                    tables[kind][entity_id] = row
+        return Listing(tables["venue"], tables["artist"], tables["city"], cursor, self.built_at)
+
+
+def _upcoming_counts(model, ids=None):
+    # the shows of a soft deleted artist or venue on the other side are not listed, so not counted
+    column, other, other_column = (
+        (Show.venue_id, Artist, Show.artist_id) if model is Venue else (Show.artist_id, Venue, Show.venue_id))
+    query = db.session.query(column, db.func.count(Show.id)).join(other, other_column == other.id).filter(
+        Show.start_time >= datetime.now(), other.deleted_at.is_(None))
+    if ids is not None:
+        query = query.filter(column.in_(ids))
+    return dict(query.group_by(column))
+
+
+def _entity_rows(model, row_type, ids=None):
+    query = db.session.query(model.id, model.name, model.city_id).filter(model.deleted_at.is_(None))
+    if ids is not None:
+        query = query.filter(model.id.in_(ids))
+    counts = _upcoming_counts(model, ids)
+    return {
+        entity_id: row_type(entity_id, name, city_id, counts.get(entity_id, 0), name.lower())
+        for entity_id, name, city_id in query.order_by(model.id)
+    }
+
+
+def _city_rows(ids=None):
+    query = db.session.query(City.id, City.name, State.name).join(State, City.state_id == State.id)
+    if ids is not None:
+        query = query.filter(City.id.in_(ids))
+    return {
+        city_id: CityRow(city_id, name, state_name, f'{name.lower()}\n{state_name.lower()}')
+        for city_id, name, state_name in query.order_by(City.id)
+    }
+
+
+ROWS = {
+    "venue": lambda ids=None: _entity_rows(Venue, VenueRow, ids),
+    "artist": lambda ids=None: _entity_rows(Artist, ArtistRow, ids),
+    "city": _city_rows,
+}
+
+
+def build(settle_seconds):
+    # the cursor is read first, so whatever changes during the build is read again later
+    cursor = settled_cursor(settle_seconds)
+    return Listing(ROWS["venue"](), ROWS["artist"](), ROWS["city"](), cursor)
+
+
+# ----------------------------------------------------------------------------#
+# Incremental refresh.
+# ----------------------------------------------------------------------------#
+
+def _touch_show(changes, touched, show_ids, row_id):
+    """ a show changes the upcoming count of its venue and artist, before and after an update """
+    found = False
+    for key, kind in (('venue_id', 'venue'), ('artist_id', 'artist')):
+        value = (changes or {}).get(key)
+        for entity_id in value if isinstance(value, list) else [value]:
+            if entity_id is not None:
+                touched[kind].add(entity_id)
+                found = True
+    if not found:
+        # e.g. only start_time was updated, the show itself tells where it is
+        show_ids.add(row_id)
+
+
+def _logged_changes(listing, limit, settle_seconds):
+    """
+    (touched ids by kind, new cursor) from the change log rows after the
+    listing's cursor, or None when there are too many to apply one by one.
+    rows still inside settle_seconds are read again on the next check.
+    """
+    rows = db.session.query(
+        ChangeLog.id, ChangeLog.table, ChangeLog.row_id, ChangeLog.changes, ChangeLog.created_at
+    ).filter(ChangeLog.id > listing.cursor, ChangeLog.table.in_(TABLES)).order_by(ChangeLog.id).limit(limit + 1).all()
+    if len(rows) > limit:
+        return None
+    touched = {kind: set() for kind in KINDS}
+    show_ids = set()
+    cursor, settled = listing.cursor, datetime.now() - timedelta(seconds=settle_seconds)
+    # the cursor only moves over the settled rows at the start
+    advancing = True
+    for change_id, table, row_id, changes, created_at in rows:
+        if table == 'State':
+            # a renamed state relabels all of its cities. State rows have no
+            # tenant and are in every tenant's scope (see tenancy.scope_query)
+            return None
+        if table == 'Show':
+            _touch_show(changes, touched, show_ids, row_id)
+        else:
+            touched[table.lower()].add(row_id)
+        advancing = advancing and created_at <= settled
+        if advancing:
+            cursor = change_id
+    if show_ids:
+        for venue_id, artist_id in db.session.query(Show.venue_id, Show.artist_id).filter(Show.id.in_(show_ids)):
+            touched['venue'].add(venue_id)
+            touched['artist'].add(artist_id)
+    return touched, cursor
+
+
+def _read(touched):
+    """ {kind: {id: row or None}} for the touched ids """
+    fresh = {}
+    for kind in KINDS:
+        ids = touched.get(kind)
+        if ids:
+            rows = ROWS[kind](ids)
+            fresh[kind] = {entity_id: rows.get(entity_id) for entity_id in ids}
+    return fresh
+
+
+def _counterparts(listing, fresh):
+    """
+    a venue or artist that went away or came back changes the upcoming
+    counts on the other side of its shows; returns those ids by kind
+    """
+    touched = {kind: set() for kind in KINDS}
+    for kind, rows, column, other, other_column in (
+            ('venue', listing.venues, Show.venue_id, 'artist', Show.artist_id),
+            ('artist', listing.artists, Show.artist_id, 'venue', Show.venue_id)):
+        flipped = [
+            entity_id for entity_id, row in fresh.get(kind, {}).items() if (row is None) != (entity_id not in rows)
+        ]
+        if flipped:
+            touched[other].update(entity_id for entity_id, in db.session.query(other_column).filter(
+                column.in_(flipped), Show.start_time >= datetime.now()).distinct())
+            touched[other] -= set(fresh.get(other, ()))
+    return touched
+
+
+def refresh(listing, touched, cursor):
+    """ re-reads only the touched rows; ids that no longer come back were deleted """
+    fresh = _read(touched)
+    for kind, rows in _read(_counterparts(listing, fresh)).items():
+        fresh.setdefault(kind, {}).update(rows)
+    return listing.updated(fresh, cursor)
+
+
+# tenant id -> Listing, replaced whole so readers never see a half applied refresh
+listings = {}
+# tenant id -> {kind: ids} committed by this worker and not applied yet
+pending = {}
+lock = threading.Lock()
+# one thread builds or refreshes at a time, the others wait and take its result
+update_lock = threading.Lock()
+
+
+def _take_pending(tenant_id):
+    with lock:
+        return pending.pop(tenant_id, None)
+
+
+def current():
+    """
+    the current tenant's listing. it is built once per worker, then kept
+    current from the ids this worker's commits touched and, every
+    LISTINGS_CHECK_SECONDS, from the change log rows of the other workers.
+    it is rebuilt after LISTINGS_MAX_AGE seconds, as shows move from
+    upcoming to past, or when a change touches too many rows.
+    """
+    config = current_app.config
+    tenant_id = current_tenant_id()
+    max_age = config.get('LISTINGS_MAX_AGE', 600)
+    check_seconds = config.get('LISTINGS_CHECK_SECONDS', 5)
+    listing = listings.get(tenant_id)
+    now = time.monotonic()
+    if (listing is not None and not listing.stale and now - listing.built_at < max_age
+            and now - listing.checked_at < check_seconds and tenant_id not in pending):
+        return listing
+    with update_lock:
+        return _update(tenant_id, max_age, check_seconds)
+
+
+def _update(tenant_id, max_age, check_seconds):
+    config = current_app.config
+    settle_seconds = config.get('LISTINGS_SETTLE_SECONDS', 2)
+    limit = config.get('LISTINGS_REFRESH_LIMIT', 1000)
+    # read again, another thread may have updated it while this one waited
+    listing = listings.get(tenant_id)
+    now = time.monotonic()
+
+    if listing is None or listing.stale or now - listing.built_at >= max_age:
+        _take_pending(tenant_id)
+        listings[tenant_id] = build(settle_seconds)
+        return listings[tenant_id]
+
+    touched = _take_pending(tenant_id) or {kind: set() for kind in KINDS}
+    cursor = listing.cursor
+    if now - listing.checked_at >= check_seconds:
+        logged = _logged_changes(listing, limit, settle_seconds)
+        if logged is None:
+            listings[tenant_id] = build(settle_seconds)
+            return listings[tenant_id]
+        for kind, ids in logged[0].items():
+            touched[kind] |= ids
+        cursor = logged[1]
+        listing.checked_at = now
+    if not any(touched.values()) and cursor == listing.cursor:
+        return listing
+    if sum(len(ids) for ids in touched.values()) > limit:
+        listings[tenant_id] = build(settle_seconds)
+    else:
+        listings[tenant_id] = refresh(listing, touched, cursor)
+        listings[tenant_id].checked_at = listing.checked_at
+    return listings[tenant_id]
+
+
+# ----------------------------------------------------------------------------#
+# Commit events.
+# ----------------------------------------------------------------------------#
+
+PENDING = 'listing_ids'
+
+
+def _previous(instance, key):
+    """ the value of key before this flush, for updates that move a show """
+    history = inspect(instance).attrs[key].history
+    return history.deleted[0] if history.deleted else None
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_ids(session, flush_context):
+    # {tenant id: {kind: ids}}
+    collected = session.info.setdefault(PENDING, {})
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, State):
+            for listing in listings.values():
+                listing.stale = True
+            continue
+        if not isinstance(instance, (Venue, Artist, City, Show)):
+            continue
+        ids = collected.setdefault(instance.tenant_id, {kind: set() for kind in KINDS})
+        if isinstance(instance, Show):
+            for key, kind in (('venue_id', 'venue'), ('artist_id', 'artist')):
+                ids[kind].update(
+                    entity_id for entity_id in (getattr(instance, key), _previous(instance, key))
+                    if entity_id is not None)
+        else:
+            ids[instance.__tablename__.lower()].add(instance.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def queue_ids(session):
+    collected = session.info.pop(PENDING, None) or {}
+    with lock:
+        for tenant_id, ids in collected.items():
+            if tenant_id not in listings:
+                continue
+            queued = pending.setdefault(tenant_id, {kind: set() for kind in KINDS})
+            for kind in KINDS:
+                queued[kind] |= ids[kind]
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_ids(session):
+    session.info.pop(PENDING, None)
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+def bulk_delete(delete_context):
+    if delete_context.mapper.class_ in (Venue, Artist, City, Show):
+        for listing in listings.values():
+            listing.stale = True
+
+
+@event.listens_for(Session, 'after_bulk_update')
+def bulk_update(update_context):
+    # soft deletes may be bulk updates of deleted_at
+    if update_context.mapper.class_ in (Venue, Artist, City, Show):
+        for listing in listings.values():
+            listing.stale = True
@@ -0,0 +1,233 @@
+import json
+import queue
+import select
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.expression import Insert
+
+from models import ChangeLog, db
+
+# ----------------------------------------------------------------------------#
+# Fan-out.
+# ----------------------------------------------------------------------------#
+
+CHANNEL = 'fyyur_shows'
+# events per NOTIFY, well under postgres' 8000 byte payload limit
+NOTIFY_BATCH = 40
+
+
+class Subscription:
+    """ one connected client: a bounded queue and the shows it cares about """
+
+    def __init__(self, tenant_id, venue_id=None, artist_id=None, queue_size=100):
+        self.queue = queue.Queue(queue_size)
+        self.tenant_id = tenant_id
+        self.venue_id = venue_id
+        self.artist_id = artist_id
+        # set when the client fell behind and missed events
+        self.overflowed = False
+
+    def matches(self, show_event):
+        return (show_event['tenant_id'] == self.tenant_id
+                and self.venue_id in (None, show_event['venue_id'])
+                and self.artist_id in (None, show_event['artist_id']))
+
+
+class Hub:
+    """
+    the subscriptions of this worker. a single listener feeds it, whatever
+    the number of clients, and publishing never blocks on a slow client.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+
+    def subscribe(self, subscription, limit=None):
+        """ False when this worker already streams to limit clients """
+        with self.lock:
+            if limit is not None and len(self.subscriptions) >= limit:
+                return False
+            self.subscriptions.add(subscription)
+            return True
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, show_events):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            for show_event in show_events:
+                if subscription.matches(show_event):
+                    try:
+                        subscription.queue.put_nowait(show_event)
+                    except queue.Full:
+                        subscription.overflowed = True
+
+    def reset(self):
+        """ every client may have missed events, e.g. while the listener reconnected """
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.overflowed = True
+            try:
+                # wakes the stream up, a full queue wakes it up anyway
+                subscription.queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+
+hub = Hub()
+
+
+# ----------------------------------------------------------------------------#
+# Sources.
+# ----------------------------------------------------------------------------#
+
+def _show_events(rows):
+    """ show events from change log rows, which every show insert and delete writes """
+    events = []
+    for row in rows:
+        if row['table'] == 'Show' and row['operation'] in ('insert', 'delete'):
+            changes = row['changes'] or {}
+            events.append({
+                "op": row['operation'],
+                "id": row['row_id'],
+                "venue_id": changes.get('venue_id'),
+                "artist_id": changes.get('artist_id'),
+                "start_time": changes.get('start_time'),
+                "tenant_id": row['tenant_id'],
+            })
+    return events
+
+
+def _after_execute(conn, clauseelement, multiparams, params, result):
+    """
+    watches the change log inserts. on postgres the events go out with
+    pg_notify on the same connection, so they are delivered to every
+    worker only if the transaction commits; elsewhere they wait in the
+    connection's info for the commit and are published in this process.
+    """
+    if not isinstance(clauseelement, Insert) or clauseelement.table is not ChangeLog.__table__:
+        return
+    rows = multiparams[0] if multiparams and isinstance(multiparams[0], list) else list(multiparams) or [params]
+    show_events = _show_events(rows)
+    if not show_events:
+        return
+    if conn.dialect.name == 'postgresql':
+        for start in range(0, len(show_events), NOTIFY_BATCH):
+            conn.execute(db.select([db.func.pg_notify(CHANNEL, json.dumps(show_events[start:start + NOTIFY_BATCH]))]))
+    else:
+        conn.info.setdefault('livefeed_events', []).extend(show_events)
+
+
+def _commit(conn):
+    show_events = conn.info.pop('livefeed_events', None)
+    if show_events:
+        hub.publish(show_events)
+
+
+def _rollback(conn):
+    conn.info.pop('livefeed_events', None)
+
+
+class PostgresListener(threading.Thread):
+    """ the one LISTEN connection of this worker, reconnecting with backoff when it drops """
+
+    def __init__(self, engine, poll_seconds=5):
+        super().__init__(name='livefeed-listener', daemon=True)
+        self.engine = engine
+        self.poll_seconds = poll_seconds
+
+    def listen(self):
+        connection = self.engine.raw_connection()
+        # kept for the life of the worker, outside of the pool
+        connection.detach()
+        dbapi_connection = connection.connection
+        dbapi_connection.autocommit = True
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+        return dbapi_connection
+
+    def run(self):
+        backoff = 1
+        connected_before = False
+        while True:
+            dbapi_connection = None
+            try:
+                dbapi_connection = self.listen()
+                backoff = 1
+                if connected_before:
+                    # whatever was notified while the connection was down is lost
+                    hub.reset()
+                connected_before = True
+                while True:
+                    if select.select([dbapi_connection], [], [], self.poll_seconds) == ([], [], []):
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        notify = dbapi_connection.notifies.pop(0)
+                        hub.publish(json.loads(notify.payload))
+            except Exception:
+                if dbapi_connection is not None:
+                    # detached, the pool will not close it
+                    try:
+                        dbapi_connection.close()
+                    except Exception:
+                        pass
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+
+_listener = {'thread': None, 'lock': threading.Lock()}
+
+
+def init_app(app):
+    """ registers the change log hooks, on every engine like the query counter in structured_logging.py """
+    if not event.contains(Engine, 'after_execute', _after_execute):
+        event.listen(Engine, 'after_execute', _after_execute)
+        event.listen(Engine, 'commit', _commit)
+        event.listen(Engine, 'rollback', _rollback)
+
+
+def start_listener(engine):
+    """ started on the first subscription, after the worker has forked """
+    if engine.dialect.name != 'postgresql':
+        return
+    with _listener['lock']:
+        if _listener['thread'] is None:
+            _listener['thread'] = PostgresListener(engine)
+            _listener['thread'].start()
+
+
+# ----------------------------------------------------------------------------#
+# Server-Sent Events.
+# ----------------------------------------------------------------------------#
+
+def stream(subscription, heartbeat_seconds=15):
+    """
+    the text/event-stream body of a subscription already in the hub, the
+    caller unsubscribes it when the response closes: one "show" event per
+    booked or removed show, a comment line as heartbeat. a client that
+    fell behind gets "reset" and is expected to reload the page;
+    EventSource reconnects on its own.
+    """
+    yield 'retry: 5000\n\n'
+    while True:
+        try:
+            show_event = subscription.queue.get(timeout=heartbeat_seconds)
+        except queue.Empty:
+            show_event = None
+        if subscription.overflowed:
+            yield 'event: reset\ndata: {}\n\n'
+            return
+        if show_event is None:
+            yield ': keep-alive\n\n'
+            continue
+        yield f'event: show\ndata: {json.dumps(show_event)}\n\n'
+
@@ -0,0 +1,82 @@
+"""partition Show by start_time
+
+Revision ID: b81d6f4c2e90
+Revises: 5f0c3e9a1b27
+Create Date: 2026-10-19 11:02:15.604117
+
+"""
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81d6f4c2e90'
+down_revision = '5f0c3e9a1b27'
+branch_labels = None
+depends_on = None
+
+# partitions are created up to this many months after the current one,
+# `flask shows-partitions` keeps extending them afterwards
+MONTHS_AHEAD = 3
+
+
+def month_start(day, months=0):
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def upgrade():
+    # a foreign key to a partitioned table has to include the partition key,
+    # the show id of an exception stays a plain column
+    op.drop_constraint('ShowSeriesException_show_id_fkey', 'ShowSeriesException', type_='foreignkey')
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_legacy"')
+    op.execute('ALTER TABLE "Show_legacy" RENAME CONSTRAINT "Show_pkey" TO "Show_legacy_pkey"')
+    op.execute("""
+        CREATE TABLE "Show" (
+            id integer NOT NULL DEFAULT nextval('"Show_id_seq"'::regclass),
+            venue_id integer NOT NULL REFERENCES "Venue" (id),
+            artist_id integer NOT NULL REFERENCES "Artist" (id),
+            start_time timestamp without time zone NOT NULL,
+            PRIMARY KEY (id, start_time)
+        ) PARTITION BY RANGE (start_time)
+    """)
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+
+    first_show = op.get_bind().execute(sa.text('SELECT min(start_time) FROM "Show_legacy"')).scalar()
+    month = month_start(first_show or datetime.now())
+    last_month = month_start(datetime.now(), MONTHS_AHEAD)
+    while month <= last_month:
+        upper = month_start(month, 1)
+        op.execute(f"""
+            CREATE TABLE "Show_p{month:%Y%m}" PARTITION OF "Show"
+            FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')
+        """)
+        month = upper
+
+    op.execute('INSERT INTO "Show" (id, venue_id, artist_id, start_time) '
+               'SELECT id, venue_id, artist_id, start_time FROM "Show_legacy"')
+    op.execute('DROP TABLE "Show_legacy"')
+    # the detail pages filter by venue/artist and a start_time range
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_partitioned"')
+    op.execute("""
+        CREATE TABLE "Show" (
+            id integer NOT NULL DEFAULT nextval('"Show_id_seq"'::regclass),
+            venue_id integer NOT NULL REFERENCES "Venue" (id),
+            artist_id integer NOT NULL REFERENCES "Artist" (id),
+            start_time timestamp without time zone NOT NULL,
+            CONSTRAINT "Show_pkey" PRIMARY KEY (id)
+        )
+    """)
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.execute('INSERT INTO "Show" (id, venue_id, artist_id, start_time) '
+               'SELECT id, venue_id, artist_id, start_time FROM "Show_partitioned"')
+    op.execute('DROP TABLE "Show_partitioned" CASCADE')
+    op.create_foreign_key('ShowSeriesException_show_id_fkey', 'ShowSeriesException', 'Show', ['show_id'], ['id'])
@@ -1,21 +1,39 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from flask import Flask
+from flask import current_app
 from flask_migrate import Migrate
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.declarative import declared_attr
 
 # ----------------------------------------------------------------------------#
-# App Config.
+# Extensions.
 # ----------------------------------------------------------------------------#
 
+# extensions are bound to the app later by create_app() in app.py,
+# so importing the models does not build an application
+moment = Moment()
+db = SQLAlchemy()
+migrate = Migrate()
 
-# TODO: connect to a local postgresql database
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+
+# ----------------------------------------------------------------------------#
+# Types.
+# ----------------------------------------------------------------------------#
+
+class StringList(db.TypeDecorator):
+    """ a list of strings: text[] on postgres, a json array on the other databases """
+    impl = db.JSON
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.ARRAY(db.String()))
+        return dialect.type_descriptor(db.JSON())
+
+
+# sqlite only autoincrements a plain INTEGER primary key
+BigIntegerKey = db.BigInteger().with_variant(db.Integer(), 'sqlite')
 
 
 # ----------------------------------------------------------------------------#
@@ -23,6 +41,41 @@ migrate = Migrate(app, db)
 # ----------------------------------------------------------------------------#
 
 
+class Tenant(db.Model):
+    """ a market (city/region) served from this deployment """
+    __tablename__ = 'Tenant'
+
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(50), nullable=False, unique=True)
+    name = db.Column(db.String(120), nullable=False)
+    # requests for this host name are served for the tenant
+    hostname = db.Column(db.String(255), nullable=True, unique=True)
+
+    def __repr__(self):
+        return f'<Tenant {self.id}, Slug: {self.slug}>'
+
+
+class TenantMixin:
+    """ rows belong to one tenant, tenancy.py scopes every query to the current one """
+
+    @declared_attr
+    def tenant_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('Tenant.id'), nullable=False)
+
+
+class SoftDeleteMixin:
+    """ rows are hidden by setting deleted_at and purged later in batches (purge.py) """
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
+    @classmethod
+    def active(cls):
+        return cls.query.filter(cls.deleted_at.is_(None))
+
+    @classmethod
+    def get_active_or_404(cls, entity_id):
+        return cls.active().filter(cls.id == entity_id).first_or_404()
+
+
 class State(db.Model):
     __tablename__ = 'State'
     id = db.Column(db.Integer, primary_key=True)
@@ -33,8 +86,11 @@ class State(db.Model):
         return f'<State {self.id}, Name: {self.name}>'
 
 
-class City(db.Model):
+class City(TenantMixin, db.Model):
     __tablename__ = 'City'
+    __table_args__ = (
+        db.Index('ix_City_tenant_id_name', 'tenant_id', 'name'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     state_id = db.Column(db.Integer, db.ForeignKey('State.id'), nullable=False)
@@ -43,7 +99,7 @@ class City(db.Model):
         return f'<City {self.id}, Name: {self.name}>'
 
     def get_venues(self):
-        city_venues = Venue.query.filter_by(city_id=self.id).all()
+        city_venues = Venue.active().filter_by(city_id=self.id).all()
 
         return {
             "city": self.name,
@@ -54,22 +110,38 @@ class City(db.Model):
         }
 
 
-class Show(db.Model):
+class Show(TenantMixin, db.Model):
     __tablename__ = 'Show'
-
-    id = db.Column(db.Integer, primary_key=True)
+    # range partitioned by month on start_time (see partitions.py), so the
+    # partition key has to be part of the table's primary key
+    __table_args__ = (
+        db.PrimaryKeyConstraint('id', 'start_time'),
+        db.Index('ix_Show_tenant_id_venue_id_start_time', 'tenant_id', 'venue_id', 'start_time'),
+        db.Index('ix_Show_tenant_id_artist_id_start_time', 'tenant_id', 'artist_id', 'start_time'),
+        db.Index('ix_Show_tenant_id_start_time', 'tenant_id', 'start_time'),
+        {'postgresql_partition_by': 'RANGE (start_time)'},
+    )
+
+    # postgres takes ids from the sequence; sqlite has no sequences and cannot
+    # autoincrement a composite key, embedded.py assigns them there instead
+    id = db.Column(db.Integer, db.Sequence('Show_id_seq'))
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    # ids stay unique on their own, the orm keeps identifying shows by id only
+    __mapper_args__ = {'primary_key': [id]}
 
     def __repr__(self):
         return f'<Show {self.id}, Artist: {self.artist_id}, Venue: {self.venue_id}>'
 
     def valid_time(self):
         """ to check if the artist time accepts the show time """
-        time_hour = int(self.start_time.split(' ')[1][:2])
-        artist = Artist.query.get(self.artist_id)
-        return artist.available_from <= time_hour <= artist.available_till
+        artist = Artist.query.filter(Artist.id == self.artist_id, Artist.deleted_at.is_(None)).first()
+        if artist is None:
+            return False
+        if artist.available_from is None or artist.available_till is None:
+            return True
+        return artist.available_from <= self.start_time.hour <= artist.available_till
 
     def serialize(self):
         artist = Artist.query.get(self.artist_id)
@@ -93,12 +165,118 @@ class Show(db.Model):
         }
 
 
-class Venue(db.Model):
+class ShowSeries(TenantMixin, db.Model):
+    """ a recurring show (e.g. every friday), expanded into occurrences on demand """
+    __tablename__ = 'ShowSeries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False, index=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False, index=True)
+    # time of the first occurrence, later ones keep the same time of day
+    start_time = db.Column(db.DateTime, nullable=False)
+    frequency = db.Column(db.String(10), nullable=False, default='WEEKLY')
+    interval = db.Column(db.Integer, nullable=False, default=1)
+    until = db.Column(db.DateTime, nullable=True)
+    artist = db.relationship('Artist', lazy='joined')
+    venue = db.relationship('Venue', lazy='joined')
+    exceptions = db.relationship('ShowSeriesException', backref='series', lazy=True,
+                                 cascade='all, delete-orphan')
+    # bumped on every update, so the calendar etags notice edited series
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
+
+    FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+
+    def __repr__(self):
+        return f'<ShowSeries {self.id}, Artist: {self.artist_id}, Venue: {self.venue_id}, {self.frequency}>'
+
+    def rule(self):
+        from dateutil import rrule
+        return rrule.rrule(getattr(rrule, self.frequency), dtstart=self.start_time,
+                           interval=self.interval, until=self.until)
+
+    def occurrences(self, window_start, window_end):
+        """ start times inside the window, without cancelled or rescheduled ones """
+        skipped = {exception.occurrence_time for exception in self.exceptions}
+        return [start_time for start_time in self.rule().between(window_start, window_end, inc=True)
+                if start_time not in skipped]
+
+    def serialize_occurrence(self, start_time):
+        return {
+            "series_id": self.id,
+            "venue_id": self.venue_id,
+            "venue_name": self.venue.name,
+            "artist_id": self.artist_id,
+            "artist_name": self.artist.name,
+            "artist_image_link": self.artist.image_link,
+            "start_time": start_time
+        }
+
+    def materialize(self, occurrence_time, start_time=None):
+        """
+        records an exception for one occurrence: it is cancelled, or when a new
+        start_time is given it becomes a regular Show row at that time.
+        the caller commits.
+        """
+        show = None
+        if start_time is not None:
+            show = Show(venue_id=self.venue_id, artist_id=self.artist_id, start_time=start_time)
+            db.session.add(show)
+        exception = ShowSeriesException(series=self, occurrence_time=occurrence_time, show=show)
+        db.session.add(exception)
+        return exception
+
+    @staticmethod
+    def window():
+        return timedelta(days=current_app.config.get('SHOW_SERIES_WINDOW_DAYS', 90))
+
+    @classmethod
+    def occurrences_between(cls, window_start, window_end, *criteria, **filters):
+        """ serialized occurrences of every series matching filters, e.g. venue_id=1 """
+        series_list = cls.query.filter_by(**filters).join(Venue).join(Artist).filter(
+            *criteria,
+            cls.start_time <= window_end,
+            db.or_(cls.until.is_(None), cls.until >= window_start),
+            Venue.deleted_at.is_(None),
+            Artist.deleted_at.is_(None)
+        ).options(db.selectinload(cls.exceptions)).all()
+        occurrences = [
+            series.serialize_occurrence(start_time)
+            for series in series_list
+            for start_time in series.occurrences(window_start, window_end)
+        ]
+        return sorted(occurrences, key=lambda occurrence: occurrence['start_time'])
+
+
+class ShowSeriesException(db.Model):
+    """ an occurrence of a series that was cancelled (no show) or moved to a real show """
+    __tablename__ = 'ShowSeriesException'
+    __table_args__ = (
+        db.UniqueConstraint('series_id', 'occurrence_time'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    series_id = db.Column(db.Integer, db.ForeignKey('ShowSeries.id'), nullable=False)
+    occurrence_time = db.Column(db.DateTime, nullable=False)
+    # no foreign key: Show is partitioned and its primary key includes start_time
+    show_id = db.Column(db.Integer, nullable=True)
+    show = db.relationship('Show', primaryjoin='foreign(ShowSeriesException.show_id) == Show.id')
+
+    def __repr__(self):
+        return f'<ShowSeriesException {self.id}, Series: {self.series_id}, {self.occurrence_time}>'
+
+
+class Venue(TenantMixin, SoftDeleteMixin, db.Model):
     __tablename__ = 'Venue'
+    # listing and search only ever read rows that are not deleted
+    __table_args__ = (
+        db.Index('ix_Venue_active_tenant_id_city_id', 'tenant_id', 'city_id',
+                 postgresql_where=db.text('deleted_at IS NULL'), sqlite_where=db.text('deleted_at IS NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
-    genres = db.Column(db.ARRAY(db.String()), nullable=False)
+    genres = db.Column(StringList, nullable=False)
     city_id = db.Column(db.Integer, db.ForeignKey('City.id'), nullable=False)
     address = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=False)
@@ -108,13 +286,22 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False, server_default="false")
     seeking_description = db.Column(db.String, nullable=True, default='')
     shows = db.relationship('Show', backref='Venue', lazy=True)
+    # bumped on every update, a stale edit fails instead of overwriting
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
     def __repr__(self):
         return f'<Venue {self.id}, Name: {self.name}>'
 
+    def active_shows(self):
+        # shows of soft deleted artists are hidden like the artists themselves;
+        # the artists come with the shows, serialize() finds them in the session
+        return Show.query.join(Artist, Show.artist_id == Artist.id).options(
+            db.contains_eager(Show.artist)).filter(Show.venue_id == self.id, Artist.deleted_at.is_(None))
+
     def num_upcoming_shows(self):
-        result = Show.query.filter(Show.venue_id == self.id).filter(Show.start_time >= datetime.now()).count()
+        result = self.active_shows().filter(Show.start_time >= datetime.now()).count()
         return result
 
     def serialize(self):
@@ -126,14 +313,16 @@ class Venue(db.Model):
 
     def serialize_details(self):
 
-        past_shows = Show.query.filter(Show.start_time < datetime.now(),
-                                       Show.venue_id == self.id).all()
-        upcoming_shows = Show.query.filter(Show.start_time >= datetime.now(),
-                                           Show.venue_id == self.id).all()
-        past_shows_count = Show.query.filter(Show.start_time < datetime.now(),
-                                             Show.venue_id == self.id).count()
-        upcoming_shows_count = Show.query.filter(Show.start_time >= datetime.now(),
-                                                 Show.venue_id == self.id).count()
+        now = datetime.now()
+        past_shows = self.active_shows().filter(Show.start_time < now).all()
+        upcoming_shows = self.active_shows().filter(Show.start_time >= now).all()
+        past_occurrences = ShowSeries.occurrences_between(now - ShowSeries.window(), now,
+                                                          venue_id=self.id)
+        upcoming_occurrences = ShowSeries.occurrences_between(now, now + ShowSeries.window(),
+                                                              venue_id=self.id)
+        # counted from the fetched rows instead of scanning the partitions again
+        past_shows_count = len(past_shows) + len(past_occurrences)
+        upcoming_shows_count = len(upcoming_shows) + len(upcoming_occurrences)
         city = City.query.get(self.city_id)
         return {
             "id": self.id,
@@ -150,21 +339,25 @@ class Venue(db.Model):
             "image_link": self.image_link,
             "past_shows": [
                 show.serialize() for show in past_shows
-            ],
+            ] + past_occurrences,
             "upcoming_shows": [
                 show.serialize() for show in upcoming_shows
-            ],
+            ] + upcoming_occurrences,
             "past_shows_count": past_shows_count,
             "upcoming_shows_count": upcoming_shows_count,
         }
 
 
-class Artist(db.Model):
+class Artist(TenantMixin, SoftDeleteMixin, db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_active_tenant_id_city_id', 'tenant_id', 'city_id',
+                 postgresql_where=db.text('deleted_at IS NULL'), sqlite_where=db.text('deleted_at IS NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
-    genres = db.Column(db.ARRAY(db.String()), nullable=False, default='')
+    genres = db.Column(StringList, nullable=False, default='')
     city_id = db.Column(db.Integer, db.ForeignKey('City.id'), nullable=False)
     phone = db.Column(db.String(120), nullable=False, default='')
     image_link = db.Column(db.String(500), nullable=False, default='')
@@ -175,11 +368,20 @@ class Artist(db.Model):
     available_from = db.Column(db.Integer(), nullable=True, default=0)
     available_till = db.Column(db.Integer(), nullable=True, default=23)
     shows = db.relationship('Show', backref='artist', lazy=True)
+    # bumped on every update, a stale edit fails instead of overwriting
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
     def __repr__(self):
         return f'<Artist {self.id}, Name: {self.name}>'
 
+    def active_shows(self):
+        # shows at soft deleted venues are hidden like the venues themselves;
+        # the venues come with the shows, serialize_details() finds them in the session
+        return Show.query.join(Venue, Show.venue_id == Venue.id).options(
+            db.contains_eager(Show.Venue)).filter(Show.artist_id == self.id, Venue.deleted_at.is_(None))
+
     def serialize(self):
         return {
             "id": self.id,
@@ -188,14 +390,16 @@ class Artist(db.Model):
 
     def serialize_details(self):
 
-        past_shows = Show.query.filter(Show.start_time < datetime.now(),
-                                       Show.artist_id == self.id).all()
-        upcoming_shows = Show.query.filter(Show.start_time >= datetime.now(),
-                                           Show.artist_id == self.id).all()
-        past_shows_count = Show.query.filter(Show.start_time < datetime.now(),
-                                             Show.artist_id == self.id).count()
-        upcoming_shows_count = Show.query.filter(Show.start_time >= datetime.now(),
-                                                 Show.artist_id == self.id).count()
+        now = datetime.now()
+        past_shows = self.active_shows().filter(Show.start_time < now).all()
+        upcoming_shows = self.active_shows().filter(Show.start_time >= now).all()
+        past_occurrences = ShowSeries.occurrences_between(now - ShowSeries.window(), now,
+                                                          artist_id=self.id)
+        upcoming_occurrences = ShowSeries.occurrences_between(now, now + ShowSeries.window(),
+                                                              artist_id=self.id)
+        # counted from the fetched rows instead of scanning the partitions again
+        past_shows_count = len(past_shows) + len(past_occurrences)
+        upcoming_shows_count = len(upcoming_shows) + len(upcoming_occurrences)
         city = City.query.get(self.city_id)
         return {
             "id": self.id,
@@ -212,14 +416,72 @@ class Artist(db.Model):
             "available_from": self.available_from,
             "available_till": self.available_till,
             "past_shows": [
-                show.serialize() for show in past_shows
-            ],
+                show.serialize_details() for show in past_shows
+            ] + past_occurrences,
             "upcoming_shows": [
-                show.serialize() for show in upcoming_shows
-            ],
+                show.serialize_details() for show in upcoming_shows
+            ] + upcoming_occurrences,
             "past_shows_count": past_shows_count,
             "upcoming_shows_count": upcoming_shows_count,
         }
 
 
+
+class ShowRollup(db.Model):
+    """ number of shows per month for one venue, artist, city or genre (see analytics.py) """
+    __tablename__ = 'ShowRollup'
+
+    tenant_id = db.Column(db.Integer, db.ForeignKey('Tenant.id'), primary_key=True)
+    dimension = db.Column(db.String(10), primary_key=True)
+    # the venue/artist/city id, or the genre name
+    key = db.Column(db.String(120), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)
+    show_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ShowRollup {self.dimension} {self.key}, {self.month}: {self.show_count}>'
+
+
+class RollupState(db.Model):
+    """ how far the rollups have read the change log """
+    __tablename__ = 'RollupState'
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_change_id = db.Column(BigIntegerKey, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<RollupState {self.name}, Last Change: {self.last_change_id}>'
+
+
+class ChangeLog(db.Model):
+    """ append-only record of every write to the tracked models (see changes.py) """
+    __tablename__ = 'ChangeLog'
+
+    # also the cursor of the /changes feed
+    id = db.Column(BigIntegerKey, primary_key=True)
+    table = db.Column(db.String(30), nullable=False)
+    row_id = db.Column(db.Integer, nullable=True)
+    operation = db.Column(db.String(10), nullable=False)
+    changes = db.Column(db.JSON, nullable=True)
+    actor = db.Column(db.String(120), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    # null for the shared tables (State), those rows are in every tenant's scope
+    tenant_id = db.Column(db.Integer, nullable=True, index=True)
+
+    def __repr__(self):
+        return f'<ChangeLog {self.id}, {self.operation} {self.table} {self.row_id}>'
+
+    def serialize(self):
+        return {
+            "id": self.id,
+            "table": self.table,
+            "row_id": self.row_id,
+            "operation": self.operation,
+            "changes": self.changes,
+            # actor (the editor's address) stays internal, the feed is public
+            "created_at": self.created_at.isoformat()
+        }
+
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
@@ -0,0 +1,101 @@
+import gzip
+import os
+import re
+from datetime import date
+
+from models import db
+
+# ----------------------------------------------------------------------------#
+# Show partitions.
+# ----------------------------------------------------------------------------#
+
+# "Show" is range partitioned by start_time with one partition per month,
+# named Show_pYYYYMM, plus "Show_default" for anything outside of them.
+PARTITION_NAME = re.compile(r'^Show_p(\d{4})(\d{2})$')
+
+
+def month_start(day, months=0):
+    """ first day of the month that is `months` months after `day` """
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'Show_p{month:%Y%m}'
+
+
+def existing_partitions(connection):
+    """ {first day of month: partition name} for the attached monthly partitions """
+    rows = connection.execute(db.text(
+        """SELECT c.relname FROM pg_inherits i
+           JOIN pg_class c ON c.oid = i.inhrelid
+           WHERE i.inhparent = '"Show"'::regclass"""
+    ))
+    partitions = {}
+    for name, in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def create_partition(connection, month):
+    """
+    creates the partition for a month. rows that already landed in the
+    default partition for that month are moved into it before attaching.
+    """
+    name = partition_name(month)
+    lower, upper = month, month_start(month, 1)
+    connection.execute(db.text(f'CREATE TABLE "{name}" (LIKE "Show" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    connection.execute(db.text(
+        f"""WITH moved AS (
+               DELETE FROM "Show_default"
+               WHERE start_time >= :lower AND start_time < :upper
+               RETURNING *
+           )
+           INSERT INTO "{name}" SELECT * FROM moved"""
+    ), lower=lower, upper=upper)
+    connection.execute(db.text(
+        f"""ALTER TABLE "Show" ATTACH PARTITION "{name}"
+            FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"""
+    ))
+    return name
+
+
+def archive_partition(connection, name, archive_dir):
+    """ detaches a partition, dumps it to a gzipped csv and drops it """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'{name}.csv.gz')
+    connection.execute(db.text(f'ALTER TABLE "Show" DETACH PARTITION "{name}"'))
+    cursor = connection.connection.cursor()
+    with gzip.open(path, 'wt', encoding='utf-8') as archive_file:
+        cursor.copy_expert(f'COPY "{name}" TO STDOUT WITH CSV HEADER', archive_file)
+    connection.execute(db.text(f'DROP TABLE "{name}"'))
+    return path
+
+
+def rollover(months_ahead=3, retain_months=24, archive_dir='archive', today=None):
+    """
+    makes sure partitions exist for the coming months and archives the ones
+    older than retain_months. every partition change runs in its own
+    transaction so a failure leaves the others in place.
+    returns (created partition names, archived file paths).
+    """
+    current_month = month_start(today or date.today())
+    with db.engine.connect() as connection:
+        partitions = existing_partitions(connection)
+
+    created = []
+    for offset in range(months_ahead + 1):
+        month = month_start(current_month, offset)
+        if month not in partitions:
+            with db.engine.begin() as connection:
+                created.append(create_partition(connection, month))
+
+    archived = []
+    oldest_kept = month_start(current_month, -retain_months)
+    for month, name in sorted(partitions.items()):
+        if month < oldest_kept:
+            with db.engine.begin() as connection:
+                archived.append(archive_partition(connection, name, archive_dir))
+    return created, archived
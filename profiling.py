@@ -0,0 +1,288 @@
+import cProfile
+import functools
+import hmac
+import json
+import os
+import time
+import uuid
+
+from flask import g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import City, Artist, Venue, Show, ShowSeries
+
+# ----------------------------------------------------------------------------#
+# Spans.
+# ----------------------------------------------------------------------------#
+
+# model methods timed as "serialize" spans
+SERIALIZERS = (
+    (Venue, ('serialize', 'serialize_details')),
+    (Artist, ('serialize', 'serialize_details')),
+    (Show, ('serialize', 'serialize_details')),
+    (City, ('get_venues',)),
+    (ShowSeries, ('occurrences_between',)),
+)
+
+
+class Span:
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.ms = None
+        self.children = []
+
+    def close(self):
+        self.ms = (time.perf_counter() - self.started) * 1000
+
+    def serialize(self):
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "ms": round(self.ms, 3),
+            "children": [child.serialize() for child in self.children]
+        }
+
+
+class RequestProfile:
+    """ the span tree of one request, and its cProfile when asked for """
+
+    def __init__(self, name, with_cprofile):
+        self.id = uuid.uuid4().hex[:12]
+        self.root = Span(name, 'request')
+        self.stack = [self.root]
+        self.cprofile = cProfile.Profile() if with_cprofile else None
+
+    def open(self, name, kind):
+        span = Span(name, kind)
+        self.stack[-1].children.append(span)
+        self.stack.append(span)
+        return span
+
+    def close(self, span):
+        span.close()
+        # spans left open by an exception inside them are closed with it
+        if span in self.stack:
+            del self.stack[self.stack.index(span):]
+
+    def totals(self):
+        """ time per kind, counting a span only when no ancestor has the same kind """
+        totals = {}
+
+        def walk(span, kinds):
+            if span.kind not in kinds:
+                totals[span.kind] = totals.get(span.kind, 0) + span.ms
+            for child in span.children:
+                walk(child, kinds | {span.kind})
+
+        walk(self.root, frozenset())
+        return totals
+
+    def folded(self):
+        """ collapsed stacks with self time in microseconds, for flamegraph.pl or speedscope """
+        lines = []
+
+        def walk(span, path):
+            path = f'{path};{span.kind}:{span.name}' if path else f'{span.kind}:{span.name}'
+            self_ms = span.ms - sum(child.ms for child in span.children)
+            lines.append(f'{path.replace(" ", "_")} {max(int(self_ms * 1000), 0)}')
+            for child in span.children:
+                walk(child, path)
+
+        walk(self.root, '')
+        return '\n'.join(lines) + '\n'
+
+
+def current():
+    return g.get('profile') if has_request_context() else None
+
+
+class span:
+    """ times a block as a child of the innermost open span, a no-op outside of profiled requests """
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.span = None
+
+    def __enter__(self):
+        profile = current()
+        if profile is not None:
+            self.profile = profile
+            self.span = profile.open(self.name, self.kind)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.span is not None:
+            self.profile.close(self.span)
+
+
+def timed(function, name, kind):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with span(name, kind):
+            return function(*args, **kwargs)
+    # marks methods that are wrapped already, see _instrument_models
+    wrapper._profiled = True
+    return wrapper
+
+
+# ----------------------------------------------------------------------------#
+# Instrumentation.
+# ----------------------------------------------------------------------------#
+
+def _sql_start(conn, cursor, statement, parameters, context, executemany):
+    profile = current()
+    if profile is not None:
+        context._profile_span = profile.open(' '.join(statement.split())[:200], 'sql')
+
+
+def _sql_end(conn, cursor, statement, parameters, context, executemany):
+    profile_span = getattr(context, '_profile_span', None)
+    if profile_span is not None:
+        context._profile_span = None
+        current().close(profile_span)
+
+
+def _sql_error(exception_context):
+    # after_cursor_execute does not run for a statement that raised
+    context = exception_context.execution_context
+    profile_span = getattr(context, '_profile_span', None) if context is not None else None
+    if profile_span is not None and current() is not None:
+        context._profile_span = None
+        current().close(profile_span)
+
+
+def _instrument_models():
+    """ wraps the serializers once, however many apps turn profiling on """
+    for model, methods in SERIALIZERS:
+        for method in methods:
+            raw = model.__dict__[method]
+            if getattr(raw.__func__ if isinstance(raw, classmethod) else raw, '_profiled', False):
+                continue
+            name = f'{model.__name__}.{method}'
+            if isinstance(raw, classmethod):
+                setattr(model, method, classmethod(timed(raw.__func__, name, 'serialize')))
+            else:
+                setattr(model, method, timed(raw, name, 'serialize'))
+
+
+def _instrument_templates(app):
+    """ spans for the render of every template and each of its blocks """
+    environment = app.jinja_env
+
+    def block(name, render_block):
+        def profiled_block(context):
+            with span(f'block {name}', 'template'):
+                yield from render_block(context)
+        return profiled_block
+
+    def instrument(template):
+        if not getattr(template, '_profiled', False):
+            for name, render_block in list(template.blocks.items()):
+                template.blocks[name] = block(name, render_block)
+            template.render = timed(template.render, template.name, 'template')
+            template._profiled = True
+        return template
+
+    # render_template and {% extends %} / {% include %} all load through these
+    for loader_name in ('get_template', 'select_template'):
+        load = getattr(environment, loader_name)
+        setattr(environment, loader_name, functools.wraps(load)(
+            lambda *args, load=load, **kwargs: instrument(load(*args, **kwargs))))
+    for name, jinja_filter in list(environment.filters.items()):
+        if name in app.config.get('PROFILING_FILTERS', ('datetime',)):
+            environment.filters[name] = timed(jinja_filter, f'|{name}', 'filter')
+
+
+def _wanted(app):
+    """ None, 'headers' or 'json' depending on ?profile= / X-Profile and the token """
+    value = request.args.get('profile') or request.headers.get('X-Profile')
+    if not value:
+        return None
+    given = request.headers.get('X-Profile-Token', request.args.get('profile_token')) or ''
+    if not hmac.compare_digest(given.encode('utf-8'), app.config['PROFILING_TOKEN'].encode('utf-8')):
+        return None
+    return 'json' if value == 'json' else 'headers'
+
+
+def prune(directory, keep):
+    """ deletes the files of all but the newest keep profiles """
+    by_id = {}
+    for entry in os.scandir(directory):
+        profile_id, extension = os.path.splitext(entry.name)
+        if extension in ('.json', '.folded', '.prof'):
+            by_id.setdefault(profile_id, []).append(entry)
+    newest_first = sorted(by_id.values(), key=lambda entries: max(e.stat().st_mtime for e in entries),
+                          reverse=True)
+    for entries in newest_first[keep:]:
+        for entry in entries:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def init_app(app):
+    """
+    opt-in profiling, only wired in when PROFILING_ENABLED is set. a request
+    with ?profile=1 (or an X-Profile header) gets a Server-Timing header
+    and its span tree, cProfile stats (.prof) and collapsed stacks
+    (.folded) written to PROFILING_DIR; ?profile=json returns the tree
+    instead of the page. it stays off without a PROFILING_TOKEN, the dumps
+    show the queries and code of any page to whoever asks.
+    """
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+    if not app.config.get('PROFILING_TOKEN'):
+        app.logger.warning('PROFILING_ENABLED is set without a PROFILING_TOKEN, profiling stays off')
+        return
+    _instrument_models()
+    _instrument_templates(app)
+    if not event.contains(Engine, 'before_cursor_execute', _sql_start):
+        event.listen(Engine, 'before_cursor_execute', _sql_start)
+        event.listen(Engine, 'after_cursor_execute', _sql_end)
+        event.listen(Engine, 'handle_error', _sql_error)
+    directory = app.config.get('PROFILING_DIR', 'profiles')
+
+    @app.before_request
+    def start_profile():
+        mode = _wanted(app)
+        if mode is None:
+            return
+        g.profile_mode = mode
+        g.profile = RequestProfile(f'{request.method} {request.path}',
+                                   with_cprofile=app.config.get('PROFILING_CPROFILE', True))
+        if g.profile.cprofile is not None:
+            g.profile.cprofile.enable()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        if profile.cprofile is not None:
+            profile.cprofile.disable()
+        profile.root.close()
+
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, profile.id)
+        tree = profile.root.serialize()
+        with open(f'{base}.json', 'w', encoding='utf-8') as tree_file:
+            json.dump(tree, tree_file, indent=2)
+        with open(f'{base}.folded', 'w', encoding='utf-8') as folded_file:
+            folded_file.write(profile.folded())
+        if profile.cprofile is not None:
+            profile.cprofile.dump_stats(f'{base}.prof')
+        prune(directory, app.config.get('PROFILING_MAX_PROFILES', 200))
+
+        totals = profile.totals()
+        if g.profile_mode == 'json':
+            response = jsonify({"id": profile.id, "totals": totals, "tree": tree})
+        response.headers['X-Profile-Id'] = profile.id
+        response.headers['Server-Timing'] = ', '.join(
+            f'{kind};dur={ms:.2f}' for kind, ms in sorted(totals.items()))
+        return response
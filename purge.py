@@ -0,0 +1,85 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+from changes import record_bulk
+from models import Artist, Venue, Show, ShowSeries, db
+from tenancy import unscoped
+
+# ----------------------------------------------------------------------------#
+# Purging soft deleted venues and artists.
+# ----------------------------------------------------------------------------#
+
+
+def _archive(archive_file, rows):
+    for show_id, tenant_id, venue_id, artist_id, start_time in rows:
+        archive_file.write(json.dumps({
+            "id": show_id,
+            "tenant_id": tenant_id,
+            "venue_id": venue_id,
+            "artist_id": artist_id,
+            "start_time": start_time.isoformat()
+        }) + '\n')
+
+
+def purge_shows(column, entity_id, tenant_id, batch_size, archive_file=None):
+    """
+    deletes the shows where column == entity_id, batch_size rows per
+    transaction so no lock is held for long. returns the number deleted.
+    """
+    purged = 0
+    while True:
+        rows = db.session.query(Show.id, Show.tenant_id, Show.venue_id, Show.artist_id, Show.start_time).filter(
+            Show.tenant_id == tenant_id, column == entity_id
+        ).order_by(Show.id).limit(batch_size).all()
+        if not rows:
+            return purged
+        if archive_file is not None:
+            _archive(archive_file, rows)
+        Show.query.filter(Show.id.in_([row[0] for row in rows])).delete(synchronize_session=False)
+        record_bulk(db.session, Show, 'delete', [row._asdict() for row in rows])
+        db.session.commit()
+        purged += len(rows)
+
+
+def purge_deleted(batch_size=500, grace_days=0, archive_dir=None):
+    """
+    removes the venues and artists soft deleted more than grace_days ago,
+    together with their shows and show series. shows are written to
+    archive_dir as gzipped ndjson first when it is given. covers every tenant.
+    returns {"venues", "artists", "shows"} counts.
+    """
+    with unscoped():
+        return _purge_deleted(batch_size, grace_days, archive_dir)
+
+
+def _purge_deleted(batch_size, grace_days, archive_dir):
+    cutoff = datetime.now() - timedelta(days=grace_days)
+    counts = {"venues": 0, "artists": 0, "shows": 0}
+    archive_file = None
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+        archive_file = gzip.open(
+            os.path.join(archive_dir, f'shows-{datetime.now():%Y%m%d%H%M%S}.ndjson.gz'), 'wt', encoding='utf-8')
+    try:
+        for model, show_column, series_column, counter in (
+                (Venue, Show.venue_id, ShowSeries.venue_id, "venues"),
+                (Artist, Show.artist_id, ShowSeries.artist_id, "artists")):
+            deleted = db.session.query(model.id, model.tenant_id).filter(
+                model.deleted_at.isnot(None), model.deleted_at <= cutoff).all()
+            for entity_id, tenant_id in deleted:
+                counts["shows"] += purge_shows(show_column, entity_id, tenant_id, batch_size, archive_file)
+                # series go through the orm so their exceptions are deleted with them
+                for series in ShowSeries.query.filter(ShowSeries.tenant_id == tenant_id, series_column == entity_id):
+                    db.session.delete(series)
+                db.session.delete(model.query.get(entity_id))
+                db.session.commit()
+                counts[counter] += 1
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if archive_file is not None:
+            archive_file.close()
+    return counts
@@ -0,0 +1,228 @@
+import difflib
+import json
+import re
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import event
+
+import homefeed
+import listings
+import search_index
+from models import City, Artist, Venue, Show, Tenant, db
+from tenancy import reset_tenant, set_tenant, unscoped
+
+# ----------------------------------------------------------------------------#
+# Capturing.
+# ----------------------------------------------------------------------------#
+
+# partitions come and go every month, their plans are compared as one table
+PARTITION_NAME = re.compile(r'Show_(p\d{6}|default)')
+# sqlite breaks ties between indexes serving the same constraints by their
+# creation order, which create_all does not keep; the constraints are compared
+SQLITE_INDEX_NAME = re.compile(r'USING (COVERING )?INDEX \S+ \(')
+
+
+@contextmanager
+def capture():
+    """ collects the (statement, parameters) the engine executes inside the block """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def _normalize(text):
+    return PARTITION_NAME.sub('Show_*', ' '.join(text.split()))
+
+
+def _postgres_nodes(node, shape):
+    label = node['Node Type']
+    if 'Index Name' in node:
+        label += f" using {node['Index Name']}"
+    if 'Relation Name' in node:
+        label += f" on {node['Relation Name']}"
+    shape.append(_normalize(label))
+    for child in node.get('Plans', []):
+        _postgres_nodes(child, shape)
+
+
+def plan_shape(connection, statement, parameters):
+    """
+    the scan and join nodes of a statement's plan, e.g. "Index Scan using
+    ix_Show_tenant_id_venue_id_start_time on Show_*", or on sqlite "SEARCH
+    Show USING INDEX (tenant_id=? AND venue_id=?)". repeated nodes of the
+    partitions of one table are listed once.
+    """
+    shape = []
+    if connection.dialect.name == 'postgresql':
+        plan = connection.execute(f'EXPLAIN (FORMAT JSON) {statement}', parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        _postgres_nodes(plan[0]['Plan'], shape)
+    else:
+        for row in connection.execute(f'EXPLAIN QUERY PLAN {statement}', parameters):
+            shape.append(SQLITE_INDEX_NAME.sub(r'USING \1INDEX (', _normalize(row[-1])))
+    return [label for position, label in enumerate(shape) if not position or shape[position - 1] != label]
+
+
+def profile(case):
+    """
+    runs a case and returns its statements with their plans. a statement
+    run again (an n+1 loop) is listed once with its count, planned with
+    the parameters of its first run.
+    """
+    with capture() as statements:
+        case()
+    profiled = {}
+    with db.engine.connect() as connection:
+        for statement, parameters in statements:
+            sql = _normalize(statement)
+            if sql in profiled:
+                profiled[sql]["count"] += 1
+                continue
+            profiled[sql] = {"sql": sql, "count": 1}
+            if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+                profiled[sql]["plan"] = plan_shape(connection, statement, parameters)
+    return {"statements": len(statements), "queries": list(profiled.values())}
+
+
+# ----------------------------------------------------------------------------#
+# Cases.
+# ----------------------------------------------------------------------------#
+
+def _sample_ids():
+    """ the busiest venue and artist and the city of that venue, so the plans see real fan-out """
+    with unscoped():
+        venue_id = db.session.query(Show.venue_id).group_by(Show.venue_id).order_by(
+            db.func.count(Show.id).desc()).limit(1).scalar()
+        artist_id = db.session.query(Show.artist_id).group_by(Show.artist_id).order_by(
+            db.func.count(Show.id).desc()).limit(1).scalar()
+        show_id = db.session.query(db.func.max(Show.id)).filter(Show.venue_id == venue_id).scalar()
+        venue = Venue.query.get(venue_id)
+        city = City.query.get(venue.city_id)
+        ids = {"venue": venue_id, "artist": artist_id, "show": show_id, "city": city.id,
+               "city_name": city.name, "state_name": city.state.name, "tenant": venue.tenant_id,
+               "tenant_slug": Tenant.query.get(venue.tenant_id).slug}
+    db.session.rollback()
+    return ids
+
+
+def cases(app):
+    """ {name: callable} for the model methods and routes that are watched """
+    from app import validate_city
+    ids = _sample_ids()
+    client = app.test_client()
+
+    def model_case(call):
+        def run():
+            # a fresh session each time, so nothing comes from the identity map
+            db.session.remove()
+            call()
+        return run
+
+    def route_case(url):
+        # the sampled tenant, not the one of the test client's host name (see run())
+        return lambda: client.get(url, headers={'X-Tenant': ids["tenant_slug"]})
+
+    return {
+        "Venue.serialize_details": model_case(lambda: Venue.query.get(ids["venue"]).serialize_details()),
+        "Artist.serialize_details": model_case(lambda: Artist.query.get(ids["artist"]).serialize_details()),
+        "City.get_venues": model_case(lambda: City.query.get(ids["city"]).get_venues()),
+        "Show.serialize_details": model_case(lambda: Show.query.get(ids["show"]).serialize_details()),
+        "validate_city": model_case(lambda: validate_city(ids["city_name"], ids["state_name"])),
+        "GET /": route_case('/'),
+        "GET /venues": route_case('/venues'),
+        "GET /artists": route_case('/artists'),
+        "GET /shows": route_case('/shows'),
+        "GET /venues/<id>": route_case(f'/venues/{ids["venue"]}'),
+        "GET /artists/<id>": route_case(f'/artists/{ids["artist"]}'),
+        "GET /api/home/artists": route_case('/api/home/artists?page=2'),
+        "GET /autocomplete": route_case('/autocomplete?q=th'),
+    }, ids["tenant"]
+
+
+# ----------------------------------------------------------------------------#
+# Baselines.
+# ----------------------------------------------------------------------------#
+
+def clear_caches():
+    """ empties the per worker caches that would answer the routes without a statement """
+    with homefeed.lock:
+        homefeed.snapshots.clear()
+    with listings.lock:
+        listings.listings.clear()
+        listings.pending.clear()
+    search_index.indexes.clear()
+
+
+def run(app, only=None):
+    """
+    profiles every case once warm: each runs twice and the second run is
+    kept, so connecting and the tenant lookup do not show up as extra
+    statements. the caches are cleared in between, the plans are those
+    of the statements that fill them.
+    """
+    all_cases, tenant_id = cases(app)
+    token = set_tenant(tenant_id)
+    header_trusted = app.config.get('TENANT_HEADER_TRUSTED')
+    app.config['TENANT_HEADER_TRUSTED'] = True
+    try:
+        results = {}
+        for name, case in all_cases.items():
+            if only and name not in only:
+                continue
+            case()
+            clear_caches()
+            results[name] = profile(case)
+        return results
+    finally:
+        app.config['TENANT_HEADER_TRUSTED'] = header_trusted
+        reset_tenant(token)
+        db.session.remove()
+
+
+def _load(path):
+    try:
+        with open(path, encoding='utf-8') as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return {}
+
+
+def load_baselines(path, dialect):
+    """ the baselines are kept per database dialect, sqlite and postgres plan differently """
+    return _load(path).get(dialect, {})
+
+
+def save_baselines(path, dialect, results):
+    stored = _load(path)
+    stored[dialect] = results
+    with open(path, 'w', encoding='utf-8') as baseline_file:
+        json.dump(stored, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
+
+
+def compare(baselines, results):
+    """ {case: unified diff} for the cases whose statement count or plans changed """
+    changed = {}
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline == result:
+            continue
+        before = json.dumps(baseline, indent=2, sort_keys=True).splitlines() if baseline else []
+        after = json.dumps(result, indent=2, sort_keys=True).splitlines()
+        summary = f'statements: {baseline["statements"] if baseline else "none"} -> {result["statements"]}'
+        changed[name] = '\n'.join([summary, *difflib.unified_diff(
+            before, after, fromfile=f'{name} (baseline)', tofile=f'{name} (now)', lineterm='')])
+    return changed
+
+
+def default_path():
+    return current_app.config.get('QUERY_PLAN_BASELINES', 'query_plans.json')
@@ -0,0 +1,155 @@
+import math
+import sqlite3
+import threading
+import time
+
+from flask import abort, g, request
+
+# ----------------------------------------------------------------------------#
+# Token buckets.
+# ----------------------------------------------------------------------------#
+
+
+def _take(tokens, updated, rate, burst, now):
+    """ (tokens left, seconds to wait or 0, time the bucket is full again) """
+    tokens = min(burst, tokens + (now - updated) * rate)
+    wait = 0 if tokens >= 1 else (1 - tokens) / rate
+    if not wait:
+        tokens -= 1
+    return tokens, wait, now + (burst - tokens) / rate
+
+
+class MemoryBucketStore:
+    """
+    buckets of this worker process only. a bucket that has refilled is the
+    same as no bucket, those are dropped every sweep_seconds; past
+    max_buckets the ones closest to full go first.
+    """
+
+    def __init__(self, max_buckets=100000, sweep_seconds=60):
+        self.lock = threading.Lock()
+        # key -> (tokens, updated, full_at)
+        self.buckets = {}
+        self.max_buckets = max_buckets
+        self.sweep_seconds = sweep_seconds
+        self.swept_at = 0
+
+    def sweep(self, now):
+        buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[2] > now}
+        if len(buckets) >= self.max_buckets:
+            by_full_at = sorted(buckets.items(), key=lambda item: item[1][2])
+            buckets = dict(by_full_at[len(by_full_at) - self.max_buckets // 2:])
+        self.buckets = buckets
+        self.swept_at = now
+
+    def take(self, key, rate, burst, now):
+        """ takes one token; returns 0 when allowed, else seconds until a token is available """
+        with self.lock:
+            if now - self.swept_at >= self.sweep_seconds or len(self.buckets) >= self.max_buckets:
+                self.sweep(now)
+            tokens, updated, _ = self.buckets.get(key, (burst, now, now))
+            tokens, wait, full_at = _take(tokens, updated, rate, burst, now)
+            self.buckets[key] = (tokens, now, full_at)
+            return wait
+
+
+class SqliteBucketStore:
+    """
+    buckets in a local sqlite file, shared by all the workers of one host.
+    each take is a short write transaction on one row. refilled buckets are
+    deleted every sweep_seconds. when the file stays locked past timeout
+    (or fails otherwise) the request is let through: the limiter must not
+    turn contention into errors.
+    """
+
+    def __init__(self, path, timeout=0.1, sweep_seconds=60):
+        self.path = path
+        self.timeout = timeout
+        self.sweep_seconds = sweep_seconds
+        self.swept_at = 0
+        self.local = threading.local()
+
+    def connection(self):
+        if not hasattr(self.local, 'connection'):
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS token_buckets '
+                               '(key TEXT PRIMARY KEY, tokens REAL, updated REAL, full_at REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_token_buckets_full_at ON token_buckets (full_at)')
+            self.local.connection = connection
+        return self.local.connection
+
+    def take(self, key, rate, burst, now):
+        try:
+            connection = self.connection()
+            connection.execute('BEGIN IMMEDIATE')
+        except sqlite3.Error:
+            return 0
+        try:
+            if now - self.swept_at >= self.sweep_seconds:
+                connection.execute('DELETE FROM token_buckets WHERE full_at <= ?', (now,))
+                self.swept_at = now
+            row = connection.execute('SELECT tokens, updated FROM token_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens, wait, full_at = _take(tokens, updated, rate, burst, now)
+            connection.execute('INSERT OR REPLACE INTO token_buckets (key, tokens, updated, full_at) '
+                               'VALUES (?, ?, ?, ?)', (key, tokens, now, full_at))
+            connection.execute('COMMIT')
+        except sqlite3.Error:
+            connection.execute('ROLLBACK')
+            return 0
+        return wait
+
+
+# ----------------------------------------------------------------------------#
+# Admission control.
+# ----------------------------------------------------------------------------#
+
+def client_id():
+    # X-Forwarded-For is only believed through ProxyFix, see PROXY_FIX_X_FOR
+    return request.remote_addr
+
+
+def init_app(app):
+    """
+    RATE_LIMITS maps endpoint -> (requests, per seconds[, burst]) and is
+    enforced per client with 429s. CONCURRENCY_LIMITS maps endpoint -> how
+    many of its requests a worker runs at once; extra ones get a 503 right
+    away instead of waiting for a worker.
+    """
+    limits = app.config.get('RATE_LIMITS', {})
+    store_path = app.config.get('RATE_LIMIT_STORE')
+    store = SqliteBucketStore(store_path) if store_path else MemoryBucketStore()
+    slots = {
+        endpoint: threading.BoundedSemaphore(size)
+        for endpoint, size in app.config.get('CONCURRENCY_LIMITS', {}).items()
+    }
+
+    def too_many(status, retry_after):
+        response = app.make_response((f'{status} Too busy, retry in {retry_after}s', status))
+        response.headers['Retry-After'] = str(retry_after)
+        abort(response)
+
+    @app.before_request
+    def admit():
+        endpoint = request.endpoint
+        if endpoint in limits:
+            requests_allowed, per_seconds, *burst = limits[endpoint]
+            rate = requests_allowed / per_seconds
+            wait = store.take(f'{endpoint}:{client_id()}', rate,
+                              burst[0] if burst else requests_allowed, time.time())
+            if wait:
+                too_many(429, math.ceil(wait))
+        slot = slots.get(endpoint)
+        if slot is not None:
+            if not slot.acquire(blocking=False):
+                too_many(503, 1)
+            g.concurrency_slot = slot
+
+    @app.teardown_request
+    def release(exception=None):
+        slot = g.pop('concurrency_slot', None)
+        if slot is not None:
+            slot.release()
+
+    return store
@@ -0,0 +1,122 @@
+from datetime import datetime
+
+from changes import record_bulk
+from embedded import assign_bulk_show_ids
+from models import Artist, Venue, Show, db
+
+# ----------------------------------------------------------------------------#
+# Bulk scheduling.
+# ----------------------------------------------------------------------------#
+
+START_TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M')
+
+
+def parse_start_time(value):
+    if isinstance(value, datetime):
+        return value
+    for time_format in START_TIME_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), time_format)
+        except ValueError:
+            pass
+    raise ValueError(f'invalid start_time {value!r}')
+
+
+def _parse_entry(entry):
+    """ returns (artist_id, venue_id, start_time) or raises ValueError """
+    try:
+        artist_id = int(entry['artist_id'])
+        venue_id = int(entry['venue_id'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('artist_id and venue_id must be integers')
+    if 'start_time' not in entry:
+        raise ValueError('start_time is required')
+    return artist_id, venue_id, parse_start_time(entry['start_time'])
+
+
+def schedule_shows(entries):
+    """
+    validates a batch of shows and inserts the valid ones in one transaction.
+    the whole batch is checked with three queries (artists, venues, existing
+    bookings at the requested times) instead of one lookup per show.
+    returns (number of shows created, list of {"row", "errors"} for rejected rows).
+    """
+    errors = {}
+    parsed = {}
+    for row, entry in enumerate(entries):
+        try:
+            parsed[row] = _parse_entry(entry)
+        except ValueError as e:
+            errors[row] = [str(e)]
+
+    artist_ids = {artist_id for artist_id, _, _ in parsed.values()}
+    venue_ids = {venue_id for _, venue_id, _ in parsed.values()}
+    start_times = {start_time for _, _, start_time in parsed.values()}
+
+    # artist id -> (tenant id, available_from, available_till)
+    availability = {}
+    if artist_ids:
+        availability = {
+            artist_id: (tenant_id, available_from, available_till)
+            for artist_id, tenant_id, available_from, available_till in db.session.query(
+                Artist.id, Artist.tenant_id, Artist.available_from, Artist.available_till
+            ).filter(Artist.id.in_(artist_ids), Artist.deleted_at.is_(None))
+        }
+    # venue id -> tenant id, the show belongs to the venue's tenant
+    existing_venues = {}
+    if venue_ids:
+        existing_venues = dict(db.session.query(Venue.id, Venue.tenant_id).filter(
+            Venue.id.in_(venue_ids), Venue.deleted_at.is_(None)))
+    booked_artists = set()
+    booked_venues = set()
+    tenant_ids = set(existing_venues.values()) | {tenant_id for tenant_id, _, _ in availability.values()}
+    if start_times and tenant_ids:
+        for artist_id, venue_id, start_time in db.session.query(
+                Show.artist_id, Show.venue_id, Show.start_time
+        ).filter(Show.tenant_id.in_(tenant_ids), Show.start_time.in_(start_times)):
+            booked_artists.add((artist_id, start_time))
+            booked_venues.add((venue_id, start_time))
+
+    new_shows = []
+    for row, (artist_id, venue_id, start_time) in parsed.items():
+        row_errors = []
+        if artist_id not in availability:
+            row_errors.append(f'artist {artist_id} does not exist')
+        else:
+            artist_tenant_id, available_from, available_till = availability[artist_id]
+            # an artist without hours set can be booked at any time
+            if None not in (available_from, available_till) and \
+                    not available_from <= start_time.hour <= available_till:
+                row_errors.append(f'artist {artist_id} is not available at {start_time:%H:%M}')
+        if venue_id not in existing_venues:
+            row_errors.append(f'venue {venue_id} does not exist')
+        elif artist_id in availability and existing_venues[venue_id] != artist_tenant_id:
+            row_errors.append(f'artist {artist_id} and venue {venue_id} belong to different tenants')
+        # checked against both the database and the rows accepted so far
+        if (artist_id, start_time) in booked_artists:
+            row_errors.append(f'artist {artist_id} is already booked at {start_time}')
+        if (venue_id, start_time) in booked_venues:
+            row_errors.append(f'venue {venue_id} is already booked at {start_time}')
+
+        if row_errors:
+            errors[row] = row_errors
+            continue
+        booked_artists.add((artist_id, start_time))
+        booked_venues.add((venue_id, start_time))
+        new_shows.append({'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time,
+                          'tenant_id': existing_venues[venue_id]})
+
+    if new_shows:
+        try:
+            assign_bulk_show_ids(db.session, new_shows)
+            # return_defaults fills in the ids for the change log
+            db.session.bulk_insert_mappings(Show, new_shows, return_defaults=True)
+            record_bulk(db.session, Show, 'insert', new_shows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    return len(new_shows), [
+        {'row': row, 'errors': errors[row]} for row in sorted(errors)
+    ]
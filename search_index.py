@@ -0,0 +1,242 @@
+import bisect
+import re
+import threading
+import time
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import State, City, Artist, Venue, db
+from tenancy import current_tenant_id
+
+# ----------------------------------------------------------------------------#
+# Autocomplete index.
+# ----------------------------------------------------------------------------#
+
+WORD_START = re.compile(r'\b\w')
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+def prefixes_for(label):
+    """
+    the suffixes of label starting at each word, so "The Musical Hop" can be
+    found by "the m", "musical" or "hop"
+    """
+    text = normalize(label)
+    return {text[match.start():] for match in WORD_START.finditer(text)}
+
+
+class PrefixIndex:
+    """
+    one sorted array of (term, id) per kind ("venue", "artist", "city")
+    searched with bisect, and the labels {kind: {id: label}}; lookups never
+    touch the database. updates build new arrays for the kinds they touch
+    and swap them in, so a lookup reads consistent arrays without taking
+    the lock.
+    """
+
+    # positions a lookup looks at per kind, so very short prefixes stay cheap
+    SCAN_PER_RESULT = 20
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.terms = {}
+        self.labels = {}
+        self.built_at = None
+        self.stale = True
+
+    def load(self, entries):
+        """ replaces the whole index with entries {(kind, id): label} """
+        labels = {}
+        for (kind, entity_id), label in entries.items():
+            labels.setdefault(kind, {})[entity_id] = label
+        terms = {
+            kind: sorted((term, entity_id) for entity_id, label in kind_labels.items()
+                         for term in prefixes_for(label))
+            for kind, kind_labels in labels.items()
+        }
+        with self.lock:
+            self.terms, self.labels = terms, labels
+            self.built_at, self.stale = time.monotonic(), False
+
+    @staticmethod
+    def _remove(terms, labels, entity_id):
+        label = labels.pop(entity_id, None)
+        if label is None:
+            return
+        for term in prefixes_for(label):
+            position = bisect.bisect_left(terms, (term, entity_id))
+            if position < len(terms) and terms[position] == (term, entity_id):
+                del terms[position]
+
+    def apply(self, changes):
+        """ changes is a list of ((kind, id), label or None for deletions) """
+        with self.lock:
+            # copies of the arrays of the changed kinds only, the others are shared
+            terms, labels = dict(self.terms), dict(self.labels)
+            copied = set()
+            for (kind, entity_id), label in changes:
+                if kind not in copied:
+                    terms[kind] = list(terms.get(kind, ()))
+                    labels[kind] = dict(labels.get(kind, {}))
+                    copied.add(kind)
+                self._remove(terms[kind], labels[kind], entity_id)
+                if label:
+                    labels[kind][entity_id] = label
+                    for term in prefixes_for(label):
+                        bisect.insort(terms[kind], (term, entity_id))
+            self.terms, self.labels = terms, labels
+
+    def lookup(self, prefix, limit=10, kinds=None):
+        """ labels whose words start with prefix; whole-label matches first, then shortest """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        # never changed in place; a label missing during a swap only drops that entry
+        terms, labels = self.terms, self.labels
+        found = {}
+        for kind in (terms if kinds is None else kinds):
+            kind_terms, kind_labels = terms.get(kind, ()), labels.get(kind, {})
+            position = bisect.bisect_left(kind_terms, (prefix,))
+            end = min(len(kind_terms), position + limit * self.SCAN_PER_RESULT)
+            kind_found = 0
+            while position < end and kind_found < limit * 5:
+                term, entity_id = kind_terms[position]
+                if not term.startswith(prefix):
+                    break
+                if (kind, entity_id) not in found:
+                    label = kind_labels.get(entity_id)
+                    if label is not None:
+                        found[kind, entity_id] = label
+                        kind_found += 1
+                position += 1
+        ranked = sorted(
+            found.items(),
+            key=lambda item: (not normalize(item[1]).startswith(prefix), len(item[1]), item[1])
+        )
+        return [
+            {"type": kind, "id": entity_id, "label": label}
+            for (kind, entity_id), label in ranked[:limit]
+        ]
+
+
+# one index per tenant, so a large market never slows down lookups of a small one
+indexes = {}
+
+
+def index_for(tenant_id):
+    if tenant_id not in indexes:
+        indexes[tenant_id] = PrefixIndex()
+    return indexes[tenant_id]
+
+
+def entry_for(instance):
+    """ ((kind, id), label) for a model instance, or None if it is not indexed """
+    if isinstance(instance, (Venue, Artist)) and instance.deleted_at is not None:
+        # soft deleted, drop it from the index
+        return (instance.__tablename__.lower(), instance.id), None
+    if isinstance(instance, Venue):
+        return ('venue', instance.id), instance.name
+    if isinstance(instance, Artist):
+        return ('artist', instance.id), instance.name
+    if isinstance(instance, City):
+        state = instance.state
+        return ('city', instance.id), f'{instance.name}, {state.name}' if state else instance.name
+    return None
+
+
+def load_all(index):
+    """ loads the current tenant's entries, the queries are scoped by tenancy.py """
+    entries = {}
+    for venue_id, name in db.session.query(Venue.id, Venue.name).filter(Venue.deleted_at.is_(None)):
+        entries['venue', venue_id] = name
+    for artist_id, name in db.session.query(Artist.id, Artist.name).filter(Artist.deleted_at.is_(None)):
+        entries['artist', artist_id] = name
+    for city_id, name, state_name in db.session.query(City.id, City.name, State.name).join(State):
+        entries['city', city_id] = f'{name}, {state_name}'
+    index.load(entries)
+
+
+def current_index(max_age=None):
+    """ the index is built on first use and again when older than max_age seconds """
+    index = index_for(current_tenant_id())
+    if index.stale or (max_age and time.monotonic() - index.built_at > max_age):
+        load_all(index)
+    return index
+
+
+def autocomplete(prefix, limit=10, kinds=None, max_age=None):
+    return current_index(max_age).lookup(prefix, limit, kinds)
+
+
+def labels(kind, ids):
+    """
+    {id: name} for the ids of kind ("venue" or "artist") that exist and are
+    not deleted. the index of this worker can lag behind the commits of the
+    others, so the ids are always confirmed with a single query.
+    """
+    if not ids:
+        return {}
+    model = {'venue': Venue, 'artist': Artist}[kind]
+    return dict(db.session.query(model.id, model.name).filter(
+        model.id.in_(ids), model.deleted_at.is_(None)))
+
+
+# ----------------------------------------------------------------------------#
+# Incremental updates.
+# ----------------------------------------------------------------------------#
+
+PENDING = 'search_index_changes'
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_changes(session, flush_context):
+    # {tenant id: [((kind, id), label or None)]}
+    changes = session.info.setdefault(PENDING, {})
+    for instance in list(session.new) + list(session.dirty):
+        entry = entry_for(instance)
+        if entry is not None:
+            changes.setdefault(instance.tenant_id, []).append(entry)
+    for instance in session.deleted:
+        entry = entry_for(instance)
+        if entry is not None:
+            changes.setdefault(instance.tenant_id, []).append((entry[0], None))
+    # renaming a state changes the label of its cities. a state is dirty too
+    # when a city is added to it, its cities are not loaded for that
+    for instance in session.dirty:
+        if isinstance(instance, State) and inspect(instance).attrs.name.history.has_changes():
+            for city in instance.cities:
+                changes.setdefault(city.tenant_id, []).append(entry_for(city))
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_changes(session):
+    changes = session.info.pop(PENDING, None) or {}
+    for tenant_id, tenant_changes in changes.items():
+        index = indexes.get(tenant_id)
+        if index is not None and not index.stale:
+            index.apply(tenant_changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changes(session):
+    session.info.pop(PENDING, None)
+
+
+@event.listens_for(Session, 'after_bulk_delete')
+def bulk_delete(delete_context):
+    # the deleted ids are unknown, rebuild on the next lookup
+    if delete_context.mapper.class_ in (Venue, Artist, City):
+        for index in indexes.values():
+            index.stale = True
+
+
+@event.listens_for(Session, 'after_bulk_update')
+def bulk_update(update_context):
+    # soft deletes are bulk updates of deleted_at
+    if update_context.mapper.class_ in (Venue, Artist, City):
+        for index in indexes.values():
+            index.stale = True
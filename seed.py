@@ -0,0 +1,251 @@
+import csv
+import io
+import itertools
+import random
+from datetime import datetime, timedelta
+
+from forms import GENRES, STATES
+from models import State, City, Artist, Venue, Show, Tenant, db
+from partitions import month_start, existing_partitions, create_partition
+from tenancy import unscoped
+
+# ----------------------------------------------------------------------------#
+# Synthetic data.
+# ----------------------------------------------------------------------------#
+
+CITY_PARTS = (
+    ('Port ', 'New ', 'East ', 'West ', 'North ', 'South ', 'Lake ', 'Fort ', 'Mount ', ''),
+    ('Ash', 'Brook', 'Cedar', 'Clear', 'Elm', 'Fair', 'Glen', 'Green', 'High', 'Oak', 'Red', 'Silver',
+     'Spring', 'Stone', 'Sun', 'Water', 'Wood', 'Maple', 'River', 'Pine'),
+    ('ford', 'field', 'ton', 'ville', 'burg', 'dale', 'haven', 'port', 'view', 'wood'),
+)
+VENUE_KINDS = ('Hall', 'Club', 'Lounge', 'Theatre', 'Room', 'Tavern', 'Ballroom', 'Garden', 'Stage', 'Bar')
+NAME_WORDS = ('Blue', 'Golden', 'Velvet', 'Electric', 'Midnight', 'Silver', 'Wild', 'Crimson', 'Neon',
+              'Hollow', 'Lucky', 'Iron', 'Paper', 'Broken', 'Honey', 'Static', 'Lonesome', 'Atomic')
+BAND_NOUNS = ('Owls', 'Kings', 'Sisters', 'Rivers', 'Machines', 'Ghosts', 'Horses', 'Saints', 'Lights',
+              'Wolves', 'Strangers', 'Tigers', 'Brothers', 'Hearts', 'Echoes', 'Engines')
+
+# share of artists that play anywhere instead of around their home city
+TOURING_SHARE = 0.15
+# shows at the busiest venues are this skewed (zipf exponent)
+VENUE_SKEW = 1.1
+ARTIST_SKEW = 1.0
+CITY_SKEW = 1.2
+GENRE_SKEW = 0.8
+
+
+def zipf_cum_weights(count, exponent):
+    """ cumulative weights for random.choices, rank 1 is the most likely """
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class Generator:
+    """
+    produces rows as tuples in table column order. everything comes from
+    one seeded Random, so a seed and a today give the same data every time.
+    """
+
+    def __init__(self, seed, today, first_ids, tenant_id, state_ids):
+        self.random = random.Random(seed)
+        self.today = today
+        self.next_ids = dict(first_ids)
+        self.tenant_id = tenant_id
+        self.state_ids = state_ids
+        genres = [genre for genre, _ in GENRES]
+        self.random.shuffle(genres)
+        self.genres = genres
+        self.genre_weights = zipf_cum_weights(len(genres), GENRE_SKEW)
+        self.cities = []
+        self.venues = []
+        self.artists = []
+
+    def _id(self, table):
+        entity_id = self.next_ids[table]
+        self.next_ids[table] += 1
+        return entity_id
+
+    def _genres(self, low, high):
+        picked = self.random.choices(self.genres, cum_weights=self.genre_weights, k=self.random.randint(low, high))
+        return sorted(set(picked))
+
+    def _phone(self):
+        return f'{self.random.randint(200, 999)}-{self.random.randint(200, 999)}-{self.random.randint(0, 9999):04d}'
+
+    def cities_rows(self, count):
+        names = set()
+        for _ in range(count):
+            name = ''.join(self.random.choice(part) for part in CITY_PARTS)
+            while name in names:
+                name = f'{name} {self.random.choice(VENUE_KINDS)}'
+            names.add(name)
+            city_id = self._id('City')
+            self.cities.append(city_id)
+            yield city_id, name, self.random.choice(self.state_ids), self.tenant_id
+        self.city_weights = zipf_cum_weights(len(self.cities), CITY_SKEW)
+
+    def venues_rows(self, count):
+        self.venues_by_city = {}
+        for _ in range(count):
+            venue_id = self._id('Venue')
+            city_id = self.random.choices(self.cities, cum_weights=self.city_weights)[0]
+            self.venues.append(venue_id)
+            self.venues_by_city.setdefault(city_id, []).append(venue_id)
+            name = f'The {self.random.choice(NAME_WORDS)} {self.random.choice(VENUE_KINDS)}'
+            seeking = self.random.random() < 0.3
+            yield (venue_id, f'{name} {venue_id}', self._genres(2, 4), city_id,
+                   f'{self.random.randint(1, 9999)} {self.random.choice(NAME_WORDS)} St', self._phone(),
+                   '', '', '', seeking, 'Looking for local acts' if seeking else '', 1, None, self.tenant_id)
+        # the first venues created are the hot ones
+        self.venue_weights = zipf_cum_weights(len(self.venues), VENUE_SKEW)
+        self.city_venue_weights = {
+            city_id: zipf_cum_weights(len(venue_ids), VENUE_SKEW)
+            for city_id, venue_ids in self.venues_by_city.items()
+        }
+
+    def artists_rows(self, count):
+        for _ in range(count):
+            artist_id = self._id('Artist')
+            city_id = self.random.choices(self.cities, cum_weights=self.city_weights)[0]
+            touring = self.random.random() < TOURING_SHARE or city_id not in self.venues_by_city
+            self.artists.append((artist_id, None if touring else city_id))
+            name = f'{self.random.choice(NAME_WORDS)} {self.random.choice(BAND_NOUNS)}'
+            seeking = self.random.random() < 0.4
+            yield (artist_id, f'{name} {artist_id}', self._genres(1, 3), city_id, self._phone(),
+                   '', '', '', seeking, 'Looking for shows' if seeking else '', 17, 23, 1, None, self.tenant_id)
+        self.artist_weights = zipf_cum_weights(len(self.artists), ARTIST_SKEW)
+
+    def _start_time(self, past_days, future_days):
+        # most shows are on friday and saturday nights
+        while True:
+            day = self.today + timedelta(days=self.random.randint(-past_days, future_days))
+            if day.weekday() in (4, 5) or self.random.random() < 0.35:
+                break
+        return day.replace(hour=self.random.choice((19, 20, 20, 21, 21, 22)), minute=self.random.choice((0, 30)))
+
+    def shows_rows(self, count, past_days, future_days):
+        for _ in range(count):
+            artist_id, home_city = self.random.choices(self.artists, cum_weights=self.artist_weights)[0]
+            if home_city is None:
+                venue_id = self.random.choices(self.venues, cum_weights=self.venue_weights)[0]
+            else:
+                venue_id = self.random.choices(self.venues_by_city[home_city],
+                                               cum_weights=self.city_venue_weights[home_city])[0]
+            yield self._id('Show'), venue_id, artist_id, self._start_time(past_days, future_days), self.tenant_id
+
+
+# ----------------------------------------------------------------------------#
+# Loading.
+# ----------------------------------------------------------------------------#
+
+COLUMNS = {
+    City: ('id', 'name', 'state_id', 'tenant_id'),
+    Venue: ('id', 'name', 'genres', 'city_id', 'address', 'phone', 'image_link', 'website', 'facebook_link',
+            'seeking_talent', 'seeking_description', 'version', 'deleted_at', 'tenant_id'),
+    Artist: ('id', 'name', 'genres', 'city_id', 'phone', 'image_link', 'website', 'facebook_link',
+             'seeking_venue', 'seeking_description', 'available_from', 'available_till', 'version',
+             'deleted_at', 'tenant_id'),
+    Show: ('id', 'venue_id', 'artist_id', 'start_time', 'tenant_id'),
+}
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, list):
+        # postgres array literal, every element quoted
+        return '{' + ','.join('"' + item.replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value) + '}'
+    return value
+
+
+def load(connection, model, rows, batch_size=100000):
+    """
+    writes rows in batches: COPY FROM STDIN on postgres, executemany on
+    other databases. returns the number of rows written.
+    """
+    columns = COLUMNS[model]
+    table = model.__table__
+    postgres = connection.dialect.name == 'postgresql'
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    written = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return written
+        if postgres:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in batch:
+                writer.writerow([_copy_value(value) for value in row])
+            buffer.seek(0)
+            cursor = connection.connection.cursor()
+            cursor.copy_expert(
+                f'''COPY "{table.name}" ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')''', buffer)
+        else:
+            connection.execute(table.insert(), [dict(zip(columns, row)) for row in batch])
+        written += len(batch)
+
+
+def _next_ids(connection):
+    return {
+        model.__tablename__: (connection.execute(db.select([db.func.max(model.id)])).scalar() or 0) + 1
+        for model in (City, Venue, Artist, Show)
+    }
+
+
+def _reset_sequences(connection):
+    for model in (City, Venue, Artist, Show):
+        connection.execute(db.text(
+            f"""SELECT setval(pg_get_serial_sequence('"{model.__tablename__}"', 'id'),
+                              (SELECT max(id) FROM "{model.__tablename__}"))"""
+        ))
+
+
+def _ensure_partitions(today, past_days, future_days):
+    """ monthly partitions for the whole range, so the shows do not pile up in Show_default """
+    with db.engine.connect() as connection:
+        partitions = existing_partitions(connection)
+    month = month_start(today - timedelta(days=past_days))
+    last_month = month_start(today + timedelta(days=future_days))
+    while month <= last_month:
+        if month not in partitions:
+            with db.engine.begin() as connection:
+                create_partition(connection, month)
+        month = month_start(month, 1)
+
+
+def seed(cities=200, venues=2000, artists=10000, shows=1000000, seed=1, tenant='default',
+         today=None, past_days=365, future_days=180, progress=None):
+    """
+    generates and loads a dataset in one transaction. rows get ids after the
+    current maximum so it can be added to an existing database; the change
+    log and caches are not written, run analytics-refresh --rebuild afterwards.
+    returns {table: rows written}.
+    """
+    today = (today or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    progress = progress or (lambda table, count: None)
+    with unscoped():
+        tenant_id = Tenant.query.filter_by(slug=tenant).one().id
+        known_states = {state.name for state in State.query}
+        db.session.add_all(State(name=name) for name, _ in STATES if name not in known_states)
+        db.session.commit()
+        state_ids = [state_id for state_id, in db.session.query(State.id).order_by(State.id)]
+
+    postgres = db.engine.dialect.name == 'postgresql'
+    if postgres and shows:
+        _ensure_partitions(today, past_days, future_days)
+
+    written = {}
+    with db.engine.begin() as connection:
+        generator = Generator(seed, today, _next_ids(connection), tenant_id, state_ids)
+        for model, rows in (
+                (City, generator.cities_rows(cities)),
+                (Venue, generator.venues_rows(venues)),
+                (Artist, generator.artists_rows(artists)),
+                (Show, generator.shows_rows(shows, past_days, future_days))):
+            written[model.__tablename__] = load(connection, model, rows)
+            progress(model.__tablename__, written[model.__tablename__])
+        if postgres:
+            _reset_sequences(connection)
+    return written
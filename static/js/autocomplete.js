@@ -0,0 +1,67 @@
+// fills the search box suggestions from /autocomplete while typing
+(function() {
+  // lookup fields: the search box refills its select with matching ids
+  const searches = document.querySelectorAll('input[data-lookup-search]');
+  for (let i = 0; i < searches.length; i++) {
+    const search = searches[i];
+    const select = document.getElementById(search.dataset['lookupSearch']);
+    let lookupTimer = null;
+    search.oninput = function() {
+      clearTimeout(lookupTimer);
+      const term = search.value.trim();
+      if (!term) {
+        return;
+      }
+      lookupTimer = setTimeout(function() {
+        fetch('/autocomplete?q=' + encodeURIComponent(term) + '&type=' + select.dataset['lookup'])
+        .then(function(response) {
+          return response.json();
+        })
+        .then(function(result) {
+          select.innerHTML = '';
+          result.data.forEach(function(match) {
+            const option = document.createElement('option');
+            option.value = match.id;
+            option.textContent = match.label;
+            select.appendChild(option);
+          });
+        })
+        .catch(function(e) {
+          console.log(e);
+        });
+      }, 150);
+    }
+  }
+
+  const inputs = document.querySelectorAll('input[data-autocomplete]');
+  const suggestions = document.getElementById('search-suggestions');
+  let timer = null;
+  for (let i = 0; i < inputs.length; i++) {
+    const input = inputs[i];
+    input.oninput = function() {
+      clearTimeout(timer);
+      const term = input.value.trim();
+      if (!term) {
+        suggestions.innerHTML = '';
+        return;
+      }
+      timer = setTimeout(function() {
+        fetch('/autocomplete?q=' + encodeURIComponent(term) + '&type=' + input.dataset['autocomplete'])
+        .then(function(response) {
+          return response.json();
+        })
+        .then(function(result) {
+          suggestions.innerHTML = '';
+          result.data.forEach(function(match) {
+            const option = document.createElement('option');
+            option.value = match.label;
+            suggestions.appendChild(option);
+          });
+        })
+        .catch(function(e) {
+          console.log(e);
+        });
+      }, 150);
+    }
+  }
+})();
@@ -0,0 +1,59 @@
+// tells the reader of a show listing that shows were booked or removed since it loaded.
+// every stream holds a server thread, so it is only opened when the reader asks for it.
+(function() {
+  const listing = document.querySelector('[data-live-shows]');
+  if (!listing || !window.EventSource) {
+    return;
+  }
+  let source = null;
+  let changed = 0;
+  const notice = document.createElement('div');
+  notice.className = 'alert alert-info';
+  notice.style.display = 'none';
+  listing.parentNode.insertBefore(notice, listing);
+  const watch = document.createElement('button');
+  watch.type = 'button';
+  watch.className = 'btn btn-default btn-sm';
+  watch.textContent = 'Watch for new shows';
+  listing.parentNode.insertBefore(watch, notice);
+
+  function announce(text) {
+    notice.innerHTML = '';
+    const link = document.createElement('a');
+    link.href = window.location.href;
+    link.textContent = text;
+    notice.appendChild(link);
+    notice.style.display = '';
+  }
+
+  function subscribe() {
+    source = new EventSource(listing.dataset['liveShows']);
+    source.addEventListener('show', function(e) {
+      changed += 1;
+      const show = JSON.parse(e.data);
+      announce((changed === 1 ? (show.op === 'insert' ? 'A show was booked' : 'A show was removed')
+                              : changed + ' shows changed') + ', reload to see the latest listing.');
+    });
+    source.addEventListener('reset', function() {
+      source.close();
+      announce('The listing is out of date, reload to see the latest shows.');
+    });
+    source.addEventListener('error', function() {
+      // a 503 (every stream of the worker is taken) closes the source for good
+      if (source.readyState === EventSource.CLOSED) {
+        watch.textContent = 'Live updates are busy, try again';
+      }
+    });
+  }
+
+  watch.addEventListener('click', function() {
+    if (source && source.readyState !== EventSource.CLOSED) {
+      source.close();
+      source = null;
+      watch.textContent = 'Watch for new shows';
+      return;
+    }
+    subscribe();
+    watch.textContent = 'Stop watching';
+  });
+})();
@@ -0,0 +1,142 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import time
+import uuid
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# ----------------------------------------------------------------------------#
+# Structured logging.
+# ----------------------------------------------------------------------------#
+
+# attributes every LogRecord has; anything else was passed with extra={}
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """ one json object per line with the message, its extra fields and the request context """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    enqueues the record without formatting it, the listener's formatter does
+    that. the stock prepare() formats with a plain formatter and drops
+    exc_info, so the traceback is kept as exc_text instead.
+    """
+
+    # the QueueListener draining this handler's queue, see setup_logging
+    listener = None
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RequestContextFilter(logging.Filter):
+    """ stamps records logged while handling a request with its id and route """
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = getattr(g, 'request_id', None)
+            record.route = request.url_rule.rule if request.url_rule else None
+        return True
+
+
+def _count_queries(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_count' in g:
+        g.sql_count += 1
+
+
+def _start_request():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_started = time.perf_counter()
+    g.sql_count = 0
+
+
+def _log_request(app, response):
+    if 'request_started' not in g:
+        return response
+    latency_ms = (time.perf_counter() - g.request_started) * 1000
+    response.headers['X-Request-ID'] = g.request_id
+    # errors and slow requests are always kept, the rest is sampled
+    important = response.status_code >= 500 or latency_ms >= app.config.get('LOG_SLOW_MS', 1000)
+    if important or random.random() < app.config.get('LOG_SAMPLE_RATE', 1.0):
+        app.logger.log(
+            logging.WARNING if important else logging.INFO,
+            f'{request.method} {request.path} {response.status_code}',
+            extra={
+                "method": request.method,
+                "status": response.status_code,
+                "latency_ms": round(latency_ms, 2),
+                "sql_count": g.sql_count,
+            }
+        )
+    return response
+
+
+def setup_logging(app):
+    """
+    sends app.logger through a queue: the request thread only enqueues the
+    record, a QueueListener thread formats it and writes the file. the
+    logger is shared by every app with the same name, so the handler and
+    listener of a previous setup are stopped first.
+    """
+    for handler in list(app.logger.handlers):
+        if isinstance(handler, RecordQueueHandler):
+            app.logger.removeHandler(handler)
+            if handler.listener is not None:
+                handler.listener.stop()
+                atexit.unregister(handler.listener.stop)
+                for target in handler.listener.handlers:
+                    target.close()
+
+    log_queue = queue.Queue(-1)
+    queue_handler = RecordQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    file_handler = logging.FileHandler(app.config.get('LOG_FILE', 'error.log'))
+    file_handler.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    queue_handler.listener = listener
+
+    app.logger.setLevel(app.config.get('LOG_LEVEL', logging.INFO))
+    # flask's stderr handler would still format and write on the request thread
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(queue_handler)
+
+    if not event.contains(Engine, 'before_cursor_execute', _count_queries):
+        event.listen(Engine, 'before_cursor_execute', _count_queries)
+    app.before_request(_start_request)
+    app.after_request(lambda response: _log_request(app, response))
+    return listener
@@ -0,0 +1,125 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import abort, request
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Query, Session
+
+from models import Tenant
+
+# ----------------------------------------------------------------------------#
+# Tenant scoping.
+# ----------------------------------------------------------------------------#
+
+# None means unscoped: cli jobs (purge, rollups, partitions) see every tenant
+_current_tenant = ContextVar('current_tenant', default=None)
+_scoping_disabled = ContextVar('tenant_scoping_disabled', default=False)
+
+
+def current_tenant_id():
+    return _current_tenant.get()
+
+
+def set_tenant(tenant_id):
+    """ scopes the following queries to tenant_id, returns a token for reset_tenant """
+    return _current_tenant.set(tenant_id)
+
+
+def reset_tenant(token):
+    _current_tenant.reset(token)
+
+
+@contextmanager
+def unscoped():
+    """ queries inside see the rows of every tenant """
+    token = _scoping_disabled.set(True)
+    try:
+        yield
+    finally:
+        _scoping_disabled.reset(token)
+
+
+@event.listens_for(Query, 'before_compile', retval=True)
+def scope_query(query):
+    """ adds "tenant_id = current" for every queried entity that has a tenant """
+    tenant_id = _current_tenant.get()
+    if tenant_id is None or _scoping_disabled.get():
+        return query
+    for description in query.column_descriptions:
+        entity = description['entity']
+        columns = inspect(entity).mapper.columns if entity is not None else {}
+        if 'tenant_id' in columns:
+            condition = entity.tenant_id == tenant_id
+            if columns['tenant_id'].nullable:
+                # a null tenant marks rows every tenant reads, e.g. the change log rows of State
+                condition = or_(condition, entity.tenant_id.is_(None))
+            query = query.enable_assertions(False).filter(condition)
+    return query
+
+
+def _scope_bulk(query, context):
+    """ the same for query.update() and query.delete(), which never touch the shared rows """
+    tenant_id = _current_tenant.get()
+    if tenant_id is None or _scoping_disabled.get():
+        return query
+    if 'tenant_id' in context.mapper.columns:
+        query = query.enable_assertions(False).filter(context.mapper.class_.tenant_id == tenant_id)
+    return query
+
+
+event.listen(Query, 'before_compile_update', _scope_bulk, retval=True)
+event.listen(Query, 'before_compile_delete', _scope_bulk, retval=True)
+
+
+@event.listens_for(Session, 'before_flush')
+def assign_tenant(session, flush_context, instances):
+    tenant_id = _current_tenant.get()
+    if tenant_id is None:
+        return
+    for instance in session.new:
+        if getattr(instance, 'tenant_id', False) is None:
+            instance.tenant_id = tenant_id
+
+
+# ----------------------------------------------------------------------------#
+# Resolution.
+# ----------------------------------------------------------------------------#
+
+_tenants = {'loaded_at': 0, 'by_host': {}, 'by_slug': {}}
+
+
+def _lookup(host, slug, max_age):
+    if time.monotonic() - _tenants['loaded_at'] > max_age:
+        tenants = Tenant.query.all()
+        _tenants['by_host'] = {tenant.hostname: tenant.id for tenant in tenants if tenant.hostname}
+        _tenants['by_slug'] = {tenant.slug: tenant.id for tenant in tenants}
+        _tenants['loaded_at'] = time.monotonic()
+    if slug:
+        return _tenants['by_slug'].get(slug)
+    return _tenants['by_host'].get(host)
+
+
+def init_app(app):
+    """
+    resolves the tenant of every request from its host name (Tenant.hostname),
+    or from the X-Tenant header when TENANT_HEADER_TRUSTED is on, falling
+    back to DEFAULT_TENANT
+    """
+
+    @app.before_request
+    def resolve_tenant():
+        slug = request.headers.get('X-Tenant') if app.config.get('TENANT_HEADER_TRUSTED') else None
+        max_age = app.config.get('TENANT_CACHE_SECONDS', 60)
+        tenant_id = _lookup(request.host.split(':')[0], slug, max_age)
+        if tenant_id is None and not slug:
+            tenant_id = _lookup(None, app.config.get('DEFAULT_TENANT', 'default'), max_age)
+        if tenant_id is None:
+            abort(404)
+        request.environ['fyyur.tenant_token'] = set_tenant(tenant_id)
+
+    @app.teardown_request
+    def forget_tenant(exception=None):
+        token = request.environ.pop('fyyur.tenant_token', None)
+        if token is not None:
+            reset_tenant(token)
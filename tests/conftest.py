@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+# config.py reads DATABASE_URL on import; the app runs on sqlite in the tests
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import homefeed  # noqa: E402
+import listings  # noqa: E402
+import search_index  # noqa: E402
+import tenancy  # noqa: E402
+from app import create_app  # noqa: E402
+from models import State, City, Artist, Venue, Tenant, db  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app()
+    # the csrf token is left out of the posted forms, tests/test_forms.py checks it
+    app.config.update(TESTING=True, SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/fyyur.db',
+                      WTF_CSRF_ENABLED=False)
+    # the per worker caches would otherwise carry rows over from the previous test
+    homefeed.snapshots.clear()
+    listings.listings.clear()
+    listings.pending.clear()
+    search_index.indexes.clear()
+    tenancy._tenants['loaded_at'] = 0
+    with app.app_context():
+        db.create_all()
+        db.session.add(Tenant(slug='default', name='Default'))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def tenant(app):
+    return Tenant.query.filter_by(slug='default').one()
+
+
+@pytest.fixture
+def city(tenant):
+    city = City(name='San Francisco', state=State(name='CA'), tenant_id=tenant.id)
+    db.session.add(city)
+    db.session.commit()
+    return city
+
+
+@pytest.fixture
+def venue(city):
+    venue = Venue(name='The Musical Hop', genres=['Jazz'], city_id=city.id, address='1015 Folsom Street',
+                  phone='123-123-1234', tenant_id=city.tenant_id)
+    db.session.add(venue)
+    db.session.commit()
+    return venue
+
+
+@pytest.fixture
+def artist(city):
+    artist = Artist(name='Guns N Petals', genres=['Rock n Roll'], city_id=city.id, tenant_id=city.tenant_id)
+    db.session.add(artist)
+    db.session.commit()
+    return artist
@@ -0,0 +1,58 @@
+from datetime import date, datetime
+
+import analytics
+from models import Show, ShowRollup, db
+
+
+def counts(dimension):
+    return {
+        (rollup.key, rollup.month): rollup.show_count
+        for rollup in ShowRollup.query.filter_by(dimension=dimension)
+    }
+
+
+def add_show(venue, artist, start_time, show_id=None):
+    db.session.add(Show(id=show_id, venue_id=venue.id, artist_id=artist.id, start_time=start_time,
+                        tenant_id=venue.tenant_id))
+    db.session.commit()
+
+
+def test_shows_committed_with_a_lower_id_are_counted(venue, artist):
+    add_show(venue, artist, datetime(2030, 1, 5, 20), show_id=10)
+    analytics.refresh_rollups(settle_seconds=0)
+    add_show(venue, artist, datetime(2030, 1, 6, 20), show_id=3)
+    assert analytics.refresh_rollups(settle_seconds=0) == 1
+    assert counts('venue') == {(str(venue.id), date(2030, 1, 1)): 2}
+
+
+def test_moved_and_deleted_shows_are_recounted(venue, artist):
+    analytics.refresh_rollups(settle_seconds=0)
+    add_show(venue, artist, datetime(2030, 1, 5, 20))
+    add_show(venue, artist, datetime(2030, 1, 6, 20))
+    analytics.refresh_rollups(settle_seconds=0)
+
+    first, second = Show.query.order_by(Show.id).all()
+    first.start_time = datetime(2030, 2, 5, 20)
+    db.session.delete(second)
+    db.session.commit()
+    analytics.refresh_rollups(settle_seconds=0)
+    assert counts('artist') == {(str(artist.id), date(2030, 2, 1)): 1}
+
+
+def test_soft_deleted_venues_drop_out(venue, artist):
+    add_show(venue, artist, datetime(2030, 1, 5, 20))
+    analytics.refresh_rollups(settle_seconds=0)
+    assert counts('genre') == {('Rock n Roll', date(2030, 1, 1)): 1}
+
+    venue.deleted_at = datetime.now()
+    db.session.commit()
+    analytics.refresh_rollups(settle_seconds=0)
+    assert ShowRollup.query.count() == 0
+
+
+def test_forget_months(venue, artist):
+    add_show(venue, artist, datetime(2030, 1, 5, 20))
+    add_show(venue, artist, datetime(2030, 3, 5, 20))
+    analytics.rebuild_rollups(settle_seconds=0)
+    analytics.forget_months(date(2030, 2, 1))
+    assert counts('city') == {(str(venue.city_id), date(2030, 3, 1)): 1}
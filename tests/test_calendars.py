@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Show, ShowSeries, db
+
+
+@pytest.fixture
+def show(venue, artist):
+    start_time = datetime.now().replace(hour=20, minute=0, second=0, microsecond=0) + timedelta(days=10)
+    show = Show(venue_id=venue.id, artist_id=artist.id, start_time=start_time, tenant_id=venue.tenant_id)
+    db.session.add(show)
+    db.session.commit()
+    return show
+
+
+def test_the_feed_lists_the_shows(client, venue, show):
+    response = client.get(f'/venues/{venue.id}/calendar.ics')
+    assert response.mimetype == 'text/calendar'
+    body = response.get_data(as_text=True)
+    assert body.startswith('BEGIN:VCALENDAR\r\n')
+    assert 'X-WR-CALNAME:The Musical Hop shows on Fyyur\r\n' in body
+    assert f'UID:show-{show.id}@fyyur\r\n' in body
+    assert f"DTSTART:{show.start_time.strftime('%Y%m%dT%H%M%S')}\r\n" in body
+    assert 'SUMMARY:Guns N Petals at The Musical Hop\r\n' in body
+    assert body.endswith('END:VCALENDAR\r\n')
+
+
+def test_unchanged_feeds_are_not_sent_again(client, venue, show):
+    etag = client.get(f'/venues/{venue.id}/calendar.ics').headers['ETag']
+    assert client.get(f'/venues/{venue.id}/calendar.ics', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_moving_a_show_changes_the_etag(client, venue, artist, show):
+    # a later show keeps the max start time where it is
+    db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=show.start_time + timedelta(days=30),
+                        tenant_id=venue.tenant_id))
+    db.session.commit()
+    etag = client.get(f'/venues/{venue.id}/calendar.ics').headers['ETag']
+    show.start_time += timedelta(hours=1)
+    db.session.commit()
+    assert client.get(f'/venues/{venue.id}/calendar.ics').headers['ETag'] != etag
+
+
+def test_editing_a_series_changes_the_etag(client, venue, artist, show):
+    series = ShowSeries(venue_id=venue.id, artist_id=artist.id, start_time=show.start_time, frequency='WEEKLY',
+                        tenant_id=venue.tenant_id)
+    db.session.add(series)
+    db.session.commit()
+    etag = client.get(f'/venues/{venue.id}/calendar.ics').headers['ETag']
+    series.frequency = 'DAILY'
+    db.session.commit()
+    assert client.get(f'/venues/{venue.id}/calendar.ics').headers['ETag'] != etag
+
+
+def test_renaming_the_city_changes_the_etag(client, city, venue, show):
+    etag = client.get(f'/cities/{city.id}/calendar.ics').headers['ETag']
+    city.name = 'San Francisco Bay'
+    db.session.commit()
+    response = client.get(f'/cities/{city.id}/calendar.ics')
+    assert response.headers['ETag'] != etag
+    assert 'X-WR-CALNAME:San Francisco Bay shows on Fyyur' in response.get_data(as_text=True)
@@ -0,0 +1,14 @@
+from models import ChangeLog
+
+
+def test_serialized_changes_leave_out_actor(venue):
+    entry = ChangeLog.query.filter_by(table='Venue').one().serialize()
+    assert entry['operation'] == 'insert'
+    assert 'actor' not in entry
+
+
+def test_actor_ignores_forwarded_for(client, artist):
+    client.delete(f'/artists/{artist.id}', headers={'X-Forwarded-For': '203.0.113.9'},
+                  environ_base={'REMOTE_ADDR': '198.51.100.1'})
+    update = ChangeLog.query.filter_by(table='Artist', operation='update').one()
+    assert update.actor == '198.51.100.1'
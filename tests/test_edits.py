@@ -0,0 +1,63 @@
+import pytest
+from sqlalchemy import event
+
+from models import Artist, City, Venue, db
+
+
+def venue_form(venue, **fields):
+    return dict({
+        'name': venue.name, 'city': 'San Francisco', 'state': 'CA', 'address': venue.address,
+        'phone': venue.phone, 'genres': venue.genres, 'facebook_link': '', 'image_link': '',
+        'seeking_talent': 'No', 'seeking_description': '', 'version': venue.version,
+    }, **fields)
+
+
+def artist_form(artist, **fields):
+    return dict({
+        'name': artist.name, 'city': 'San Francisco', 'state': 'CA', 'phone': '', 'genres': artist.genres,
+        'facebook_link': '', 'website': '', 'image_link': '', 'available_from': 0, 'available_till': 23,
+        'seeking_venue': 'No', 'seeking_description': '', 'version': artist.version,
+    }, **fields)
+
+
+@pytest.fixture
+def saved_in_between(app):
+    """ bumps the version of an entity right before the edit is flushed, like a save from another worker """
+    def bump(model, entity_id):
+        def save(session, flush_context, instances):
+            with db.engine.begin() as connection:
+                connection.execute(model.__table__.update().where(model.id == entity_id).values(
+                    version=model.version + 1))
+        event.listen(db.session, 'before_flush', save, once=True)
+    return bump
+
+
+@pytest.mark.parametrize('kind, form', [('venue', venue_form), ('artist', artist_form)])
+def test_stale_edits_are_refused_before_a_city_is_created(client, venue, artist, kind, form):
+    entity = {'venue': venue, 'artist': artist}[kind]
+    response = client.post(f'/{kind}s/{entity.id}/edit', headers={'Accept': 'application/json'},
+                           data=form(entity, name='Renamed', city='Oakland', version=entity.version - 1))
+    assert response.status_code == 409
+    assert set(response.json['conflicts']) == {'name', 'city_id'}
+    assert City.query.filter_by(name='Oakland').count() == 0
+
+
+@pytest.mark.parametrize('kind, form', [('venue', venue_form), ('artist', artist_form)])
+def test_edits_saved_in_between_are_refused(client, venue, artist, saved_in_between, kind, form):
+    entity = {'venue': venue, 'artist': artist}[kind]
+    model = {'venue': Venue, 'artist': Artist}[kind]
+    version = entity.version
+    saved_in_between(model, entity.id)
+    response = client.post(f'/{kind}s/{entity.id}/edit', headers={'Accept': 'application/json'},
+                           data=form(entity, name='Renamed', city='Oakland'))
+    assert response.status_code == 409
+    assert response.json['version'] == version + 1
+    assert City.query.filter_by(name='Oakland').count() == 0
+    assert model.query.get(entity.id).name != 'Renamed'
+
+
+def test_current_edits_are_saved(client, venue):
+    response = client.post(f'/venues/{venue.id}/edit', data=venue_form(venue, name='Renamed', city='Oakland'))
+    assert response.status_code == 302
+    assert Venue.query.get(venue.id).name == 'Renamed'
+    assert City.query.get(Venue.query.get(venue.id).city_id).name == 'Oakland'
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from models import Show, db
+
+
+def test_create_show_on_sqlite(client, venue, artist):
+    response = client.post('/shows/create', data={
+        'artist_id': artist.id,
+        'venue_id': venue.id,
+        'start_time': '2030-01-05 20:00:00',
+    })
+    assert response.status_code == 302
+    show = Show.query.one()
+    assert show.id == 1
+    assert show.start_time == datetime(2030, 1, 5, 20, 0)
+
+
+def test_create_show_rejects_invalid_start_time(client, venue, artist):
+    response = client.post('/shows/create', data={
+        'artist_id': artist.id,
+        'venue_id': venue.id,
+        'start_time': 'tomorrow',
+    })
+    assert response.status_code == 400
+    assert Show.query.count() == 0
+
+
+def test_bulk_shows_get_ids_on_sqlite(client, venue, artist):
+    response = client.post('/shows/bulk', json={'shows': [
+        {'artist_id': artist.id, 'venue_id': venue.id, 'start_time': '2030-01-05 20:00:00'},
+        {'artist_id': artist.id, 'venue_id': venue.id, 'start_time': '2030-01-06 20:00:00'},
+    ]})
+    assert response.status_code == 201
+    assert [show.id for show in Show.query.order_by(Show.id)] == [1, 2]
+
+
+def test_show_ids_are_allocated_under_the_write_lock(app, venue, artist):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, 5, 20),
+                            tenant_id=venue.tenant_id))
+        db.session.commit()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    # the update takes the lock before max(id) is read, no other worker can read it in between
+    assert [statement for statement in statements if '"Show"' in statement][0].startswith(
+        'UPDATE "ShowIdCounter"')
+
+
+def test_show_ids_are_unique_on_sqlite(app, venue, artist):
+    for day in (5, 6):
+        db.session.add(Show(id=7, venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, day, 20),
+                            tenant_id=venue.tenant_id))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+    # ids inserted as they are move the counter past them
+    db.session.add(Show(id=7, venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, 5, 20),
+                        tenant_id=venue.tenant_id))
+    db.session.commit()
+    db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, 6, 20),
+                        tenant_id=venue.tenant_id))
+    db.session.commit()
+    assert sorted(show.id for show in Show.query) == [7, 8]
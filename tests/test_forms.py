@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from models import Artist, Show, db
+
+
+def post_show(client, **fields):
+    return client.post('/shows/create', data=dict({'start_time': '2030-01-05 20:00'}, **fields))
+
+
+def test_lookups_are_confirmed_in_the_database(client, venue, artist):
+    # the index of this worker still has the artist another worker deleted
+    assert client.get('/autocomplete?q=guns&type=artist').json['data']
+    db.session.execute(Artist.__table__.update().where(Artist.id == artist.id).values(deleted_at=datetime.now()))
+    db.session.commit()
+    assert client.get('/autocomplete?q=guns&type=artist').json['data']
+
+    response = post_show(client, artist_id=artist.id, venue_id=venue.id)
+    assert response.status_code == 400
+    assert f'There is no artist with id {artist.id}'.encode() in response.data
+    assert Show.query.count() == 0
+
+
+def test_shows_need_a_start_time(client, venue, artist):
+    response = post_show(client, artist_id=artist.id, venue_id=venue.id, start_time='')
+    assert response.status_code == 400
+    assert Show.query.count() == 0
+
+
+def test_shows_need_the_csrf_token(app, client, venue, artist):
+    app.config['WTF_CSRF_ENABLED'] = True
+    response = post_show(client, artist_id=artist.id, venue_id=venue.id)
+    assert response.status_code == 400
+    assert Show.query.count() == 0
+
+
+def test_deleted_artists_are_never_available(app, venue, artist):
+    show = Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, 5, 20))
+    assert show.valid_time()
+    artist.deleted_at = datetime.now()
+    db.session.commit()
+    assert not show.valid_time()
@@ -0,0 +1,11 @@
+def test_home_lists_venues_and_artists(client, venue, artist):
+    response = client.get('/')
+    assert response.status_code == 200
+    assert b'The Musical Hop' in response.data
+    assert b'Guns N Petals' in response.data
+
+
+def test_home_feed_pages(client, venue):
+    response = client.get('/api/home/venues?page=1&per_page=5')
+    assert response.status_code == 200
+    assert response.get_json()['data'] == [{'id': venue.id, 'name': 'The Musical Hop', 'city': 'San Francisco'}]
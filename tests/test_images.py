@@ -0,0 +1,105 @@
+import io
+import threading
+from datetime import datetime
+
+import pytest
+from PIL import Image
+
+import images
+from models import Show, db
+
+
+@pytest.fixture
+def origin(app, tmp_path):
+    folder = tmp_path / 'origin'
+    folder.mkdir()
+    output = io.BytesIO()
+    Image.new('RGB', (800, 600), 'red').save(output, 'JPEG')
+    (folder / 'hop.jpg').write_bytes(output.getvalue())
+    app.config.update(IMAGE_STUB_ORIGIN=str(folder), IMAGE_CACHE_DIR=str(tmp_path / 'cache'))
+    images.cache_size.update(bytes=None, counted_at=0)
+    return folder
+
+
+def test_thumbnails_of_soft_deleted_venues_are_gone(client, origin, venue):
+    venue.image_link = 'https://images.example.com/hop.jpg'
+    db.session.commit()
+    assert client.get(f'/images/venue/{venue.id}/thumb').status_code == 200
+    venue.deleted_at = datetime.now()
+    db.session.commit()
+    assert client.get(f'/images/venue/{venue.id}/thumb').status_code == 404
+
+
+def test_failed_images_get_a_placeholder_not_a_redirect(client, origin, venue):
+    venue.image_link = 'https://images.example.com/missing.jpg'
+    db.session.commit()
+    response = client.get(f'/images/venue/{venue.id}/thumb')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/svg+xml'
+
+
+def test_failed_fetches_are_not_retried_for_a_while(app, client, origin, venue, monkeypatch):
+    fetches = []
+    fetch_original = images.fetch_original
+    monkeypatch.setattr(images, 'fetch_original', lambda url: fetches.append(url) or fetch_original(url))
+    venue.image_link = 'https://images.example.com/missing.jpg'
+    db.session.commit()
+    for _ in range(2):
+        assert client.get(f'/images/venue/{venue.id}/thumb').mimetype == 'image/svg+xml'
+    assert len(fetches) == 1
+    app.config['IMAGE_FAILURE_SECONDS'] = 0
+    client.get(f'/images/venue/{venue.id}/thumb')
+    assert len(fetches) == 2
+
+
+def test_threads_resizing_the_same_image_do_not_share_a_temporary_file(app, origin, monkeypatch):
+    errors = []
+    # every thread has resized before any of them writes
+    together = threading.Barrier(8)
+    resize = images.resize
+    monkeypatch.setattr(images, 'resize', lambda data, size: (resize(data, size), together.wait())[0])
+
+    def thumbnail():
+        with app.test_request_context():
+            try:
+                images.thumbnail('https://images.example.com/hop.jpg', 'thumb')
+            except Exception as error:
+                errors.append(error)
+
+    threads = [threading.Thread(target=thumbnail) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert [path for path in (origin.parent / 'cache').rglob('*') if path.suffix == '.tmp'] == []
+
+
+@pytest.mark.parametrize('address', ['127.0.0.1', '10.0.0.8', '169.254.169.254', '::1', '::ffff:192.168.0.1'])
+def test_private_addresses_are_refused(address):
+    assert not images.is_public(address)
+    with pytest.raises(ValueError):
+        images.public_connection((address, 80), timeout=1)
+
+
+def test_the_cache_is_counted_once_and_evicted_when_full(app, origin, monkeypatch):
+    walks = []
+    entries = images._cache_entries
+    monkeypatch.setattr(images, '_cache_entries', lambda: walks.append(1) or entries())
+    app.config['IMAGE_CACHE_MAX_BYTES'] = 10 ** 9
+    with app.test_request_context():
+        for index in range(3):
+            images.thumbnail(f'https://images.example.com/hop.jpg?{index}', 'thumb')
+        assert len(walks) == 1
+        app.config['IMAGE_CACHE_MAX_BYTES'] = images.cache_size['bytes'] // 2
+        images.thumbnail('https://images.example.com/hop.jpg?3', 'thumb')
+    assert len(walks) == 2
+    assert images.cache_size['bytes'] <= app.config['IMAGE_CACHE_MAX_BYTES']
+
+
+def test_artist_pages_link_the_venue_thumbnails(client, venue, artist):
+    db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, 5, 20),
+                        tenant_id=venue.tenant_id))
+    db.session.commit()
+    response = client.get(f'/artists/{artist.id}')
+    assert f'/images/venue/{venue.id}/thumb'.encode() in response.data
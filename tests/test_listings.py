@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import listings
+from models import State, Show, db
+from tenancy import reset_tenant, set_tenant
+
+
+def current(app, tenant):
+    with app.test_request_context():
+        token = set_tenant(tenant.id)
+        try:
+            return listings.current()
+        finally:
+            reset_tenant(token)
+
+
+def test_soft_deleted_artists_are_not_counted_for_their_venues(app, tenant, venue, artist):
+    db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, 5, 20),
+                        tenant_id=tenant.id))
+    db.session.commit()
+    assert current(app, tenant).venues[venue.id].num_upcoming_shows == 1
+
+    artist.deleted_at = datetime.now()
+    db.session.commit()
+    listing = current(app, tenant)
+    assert artist.id not in listing.artists
+    assert listing.venues[venue.id].num_upcoming_shows == 0
+
+
+def test_renamed_states_from_other_workers_rebuild_the_listing(app, tenant, venue):
+    app.config.update(LISTINGS_CHECK_SECONDS=0, LISTINGS_SETTLE_SECONDS=0)
+    assert current(app, tenant).cities[venue.city_id].state == 'CA'
+
+    # another worker's commit, seen only through the change log
+    state = State.query.one()
+    state.name = 'California'
+    db.session.commit()
+    listings.pending.clear()
+    for listing in listings.listings.values():
+        listing.stale = False
+    assert current(app, tenant).cities[venue.city_id].state == 'California'
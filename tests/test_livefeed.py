@@ -0,0 +1,65 @@
+import pytest
+
+import livefeed
+
+
+class Stop(Exception):
+    pass
+
+
+class FakeConnection:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_streams_over_the_limit_are_refused(app, client, tenant):
+    app.config['LIVE_MAX_STREAMS'] = 1
+    first = client.get('/shows/stream', buffered=False)
+    try:
+        assert first.status_code == 200
+        assert client.get('/shows/stream').status_code == 503
+    finally:
+        first.close()
+    assert not livefeed.hub.subscriptions
+
+
+def test_streams_leave_threads_for_the_pages():
+    import config
+    from tests.test_warmup import gunicorn_config
+    assert gunicorn_config().threads == config.WEB_THREADS
+    assert config.LIVE_MAX_STREAMS < config.WEB_THREADS
+
+
+def test_listings_offer_live_notices_only_when_streams_are_allowed(app, client, tenant):
+    assert b'data-live-shows' in client.get('/shows').data
+    app.config['LIVE_MAX_STREAMS'] = 0
+    assert b'data-live-shows' not in client.get('/shows').data
+
+
+def test_reconnecting_closes_the_old_connection_and_resets_the_clients(monkeypatch):
+    connections = []
+    subscription = livefeed.Subscription(tenant_id=1)
+    livefeed.hub.subscribe(subscription)
+    listener = livefeed.PostgresListener(engine=None)
+    monkeypatch.setattr(listener, 'listen', lambda: connections.append(FakeConnection()) or connections[-1])
+
+    def dropped(*args):
+        raise OSError('connection lost')
+
+    def sleep(seconds):
+        if len(connections) == 2:
+            raise Stop()
+    monkeypatch.setattr(livefeed.select, 'select', dropped)
+    monkeypatch.setattr(livefeed.time, 'sleep', sleep)
+    try:
+        with pytest.raises(Stop):
+            listener.run()
+        assert [connection.closed for connection in connections] == [True, True]
+        assert subscription.overflowed
+        body = livefeed.stream(subscription, heartbeat_seconds=0.01)
+        assert next(body) == 'retry: 5000\n\n'
+        assert next(body) == 'event: reset\ndata: {}\n\n'
+    finally:
+        livefeed.hub.unsubscribe(subscription)
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from models import Artist, Show, db
+
+
+def test_shows_of_soft_deleted_artists_are_not_counted_or_listed(app, venue, artist):
+    other = Artist(name='The Wild Sax Band', genres=['Jazz'], city_id=venue.city_id, tenant_id=venue.tenant_id)
+    db.session.add(other)
+    db.session.flush()
+    for show_artist in (artist, other):
+        db.session.add(Show(venue_id=venue.id, artist_id=show_artist.id, start_time=datetime(2030, 1, 5, 20),
+                            tenant_id=venue.tenant_id))
+    other.deleted_at = datetime.now()
+    db.session.commit()
+
+    with app.test_request_context():
+        assert venue.num_upcoming_shows() == 1
+        details = venue.serialize_details()
+    assert details["upcoming_shows_count"] == 1
+    assert [show["artist_id"] for show in details["upcoming_shows"]] == [artist.id]
+
+
+def test_shows_at_soft_deleted_venues_are_not_listed(app, venue, artist):
+    db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2020, 1, 5, 20),
+                        tenant_id=venue.tenant_id))
+    venue.deleted_at = datetime.now()
+    db.session.commit()
+
+    with app.test_request_context():
+        details = artist.serialize_details()
+    assert details["past_shows"] == []
+    assert details["past_shows_count"] == 0
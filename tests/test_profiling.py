@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+from flask import g
+
+import profiling
+from app import create_app
+from models import db
+
+
+def profiled_app(app, **config):
+    return create_app(SimpleNamespace(**dict(app.config, PROFILING_ENABLED=True, **config)))
+
+
+def test_profiling_stays_off_without_a_token(app, tmp_path):
+    unprotected = profiled_app(app, PROFILING_TOKEN=None, PROFILING_DIR=str(tmp_path / 'profiles'))
+    response = unprotected.test_client().get('/?profile=1')
+    assert 'X-Profile-Id' not in response.headers
+    assert not (tmp_path / 'profiles').exists()
+
+
+def test_profiles_need_the_token_and_only_the_newest_are_kept(app, tmp_path):
+    profiled = profiled_app(app, PROFILING_TOKEN='secret', PROFILING_DIR=str(tmp_path), PROFILING_MAX_PROFILES=2)
+    client = profiled.test_client()
+    assert 'X-Profile-Id' not in client.get('/?profile=1').headers
+    ids = [client.get('/?profile=1', headers={'X-Profile-Token': 'secret'}).headers['X-Profile-Id']
+           for _ in range(3)]
+    assert sorted(path.stem for path in tmp_path.glob('*.json')) == sorted(ids[1:])
+
+    with profiled.test_request_context('/'):
+        g.profile = profiling.RequestProfile('GET /', with_cprofile=False)
+        with pytest.raises(Exception):
+            db.session.execute('SELECT * FROM no_such_table')
+        # the failed statement's span is closed, not left open under the next ones
+        assert g.profile.stack == [g.profile.root]
+        assert g.profile.root.children[-1].ms is not None
+
+
+def test_serializers_are_wrapped_once_however_many_apps_profile(app, tmp_path):
+    for _ in range(2):
+        profiled_app(app, PROFILING_TOKEN='secret', PROFILING_DIR=str(tmp_path / 'profiles'))
+    for model, methods in profiling.SERIALIZERS:
+        for method in methods:
+            raw = model.__dict__[method]
+            wrapper = raw.__func__ if isinstance(raw, classmethod) else raw
+            assert wrapper._profiled
+            assert not getattr(wrapper.__wrapped__, '_profiled', False)
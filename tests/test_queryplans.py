@@ -0,0 +1,24 @@
+from datetime import datetime
+
+import queryplans
+from models import Show, db
+from seed import seed
+
+
+def test_route_cases_are_measured_with_empty_caches(app, venue, artist):
+    db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, 5, 20),
+                        tenant_id=venue.tenant_id))
+    db.session.commit()
+    results = queryplans.run(app, only={'GET /venues', 'GET /'})
+    # served from the listing and the home feed snapshot if they were left warm
+    assert results['GET /venues']['statements'] > 0
+    assert results['GET /']['statements'] > 0
+    assert not app.config.get('TENANT_HEADER_TRUSTED')
+
+
+def test_the_watched_plans_match_the_sqlite_baseline(app):
+    # the dataset the sqlite section of QUERY_PLAN_BASELINES was recorded on, see config.py
+    seed(cities=20, venues=100, artists=400, shows=3000, today=datetime(2026, 1, 1))
+    results = queryplans.run(app)
+    changed = queryplans.compare(queryplans.load_baselines(queryplans.default_path(), 'sqlite'), results)
+    assert not changed, '\n\n'.join(f'{name} changed\n{diff}' for name, diff in changed.items())
@@ -0,0 +1,71 @@
+import sqlite3
+from types import SimpleNamespace
+
+from app import create_app
+from ratelimit import MemoryBucketStore, SqliteBucketStore, client_id
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(app):
+    with app.test_request_context('/', headers={'X-Forwarded-For': '203.0.113.9'},
+                                  environ_base={'REMOTE_ADDR': '198.51.100.1'}):
+        assert client_id() == '198.51.100.1'
+
+
+def test_forwarded_for_from_trusted_proxy(app):
+    proxied = create_app(SimpleNamespace(**dict(app.config, PROXY_FIX_X_FOR=1)))
+    seen = {}
+
+    @proxied.before_request
+    def remember():
+        seen['client'] = client_id()
+
+    # the first address is made up by the client, the last one was added by the proxy
+    proxied.test_client().get('/', headers={'X-Forwarded-For': '10.0.0.1, 203.0.113.9'},
+                              environ_base={'REMOTE_ADDR': '198.51.100.1'})
+    assert seen['client'] == '203.0.113.9'
+
+
+def test_memory_store_limits_and_refills():
+    store = MemoryBucketStore()
+    assert store.take('search:a', 1, 2, 0) == 0
+    assert store.take('search:a', 1, 2, 0) == 0
+    assert store.take('search:a', 1, 2, 0) == 1
+    assert store.take('search:a', 1, 2, 1) == 0
+
+
+def test_memory_store_drops_refilled_buckets():
+    store = MemoryBucketStore(sweep_seconds=10)
+    for client in range(100):
+        store.take(f'search:{client}', 1, 5, 0)
+    store.take('search:late', 1, 5, 60)
+    assert list(store.buckets) == ['search:late']
+
+
+def test_memory_store_is_bounded():
+    store = MemoryBucketStore(max_buckets=10)
+    for client in range(100):
+        store.take(f'search:{client}', 0.001, 5, 0)
+    assert len(store.buckets) <= 10
+
+
+def test_sqlite_store_fails_open_when_locked(tmp_path):
+    path = str(tmp_path / 'buckets.db')
+    store = SqliteBucketStore(path, timeout=0.01)
+    assert store.take('search:a', 1, 1, 0) == 0
+    assert store.take('search:a', 1, 1, 0) == 1
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute('BEGIN IMMEDIATE')
+    try:
+        assert store.take('search:a', 1, 1, 0) == 0
+    finally:
+        blocker.execute('ROLLBACK')
+
+
+def test_sqlite_store_deletes_refilled_buckets(tmp_path):
+    path = str(tmp_path / 'buckets.db')
+    store = SqliteBucketStore(path, sweep_seconds=10)
+    for client in range(10):
+        store.take(f'search:{client}', 1, 5, 0)
+    store.take('search:late', 1, 5, 60)
+    keys = [key for key, in sqlite3.connect(path).execute('SELECT key FROM token_buckets')]
+    assert keys == ['search:late']
@@ -0,0 +1,73 @@
+from models import Show, Tenant, Venue, db
+
+
+def test_bulk_books_the_valid_rows(client, venue, artist):
+    response = client.post('/shows/bulk', json={'shows': [
+        {'artist_id': artist.id, 'venue_id': venue.id, 'start_time': '2030-01-05 20:00:00'},
+        # the same artist and venue at the same time, rejected against the row above
+        {'artist_id': artist.id, 'venue_id': venue.id, 'start_time': '2030-01-05 20:00:00'},
+        {'artist_id': artist.id, 'venue_id': venue.id + 1, 'start_time': '2030-01-06 20:00:00'},
+        {'artist_id': artist.id, 'venue_id': venue.id, 'start_time': 'tomorrow'},
+    ]})
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['created'] == 1
+    assert [error['row'] for error in body['errors']] == [1, 2, 3]
+    assert f'venue {venue.id + 1} does not exist' in body['errors'][1]['errors']
+    assert Show.query.count() == 1
+
+
+def test_bulk_checks_the_artist_hours(client, venue, artist):
+    artist.available_from, artist.available_till = 18, 23
+    db.session.commit()
+    response = client.post('/shows/bulk', json={'shows': [
+        {'artist_id': artist.id, 'venue_id': venue.id, 'start_time': '2030-01-05 10:00:00'},
+    ]})
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == [
+        {'row': 0, 'errors': [f'artist {artist.id} is not available at 10:00']}]
+
+
+def test_bulk_books_artists_without_hours(client, venue, artist):
+    artist.available_from = artist.available_till = None
+    db.session.commit()
+    response = client.post('/shows/bulk', json={'shows': [
+        {'artist_id': artist.id, 'venue_id': venue.id, 'start_time': '2030-01-05 10:00:00'},
+    ]})
+    assert response.status_code == 201
+    assert Show.query.one().valid_time()
+
+
+def test_bulk_rejects_a_missing_list(client, venue, artist):
+    assert client.post('/shows/bulk', json={'shows': 'none'}).status_code == 400
+    assert client.post('/shows/bulk', data='not json').status_code == 400
+
+
+def test_bulk_does_not_see_other_tenants_venues(client, venue, artist):
+    tenant = Tenant(slug='other', name='Other')
+    db.session.add(tenant)
+    db.session.flush()
+    other = Venue(name='Park Square Live Music & Coffee', genres=['Jazz'], city_id=venue.city_id,
+                  address='34 Whiskey Moore Ave', phone='415-000-1234', tenant_id=tenant.id)
+    db.session.add(other)
+    db.session.commit()
+    response = client.post('/shows/bulk', json={'shows': [
+        {'artist_id': artist.id, 'venue_id': other.id, 'start_time': '2030-01-05 20:00:00'},
+    ]})
+    # the request is scoped to the default tenant, so the other venue is not found
+    assert response.status_code == 400
+    assert response.get_json()['errors'][0]['errors'] == [f'venue {other.id} does not exist']
+
+
+def test_schedule_shows_command(app, tmp_path, venue, artist):
+    # the command runs in its own app context, which detaches the fixtures when it ends
+    artist_id, venue_id = artist.id, venue.id
+    csv_file = tmp_path / 'shows.csv'
+    csv_file.write_text('artist_id,venue_id,start_time\n'
+                        f'{artist_id},{venue_id},2030-01-05 20:00:00\n'
+                        f'{artist_id + 1},{venue_id},2030-01-06 20:00:00\n')
+    result = app.test_cli_runner(mix_stderr=False).invoke(args=['schedule-shows', str(csv_file)])
+    assert result.exit_code == 0, result.output
+    assert result.output == 'created 1 shows, rejected 1\n'
+    assert result.stderr == f'line 3: artist {artist_id + 1} does not exist\n'
+    assert [(show.artist_id, show.venue_id) for show in Show.query] == [(artist_id, venue_id)]
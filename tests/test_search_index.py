@@ -0,0 +1,45 @@
+import warnings
+
+from sqlalchemy.exc import SAWarning
+
+from models import City, db
+from search_index import PrefixIndex
+
+
+def test_updates_swap_in_new_arrays():
+    index = PrefixIndex()
+    index.load({('venue', 1): 'The Musical Hop'})
+    venues = index.terms['venue']
+    index.apply([(('artist', 2), 'The Wild Sax Band'), (('venue', 1), None)])
+    # a lookup still iterating the old array sees it unchanged
+    assert venues == [('hop', 1), ('musical hop', 1), ('the musical hop', 1)]
+    assert [entry["label"] for entry in index.lookup('the')] == ['The Wild Sax Band']
+
+
+def test_lookups_of_one_kind_are_not_crowded_out_by_another():
+    index = PrefixIndex()
+    index.load({('city', city_id): f'Springfield {city_id}' for city_id in range(1000)})
+    index.apply([(('venue', 1), 'Springfield Arena')])
+    cities = index.terms['city']
+    # each kind has its own array, a thousand cities do not hide the venue
+    assert index.lookup('springfield', limit=5, kinds={'venue'}) == [
+        {"type": 'venue', "id": 1, "label": 'Springfield Arena'}]
+    assert len(index.lookup('springfield', limit=5)) == 5
+    # the cities were not touched, so their array is not copied
+    assert index.terms['city'] is cities
+
+
+def test_renamed_states_relabel_their_cities(client, city):
+    assert client.get('/autocomplete?q=san&type=city').json['data'][0]['label'] == 'San Francisco, CA'
+    city.state.name = 'California'
+    db.session.commit()
+    assert client.get('/autocomplete?q=san&type=city').json['data'][0]['label'] == 'San Francisco, California'
+
+
+def test_new_cities_of_a_known_state_are_indexed_without_reloading_it(client, city):
+    client.get('/autocomplete?q=oak')
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', SAWarning)
+        db.session.add(City(name='Oakland', state=city.state, tenant_id=city.tenant_id))
+        db.session.commit()
+    assert client.get('/autocomplete?q=oak&type=city').json['data'][0]['label'] == 'Oakland, CA'
@@ -0,0 +1,43 @@
+import atexit
+import json
+
+import pytest
+from flask.logging import default_handler
+
+from structured_logging import RecordQueueHandler, setup_logging
+
+
+@pytest.fixture
+def logged_app(app, tmp_path):
+    app.config['LOG_FILE'] = str(tmp_path / 'app.log')
+    yield app
+    # app.logger is shared by every app named "app"
+    for handler in list(app.logger.handlers):
+        if isinstance(handler, RecordQueueHandler):
+            app.logger.removeHandler(handler)
+            handler.listener.stop()
+            atexit.unregister(handler.listener.stop)
+    app.logger.addHandler(default_handler)
+
+
+def test_records_are_written_as_json_with_the_traceback(logged_app, tmp_path):
+    listener = setup_logging(logged_app)
+    assert default_handler not in logged_app.logger.handlers
+    try:
+        raise ValueError('broken')
+    except ValueError:
+        logged_app.logger.exception('failed %s', 'here', extra={"venue_id": 7})
+    listener.queue.join()
+
+    entry = json.loads((tmp_path / 'app.log').read_text())
+    assert entry["message"] == 'failed here'
+    assert entry["venue_id"] == 7
+    assert 'ValueError: broken' in entry["exception"]
+
+
+def test_setting_up_again_replaces_the_handler_and_listener(logged_app):
+    first = setup_logging(logged_app)
+    second = setup_logging(logged_app)
+    handlers = [handler for handler in logged_app.logger.handlers if isinstance(handler, RecordQueueHandler)]
+    assert [handler.listener for handler in handlers] == [second]
+    assert first._thread is None
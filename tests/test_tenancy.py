@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import changes
+import purge
+from models import State, City, Artist, Venue, Show, Tenant, db
+from scheduling import schedule_shows
+from tenancy import reset_tenant, set_tenant
+
+
+def other_tenant():
+    tenant = Tenant(slug='other', name='Other')
+    db.session.add(tenant)
+    db.session.flush()
+    city = City(name='Portland', state=State(name='OR'), tenant_id=tenant.id)
+    db.session.add(city)
+    db.session.flush()
+    venue = Venue(name='Doug Fir', city_id=city.id, address='830 E Burnside St', phone='503-231-9663',
+                  tenant_id=tenant.id)
+    db.session.add(venue)
+    db.session.commit()
+    return venue
+
+
+def test_shared_change_rows_are_in_every_tenants_scope(tenant):
+    db.session.add(State(name='WA'))
+    db.session.commit()
+    token = set_tenant(tenant.id)
+    try:
+        data, _ = changes.feed(tables=['State'], settle_seconds=0)
+    finally:
+        reset_tenant(token)
+    assert [change["changes"]["name"] for change in data] == ['WA']
+
+
+def test_bulk_scheduling_keeps_shows_inside_one_tenant(artist):
+    venue = other_tenant()
+    created, errors = schedule_shows([
+        {'artist_id': artist.id, 'venue_id': venue.id, 'start_time': '2030-01-05 20:00:00'}])
+    assert created == 0
+    assert errors == [{'row': 0, 'errors': [
+        f'artist {artist.id} and venue {venue.id} belong to different tenants']}]
+
+
+def test_purge_deletes_only_the_deleted_venues_shows(venue, artist):
+    db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=datetime(2030, 1, 5, 20),
+                        tenant_id=venue.tenant_id))
+    venue.deleted_at = datetime(2020, 1, 1)
+    db.session.commit()
+    assert purge.purge_deleted() == {"venues": 1, "artists": 0, "shows": 1}
+    assert Show.query.count() == 0
+    assert Artist.query.count() == 1
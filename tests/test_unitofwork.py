@@ -0,0 +1,36 @@
+import pytest
+from sqlalchemy.exc import DataError, IntegrityError, OperationalError, ProgrammingError, StatementError
+from sqlalchemy.orm.exc import StaleDataError
+
+from models import City
+from unitofwork import error_status
+
+
+@pytest.mark.parametrize('error, status', [
+    (StaleDataError(), 409),
+    (IntegrityError('INSERT', {}, Exception('duplicate key')), 409),
+    (DataError('INSERT', {}, Exception('value too long')), 400),
+    (StatementError('bad value', 'INSERT', {}, TypeError('expected datetime')), 400),
+    (ValueError('invalid start_time'), 400),
+])
+def test_client_errors(error, status):
+    assert error_status(error)[0] == status
+
+
+@pytest.mark.parametrize('error', [
+    OperationalError('SELECT', {}, Exception('server closed the connection')),
+    ProgrammingError('SELECT', {}, Exception('relation does not exist')),
+    StatementError('lost', 'SELECT', {}, RuntimeError('pool exhausted')),
+    KeyError('name'),
+])
+def test_server_errors_are_not_mapped(error):
+    assert error_status(error) is None
+
+
+def test_a_failed_create_leaves_no_new_city(app, client, tenant):
+    app.config['TRAP_BAD_REQUEST_ERRORS'] = False
+    # no address: the venue fails after its city was flushed, both are rolled back
+    response = client.post('/venues/create', data={'name': 'The Dueling Pianos Bar', 'city': 'New York',
+                                                   'state': 'NY', 'phone': '+1 914-003-1132'})
+    assert response.status_code == 400
+    assert City.query.count() == 0
@@ -0,0 +1,25 @@
+import importlib.util
+import os
+from types import SimpleNamespace
+
+import homefeed
+
+
+def gunicorn_config():
+    path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'gunicorn.conf.py')
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_each_worker_warms_itself_after_loading_the_app(app, tenant):
+    app.config.update(WARMUP_URLS=['/'], WARMUP_ACCESS_LOG=None)
+    gunicorn_config().post_worker_init(SimpleNamespace(wsgi=app))
+    assert tenant.id in homefeed.snapshots
+
+
+def test_warming_on_boot_can_be_turned_off(app, tenant):
+    app.config.update(WARMUP_URLS=['/'], WARMUP_ACCESS_LOG=None, WARMUP_ON_BOOT=False)
+    gunicorn_config().post_worker_init(SimpleNamespace(wsgi=app))
+    assert not homefeed.snapshots
@@ -0,0 +1,44 @@
+from contextlib import contextmanager
+
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
+from sqlalchemy.orm.exc import StaleDataError
+
+from models import db
+
+# ----------------------------------------------------------------------------#
+# Unit of work.
+# ----------------------------------------------------------------------------#
+
+# write failures the client can do something about, most specific first.
+# any other database error (lost connection, lock timeout, bad sql) is ours
+ERROR_STATUS = (
+    (StaleDataError, 409, 'it was changed by someone else in the meantime'),
+    (IntegrityError, 409, 'it conflicts with existing data'),
+    (DataError, 400, 'a value is invalid or too long'),
+    ((ValueError, TypeError), 400, 'a value is invalid'),
+)
+
+
+@contextmanager
+def unit_of_work():
+    """
+    one transaction for everything a request writes: helpers inside only
+    flush, the block commits once at the end or rolls back as a whole
+    """
+    try:
+        yield db.session
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def error_status(error):
+    """ (status, reason) for a failed write, or None when it is a server error """
+    if isinstance(error, StatementError) and not isinstance(error, DBAPIError):
+        # a type processor refused a value, sqlalchemy wraps what it raised
+        error = error.orig
+    for error_type, status, reason in ERROR_STATUS:
+        if isinstance(error, error_type):
+            return status, reason
+    return None
@@ -0,0 +1,75 @@
+import re
+import time
+from collections import Counter
+from urllib.request import urlopen
+
+# ----------------------------------------------------------------------------#
+# Cache warming.
+# ----------------------------------------------------------------------------#
+
+# matches the request line of common/combined access log formats,
+# e.g. "GET /venues/1 HTTP/1.1" 200
+ACCESS_LOG_LINE = re.compile(r'"GET (?P<path>/\S*) HTTP/[\d.]+" (?P<status>\d{3})')
+
+
+def top_urls_from_log(log_path, limit=20):
+    """ returns the most requested successful GET paths in an access log """
+    hits = Counter()
+    with open(log_path, encoding='utf-8', errors='replace') as log_file:
+        for line in log_file:
+            match = ACCESS_LOG_LINE.search(line)
+            if match and match.group('status').startswith('2'):
+                path = match.group('path')
+                # static files are served as-is and need no warming
+                if not path.startswith('/static/'):
+                    hits[path] += 1
+    return [path for path, _ in hits.most_common(limit)]
+
+
+def warm_urls(app, urls, base_url=None):
+    """
+    requests every url once, either in-process through the test client
+    or against a running deployment when base_url is given.
+    returns a list of (url, status, seconds) and the total time-to-warm.
+    """
+    results = []
+    started = time.perf_counter()
+    client = None if base_url else app.test_client()
+    for url in urls:
+        url_started = time.perf_counter()
+        try:
+            if client is not None:
+                status = client.get(url).status_code
+            else:
+                with urlopen(base_url.rstrip('/') + url) as response:
+                    response.read()
+                    status = response.status
+        except Exception as e:
+            status = getattr(e, 'code', None) or type(e).__name__
+        results.append((url, status, time.perf_counter() - url_started))
+    return results, time.perf_counter() - started
+
+
+def warm_up(app, limit=None, log_path=None, base_url=None):
+    """ resolves the urls to warm from the access log or config and warms them """
+    limit = limit or app.config.get('WARMUP_LIMIT', 20)
+    log_path = log_path or app.config.get('WARMUP_ACCESS_LOG')
+    urls = []
+    if log_path:
+        urls = top_urls_from_log(log_path, limit)
+    if not urls:
+        urls = list(app.config.get('WARMUP_URLS', ['/']))[:limit]
+    return warm_urls(app, urls, base_url)
+
+
+def warm_worker(app):
+    """
+    warms the process it runs in, before it takes traffic. every worker has
+    its own caches, so each one calls this once it has loaded the app (see
+    post_worker_init in gunicorn.conf.py).
+    """
+    if not app.config.get('WARMUP_ON_BOOT', True):
+        return
+    results, elapsed = warm_up(app)
+    app.logger.info(f'warmed {len(results)} urls in {elapsed:.2f}s',
+                    extra={"warmup": [[url, status, round(seconds * 1000, 1)] for url, status, seconds in results]})